@@ -0,0 +1,118 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+from config import ASK_MAX_IN_FLIGHT, ASK_MAX_QUEUE, ADMISSION_MAX_WAIT, ADMISSION_RETRY_AFTER_MAX, \
+    STAGE_LIMIT_LLM, STAGE_QUEUE_LLM, STAGE_LIMIT_EMBEDDING, STAGE_QUEUE_EMBEDDING, STAGE_LIMIT_RERANK, \
+    STAGE_QUEUE_RERANK, STAGE_LIMIT_VECTOR_SEARCH, STAGE_QUEUE_VECTOR_SEARCH
+from metrics import register_collector
+
+
+class OverloadedError(Exception):
+    def __init__(self, stage: str, retry_after: int, status_code: int):
+        super().__init__(f"Stage '{stage}' is overloaded, retry after {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class StageLimiter:
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float, status_code: int = 503):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.status_code = status_code
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queue_times: deque = deque(maxlen=1024)
+        self.hold_times: deque = deque(maxlen=1024)
+
+    def retry_after(self) -> int:
+        hold = sum(self.hold_times) / len(self.hold_times) if self.hold_times else 1.0
+        estimate = hold * (self.waiting + self.active) / self.concurrency
+        return max(1, min(ADMISSION_RETRY_AFTER_MAX, math.ceil(estimate)))
+
+    def reject(self):
+        self.rejected += 1
+        raise OverloadedError(self.name, self.retry_after(), self.status_code)
+
+    def check(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.reject()
+
+    async def acquire(self) -> float:
+        self.check()
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.reject()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        acquired = time.perf_counter()
+        self.queue_times.append(acquired - started)
+        return acquired
+
+    def release(self, acquired: float):
+        self.active -= 1
+        self.hold_times.append(time.perf_counter() - acquired)
+        self.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        acquired = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        queue_times = sorted(self.queue_times)
+        return {"concurrency": self.concurrency, "max_queue": self.max_queue, "active": self.active,
+                "waiting": self.waiting, "admitted": self.admitted, "rejected": self.rejected,
+                "queue_ms_avg": round(sum(queue_times) / len(queue_times) * 1000, 2) if queue_times else 0.0,
+                "queue_ms_p95": round(queue_times[int(len(queue_times) * 0.95)] * 1000, 2) if queue_times else 0.0,
+                "queue_ms_max": round(queue_times[-1] * 1000, 2) if queue_times else 0.0}
+
+
+ask_limiter = StageLimiter("ask", ASK_MAX_IN_FLIGHT, ASK_MAX_QUEUE, ADMISSION_MAX_WAIT, status_code=429)
+stage_limiters = {
+    "llm": StageLimiter("llm", STAGE_LIMIT_LLM, STAGE_QUEUE_LLM, ADMISSION_MAX_WAIT),
+    "embedding": StageLimiter("embedding", STAGE_LIMIT_EMBEDDING, STAGE_QUEUE_EMBEDDING, ADMISSION_MAX_WAIT),
+    "rerank": StageLimiter("rerank", STAGE_LIMIT_RERANK, STAGE_QUEUE_RERANK, ADMISSION_MAX_WAIT),
+    "vector_search": StageLimiter("vector_search", STAGE_LIMIT_VECTOR_SEARCH, STAGE_QUEUE_VECTOR_SEARCH,
+        ADMISSION_MAX_WAIT),
+}
+
+
+def limit(stage: str):
+    return stage_limiters[stage].slot()
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    return {"ask": ask_limiter.get_stats(), **{name: limiter.get_stats() for name, limiter in stage_limiters.items()}}
+
+
+def collect_admission_metrics():
+    limiters = [ask_limiter, *stage_limiters.values()]
+    return [("admission_active", "gauge", "Requests holding a stage slot",
+             [({"stage": limiter.name}, limiter.active) for limiter in limiters]),
+            ("admission_waiting", "gauge", "Requests queued for a stage slot",
+             [({"stage": limiter.name}, limiter.waiting) for limiter in limiters]),
+            ("admission_rejected_total", "counter", "Requests rejected by stage limiters",
+             [({"stage": limiter.name}, limiter.rejected) for limiter in limiters])]
+
+
+register_collector(collect_admission_metrics)
@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+
+from config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_PATH, ANSWER_CACHE_SIMILARITY_THRESHOLD, \
+    ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES
+from executors import io_executor
+
+
+class AnswerCache:
+    def __init__(self, path: str, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "embedding BLOB NOT NULL, answer TEXT NOT NULL, metrics TEXT NOT NULL, "
+                          "created_at REAL NOT NULL, last_hit REAL NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS answer_documents (answer_id INTEGER NOT NULL, "
+                          "document_id TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answer_documents_document_id "
+                          "ON answer_documents (document_id)")
+        self.conn.commit()
+
+        self.ids: List[int] = []
+        self.created: List[float] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.load()
+
+    def load(self):
+        self.delete_expired()
+        rows = self.conn.execute("SELECT id, embedding, created_at FROM answers ORDER BY id").fetchall()
+        self.ids = [row[0] for row in rows]
+        self.created = [row[2] for row in rows]
+        self.matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else \
+            np.zeros((0, 0), dtype=np.float32)
+
+    def delete_ids(self, answer_ids: List[int]):
+        if not answer_ids:
+            return
+        placeholders = ",".join("?" * len(answer_ids))
+        self.conn.execute(f"DELETE FROM answers WHERE id IN ({placeholders})", answer_ids)
+        self.conn.execute(f"DELETE FROM answer_documents WHERE answer_id IN ({placeholders})", answer_ids)
+        self.conn.commit()
+
+        removed = set(answer_ids)
+        keep = [i for i, answer_id in enumerate(self.ids) if answer_id not in removed]
+        self.ids = [self.ids[i] for i in keep]
+        self.created = [self.created[i] for i in keep]
+        self.matrix = self.matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+
+    def delete_expired(self):
+        expire_before = time.time() - self.ttl_seconds
+        expired = [row[0] for row in self.conn.execute("SELECT id FROM answers WHERE created_at < ?",
+            (expire_before,)).fetchall()]
+        self.delete_ids(expired)
+
+    @staticmethod
+    def normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if not self.ids:
+                self.misses += 1
+                return None
+
+            similarities = self.matrix @ self.normalize(embedding)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold or self.created[best] < time.time() - self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            answer_id = self.ids[best]
+            row = self.conn.execute("SELECT answer, metrics FROM answers WHERE id = ?", (answer_id,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE answers SET last_hit = ? WHERE id = ?", (time.time(), answer_id))
+            self.conn.commit()
+            self.hits += 1
+            return {"answer": row[0], "metrics": json.loads(row[1]), "similarity": round(similarity, 4)}
+
+    def store(self, embedding: List[float], answer: str, metrics: Dict[str, Any], document_ids: List[str]):
+        with self.lock:
+            now = time.time()
+            vector = self.normalize(embedding)
+            cursor = self.conn.execute("INSERT INTO answers (embedding, answer, metrics, created_at, last_hit) "
+                                       "VALUES (?, ?, ?, ?, ?)",
+                (vector.tobytes(), answer, json.dumps(metrics, ensure_ascii=False, default=str), now, now))
+            answer_id = cursor.lastrowid
+            self.conn.executemany("INSERT INTO answer_documents (answer_id, document_id) VALUES (?, ?)",
+                [(answer_id, document_id) for document_id in set(document_ids)])
+            self.conn.commit()
+
+            self.ids.append(answer_id)
+            self.created.append(now)
+            self.matrix = np.vstack([self.matrix, vector]) if self.matrix.size else vector.reshape(1, -1)
+
+            self.delete_expired()
+            overflow = len(self.ids) - self.max_entries
+            if overflow > 0:
+                stale = [row[0] for row in self.conn.execute("SELECT id FROM answers ORDER BY last_hit LIMIT ?",
+                    (overflow,)).fetchall()]
+                self.delete_ids(stale)
+
+    def invalidate_documents(self, document_ids: List[str]) -> int:
+        with self.lock:
+            placeholders = ",".join("?" * len(document_ids))
+            answer_ids = [row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT answer_id FROM answer_documents WHERE document_id IN ({placeholders})",
+                list(document_ids)).fetchall()]
+            self.delete_ids(answer_ids)
+            return len(answer_ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.ids),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+answer_cache: Optional[AnswerCache] = None
+
+
+async def initialize_answer_cache():
+    global answer_cache
+
+    if not ANSWER_CACHE_ENABLED:
+        return True
+    try:
+        answer_cache = await io_executor.run(AnswerCache, ANSWER_CACHE_PATH, ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES)
+        return True
+    except Exception as e:
+        print(f"Error initializing answer cache: {e}")
+        return False
+
+
+async def close_answer_cache():
+    global answer_cache
+
+    if answer_cache is not None:
+        await io_executor.run(answer_cache.close)
+        answer_cache = None
+
+
+async def lookup_cached_answer(embedding: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+    if answer_cache is None or not embedding:
+        return None
+    try:
+        return await io_executor.run(answer_cache.lookup, embedding)
+    except Exception as e:
+        print(f"Error looking up answer cache: {e}")
+        return None
+
+
+async def store_cached_answer(embedding: Optional[List[float]], answer: str, metrics: Dict[str, Any],
+        document_ids: List[str]):
+    if answer_cache is None or not embedding or not document_ids:
+        return
+    try:
+        await io_executor.run(answer_cache.store, embedding, answer, metrics, document_ids)
+    except Exception as e:
+        print(f"Error storing answer in cache: {e}")
+
+
+async def invalidate_cached_answers(document_ids: List[str]) -> int:
+    if answer_cache is None or not document_ids:
+        return 0
+    try:
+        return await io_executor.run(answer_cache.invalidate_documents, document_ids)
+    except Exception as e:
+        print(f"Error invalidating answer cache: {e}")
+        return 0
+
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    return answer_cache.get_stats() if answer_cache is not None else {}
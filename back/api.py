@@ -1,15 +1,51 @@
+import json
 import os
-from typing import Dict, Any
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Path
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 
-from database import list_knowledge_base_documents, clear_user_history, get_chat_history_with_metrics
-from document_processing import process_document
-from rag import ask_question_rag
-
-app = FastAPI(title="RAG API", description="API для RAG системы", version="1.0.0")
+from admission import OverloadedError, ask_limiter, get_admission_stats
+from answer_cache import close_answer_cache, get_answer_cache_stats
+from config import UPLOAD_FOLDER, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from conversation import forget_history, stop_conversation_writer, get_conversation_stats
+from database import close_database, list_knowledge_base_documents, clear_user_history, iter_chat_history, \
+    decode_history_cursor
+from embeddings import close_models, get_embedding_cache_stats, get_micro_batcher_stats
+from executors import io_executor, shutdown_executors, get_executor_stats
+from history_view import render_history_html, render_history_json
+from http_client import close_http_clients, get_http_client_stats
+from ingestion import delete_document
+from metrics import render_metrics
+from jobs import start_ingestion_workers, stop_ingestion_workers, submit_ingestion_job, get_job
+from models import JobStatusResponse, DeleteResponse
+from rag import ask_question_rag, ask_question_rag_stream
+from startup import start_services, cancel_startup, is_ready, get_readiness
+from utils import allowed_file
+from vector_store import close_vector_store, get_vector_store_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_services()
+    await start_ingestion_workers()
+    yield
+    await cancel_startup()
+    await stop_ingestion_workers()
+    await close_answer_cache()
+    await close_models()
+    await close_http_clients()
+    await close_vector_store()
+    await stop_conversation_writer()
+    await close_database()
+    shutdown_executors()
+
+
+app = FastAPI(title="RAG API", description="API для RAG системы", version="1.0.0", lifespan=lifespan)
 
 
 class QuestionRequest(BaseModel):
@@ -22,24 +58,77 @@ class QuestionResponse(BaseModel):
     metrics: Dict[str, Any] = Field(...)
 
 
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request, exc: OverloadedError):
+    return JSONResponse(status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)},
+        content={"detail": "Сервис перегружен, повторите запрос позже", "stage": exc.stage,
+                 "retry_after": exc.retry_after})
+
+
+def ensure_ready():
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Сервис запускается, повторите запрос позже",
+            headers={"Retry-After": "5"})
+
+
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
-    answer, metrics = await ask_question_rag(request.user_id, request.question)
+    ensure_ready()
+    async with ask_limiter.slot():
+        answer, metrics = await ask_question_rag(request.user_id, request.question)
     return QuestionResponse(answer=answer, metrics=metrics)
 
 
-@app.post("/upload")
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    ensure_ready()
+    ask_limiter.check()
+
+    async def event_lines():
+        try:
+            async with ask_limiter.slot():
+                async for event in ask_question_rag_stream(request.user_id, request.question):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+        except OverloadedError as e:
+            yield json.dumps({"type": "busy", "stage": e.stage, "retry_after": e.retry_after}) + "\n"
+
+    return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+
+
+async def save_upload(file: UploadFile, file_path: str):
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    buffer = await io_executor.run(open, file_path, "wb")
+    try:
+        while content := await file.read(1024 * 1024):
+            await io_executor.run(buffer.write, content)
+    except BaseException:
+        await io_executor.run(buffer.close)
+        os.remove(file_path)
+        raise
+    await io_executor.run(buffer.close)
+
+
+@app.post("/upload", status_code=202)
 async def upload_document(file: UploadFile = File(...)):
-    file_path = f"uploads_telegram/{file.filename}"
-    os.makedirs("uploads_telegram", exist_ok=True)
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    chunks = await process_document(file_path, file.filename)
-    os.remove(file_path)
-    if not chunks:
-        raise HTTPException(status_code=400, detail="Ошибка обработки файла")
-    return {"success": True, "chunks": len(chunks)}
+    ensure_ready()
+    if not file.filename or not allowed_file(file.filename):
+        raise HTTPException(status_code=400,
+                            detail=f"Тип файла не разрешен: {file.filename}. Поддерживаются файлы txt, pdf и docx.")
+    file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
+    await save_upload(file, file_path)
+    job = submit_ingestion_job(file_path, file.filename)
+    if job is None:
+        os.remove(file_path)
+        raise HTTPException(status_code=503, detail="Очередь обработки документов переполнена")
+    return {"success": True, "job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str = Path(...)):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return JobStatusResponse(**job.to_dict())
 
 
 @app.get("/documents")
@@ -48,8 +137,15 @@ async def get_documents():
     return {"documents": documents}
 
 
+@app.delete("/documents/{doc_id_or_filename}", response_model=DeleteResponse)
+async def delete_knowledge_base_document(doc_id_or_filename: str = Path(...)):
+    success, message = await delete_document(doc_id_or_filename)
+    return DeleteResponse(success=success, message=message)
+
+
 @app.delete("/history/{user_id}")
 async def clear_history(user_id: int = Path(...)):
+    await forget_history(user_id)
     success, message = await clear_user_history(user_id)
     if not success:
         raise HTTPException(status_code=400, detail=message)
@@ -57,17 +153,39 @@ async def clear_history(user_id: int = Path(...)):
 
 
 @app.get("/history")
-async def view_chat_history():
-    chats = await get_chat_history_with_metrics()
-    html = "<html><body><h1>История чатов</h1>"
-    for chat in chats:
-        html += f"<h2>Пользователь {chat['user_id']}</h2>"
-        for msg in chat['messages']:
-            html += f"<div><b>{msg['role']}:</b> {msg['content']}</div>"
-    html += "</body></html>"
-    return HTMLResponse(content=html)
+async def view_chat_history(cursor: Optional[str] = Query(None),
+        limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE), user_id: Optional[int] = Query(None),
+        start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None),
+        format: str = Query("html", pattern="^(html|json)$")):
+    if cursor and decode_history_cursor(cursor) is None:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы.")
+
+    messages = iter_chat_history(cursor, limit, user_id, start, end)
+    if format == "json":
+        return StreamingResponse(render_history_json(messages, limit), media_type="application/json")
+    params = {"limit": limit, "user_id": user_id, "start": start, "end": end}
+    return StreamingResponse(render_history_html(messages, limit, params), media_type="text/html; charset=utf-8")
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"embedding_cache": get_embedding_cache_stats(), "micro_batching": get_micro_batcher_stats(),
+            "llm_http": get_http_client_stats(), "answer_cache": get_answer_cache_stats(),
+            "conversation": get_conversation_stats(), "vector_store": get_vector_store_stats(),
+            "admission": get_admission_stats(), "executors": get_executor_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    return JSONResponse(status_code=200 if is_ready() else 503, content=get_readiness())
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME
+from inference_backend import ensure_artifact, export_embedding_model, export_reranker_model, OnnxEmbeddingModel, \
+    OnnxCrossEncoder
+
+DEFAULT_TEXTS = ["Сколько дней ежегодного оплачиваемого отпуска положено сотруднику?",
+                 "Как оформить возврат товара без чека?",
+                 "Порядок открытия смены на кассе и проверка наличных в денежном ящике.",
+                 "Какие документы нужны для оформления больничного листа?",
+                 "Раздел 4.2 регламента: правила выкладки товара на витрине.",
+                 "Что делать, если покупатель требует обмен товара надлежащего качества?",
+                 "График работы розничных точек в праздничные дни.",
+                 "Как рассчитывается премия продавца по итогам месяца?"]
+
+
+def load_texts(path: str) -> list:
+    if not path:
+        return DEFAULT_TEXTS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def measure(fn, items: list, batch_size: int, repeats: int) -> dict:
+    fn(items[:1])
+    single_latencies = []
+    for item in items[:repeats]:
+        started = time.perf_counter()
+        fn([item])
+        single_latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, len(items), batch_size):
+        fn(items[start:start + batch_size])
+    elapsed = time.perf_counter() - started
+
+    return {"latency_p50_ms": round(statistics.median(single_latencies) * 1000, 2),
+            "latency_max_ms": round(max(single_latencies) * 1000, 2),
+            "throughput_items_per_s": round(len(items) / elapsed, 2)}
+
+
+def cosine_drift(baseline: np.ndarray, candidate: np.ndarray) -> dict:
+    baseline = baseline / np.linalg.norm(baseline, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(baseline * candidate, axis=1)
+    return {"cosine_mean": round(float(cosines.mean()), 6), "cosine_min": round(float(cosines.min()), 6)}
+
+
+def score_drift(baseline: np.ndarray, candidate: np.ndarray) -> dict:
+    return {"max_abs_score_diff": round(float(np.max(np.abs(baseline - candidate))), 6),
+            "top1_agreement": bool(np.argmax(baseline) == np.argmax(candidate))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PyTorch and ONNX Runtime inference backends")
+    parser.add_argument('--texts', help="File with one text per line (defaults to built-in samples)")
+    parser.add_argument('--copies', type=int, default=16, help="Repeat the sample set to get a stable throughput")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=20, help="Number of single-item latency measurements")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+
+    texts = load_texts(args.texts) * args.copies
+    query = texts[0]
+    pairs = [[query, text] for text in texts]
+    results = {"embedding": {}, "reranker": {}, "items": len(texts)}
+
+    torch_embedder = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+    torch_reranker = CrossEncoder(RERANKER_MODEL_NAME, device='cpu')
+    baseline_vectors = torch_embedder.encode(texts, batch_size=args.batch_size)
+    baseline_scores = torch_reranker.predict(pairs, batch_size=args.batch_size)
+    results["embedding"]["torch"] = measure(lambda batch: torch_embedder.encode(batch, batch_size=args.batch_size),
+        texts, args.batch_size, args.repeats)
+    results["reranker"]["torch"] = measure(lambda batch: torch_reranker.predict(batch, batch_size=args.batch_size),
+        pairs, args.batch_size, args.repeats)
+
+    for quantize in (False, True):
+        name = 'onnx-int8' if quantize else 'onnx'
+        embedder = OnnxEmbeddingModel(ensure_artifact(EMBEDDING_MODEL_NAME, 'embedding',
+            lambda path: export_embedding_model(EMBEDDING_MODEL_NAME, path), quantize=quantize))
+        reranker = OnnxCrossEncoder(ensure_artifact(RERANKER_MODEL_NAME, 'reranker',
+            lambda path: export_reranker_model(RERANKER_MODEL_NAME, path), quantize=quantize))
+
+        results["embedding"][name] = measure(lambda batch: embedder.encode(batch, batch_size=args.batch_size),
+            texts, args.batch_size, args.repeats)
+        results["embedding"][name].update(cosine_drift(baseline_vectors,
+            embedder.encode(texts, batch_size=args.batch_size)))
+        results["reranker"][name] = measure(lambda batch: reranker.predict(batch, batch_size=args.batch_size),
+            pairs, args.batch_size, args.repeats)
+        results["reranker"][name].update(score_drift(baseline_scores,
+            reranker.predict(pairs, batch_size=args.batch_size)))
+
+    for model_kind in ("embedding", "reranker"):
+        print(f"\n=== {model_kind} ===")
+        for backend, metrics in results[model_kind].items():
+            print(f"{backend:10} " + "  ".join(f"{key}={value}" for key, value in metrics.items()))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ANSWER_WORDS = ["Согласно", "регламенту", "сотрудник", "обязан", "оформить", "заявление", "в", "отделе", "кадров",
+                "не", "позднее", "чем", "за", "две", "недели", "до", "начала", "отпуска."]
+
+
+def answer_tokens(count: int) -> list:
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+
+def reply_for(prompt: str, max_tokens: int) -> list:
+    if "question classification" in prompt:
+        return ["Lookup"]
+    if "Effective search query:" in prompt:
+        question = prompt.split('User question: "', 1)[-1].rsplit('"', 1)[0]
+        return [f"{question} регламент порядок"]
+    return answer_tokens(max_tokens)
+
+
+def create_app(latency: float, tokens_per_second: float, max_answer_tokens: int) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+    stats = {"requests": 0, "stream_requests": 0, "in_flight": 0, "max_in_flight": 0}
+    token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def completion(content: str, model: str, delta: bool) -> dict:
+        body = {"delta": {"content": content}} if delta else {"message": {"role": "assistant", "content": content}}
+        return {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk" if delta else "chat.completion",
+                "created": int(time.time()), "model": model, "choices": [{"index": 0, "finish_reason": None if delta else "stop", **body}]}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", **stats}
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        prompt = "\n".join(message.get("content", "") for message in payload.get("messages", []))
+        tokens = reply_for(prompt, min(max_answer_tokens, int(payload.get("max_tokens", max_answer_tokens))))
+        model = payload.get("model") or "fake-llm"
+        stats["requests"] += 1
+
+        if not payload.get("stream"):
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                await asyncio.sleep(latency + token_delay * len(tokens))
+            finally:
+                stats["in_flight"] -= 1
+            return completion("".join(tokens).strip(), model, delta=False)
+
+        stats["stream_requests"] += 1
+
+        async def events():
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                await asyncio.sleep(latency)
+                for token in tokens:
+                    yield f"data: {json.dumps(completion(token, model, delta=True), ensure_ascii=False)}\n\n"
+                    if token_delay:
+                        await asyncio.sleep(token_delay)
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible chat completions server with synthetic latency")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help="0 returns all tokens at once")
+    parser.add_argument('--answer-tokens', type=int, default=120, help="Tokens in a generated answer")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency, args.tokens_per_second, args.answer_tokens), host=args.host, port=args.port,
+        log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
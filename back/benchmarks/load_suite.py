@@ -0,0 +1,453 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+SCENARIOS = ("ingest", "rag", "rag_stream", "api")
+
+DEFAULT_QUESTIONS = ["Сколько дней ежегодного оплачиваемого отпуска положено сотруднику?",
+                     "Как оформить возврат товара без чека?",
+                     "Как открыть смену на кассе?",
+                     "Какие документы нужны для оформления больничного листа?",
+                     "Какие правила выкладки товара на витрине?",
+                     "Что делать, если покупатель требует обмен товара надлежащего качества?",
+                     "Какой график работы розничных точек в праздничные дни?",
+                     "Как рассчитывается премия продавца по итогам месяца?"]
+
+DOCUMENT_SENTENCES = ["Сотрудник имеет право на ежегодный оплачиваемый отпуск продолжительностью {n} календарных дней.",
+                      "Возврат товара без чека оформляется по заявлению покупателя в течение {n} дней.",
+                      "Перед открытием смены кассир пересчитывает наличные в денежном ящике и сверяет их с отчетом.",
+                      "Для оформления больничного листа сотрудник передает в отдел кадров его номер в течение {n} дней.",
+                      "Товар на витрине выкладывается по принципу ротации: более ранние партии ставятся вперед.",
+                      "Обмен товара надлежащего качества возможен в течение {n} дней, если сохранен товарный вид.",
+                      "В праздничные дни розничные точки работают с 10:00 до {n}:00 по согласованию с директором.",
+                      "Премия продавца составляет {n} процентов от выполнения плана продаж за месяц."]
+
+
+def check_prerequisites(args):
+    required = ["sentence_transformers", "huggingface_hub"]
+    if not args.mongo_uri:
+        required.append("mongomock_motor")
+    if args.inference_backend == 'onnx':
+        required.append("onnxruntime")
+    missing = [module for module in required if importlib.util.find_spec(module) is None]
+    if missing:
+        raise SystemExit(f"Missing Python packages: {', '.join(missing)}. "
+                         f"Install them with 'pip install -r requirements-dev.txt' from the back/ directory")
+
+    from huggingface_hub import snapshot_download
+
+    for model in (args.embedding_model, args.reranker_model):
+        if os.path.isdir(model):
+            continue
+        try:
+            snapshot_download(model, local_files_only=not args.download_models)
+        except Exception as e:
+            if args.download_models:
+                raise SystemExit(f"Could not download model '{model}': {e}")
+            raise SystemExit(f"Model '{model}' is not in the Hugging Face cache. Rerun with --download-models "
+                             f"or fetch it with 'huggingface-cli download {model}'")
+
+
+def configure_environment(args, work_dir: str, llm_base: str):
+    os.environ.update({
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(work_dir, "vector_index"),
+        "QDRANT_COLLECTION_NAME": "benchmark",
+        "VECTOR_SIZE": str(args.vector_size),
+        "EMBEDDING_MODEL_NAME": args.embedding_model,
+        "RERANKER_MODEL_NAME": args.reranker_model,
+        "INFERENCE_BACKEND": args.inference_backend,
+        "EMBEDDING_CACHE_DIR": os.path.join(work_dir, "embedding_cache"),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "ANSWER_CACHE_PATH": os.path.join(work_dir, "answer_cache.sqlite3"),
+        "OPENAI_API_BASE": llm_base,
+        "OPENAI_MODEL_NAME": "fake-llm",
+    })
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_llm(args, port: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, os.path.join(BENCHMARK_DIR, "fake_llm_server.py"), "--port", str(port),
+                                "--latency", str(args.llm_latency), "--tokens-per-second", str(args.llm_tokens_per_second),
+                                "--answer-tokens", str(args.llm_answer_tokens)])
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Fake LLM server did not start")
+
+
+def write_documents(directory: str, documents: int, paragraphs: int, seed: int) -> list:
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        text = "\n\n".join(f"Раздел {i + 1}.{p + 1}. " + " ".join(
+            sentence.format(n=rng.randint(2, 60)) for sentence in rng.sample(DOCUMENT_SENTENCES, 4))
+            for p in range(paragraphs))
+        path = os.path.join(directory, f"regulation_{i + 1:03d}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def load_questions(path: str) -> list:
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentiles(seconds: list) -> dict:
+    if not seconds:
+        return {"count": 0}
+    ordered = sorted(seconds)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+def stage_percentiles(stage_timings: list) -> dict:
+    stages = {}
+    for timings in stage_timings:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: percentiles(values) for stage, values in sorted(stages.items())}
+
+
+def histogram_percentiles(histogram) -> dict:
+    stages = {}
+    bounds = histogram.buckets + (float('inf'),)
+    with histogram.lock:
+        snapshot = {key: list(counts) for key, counts in histogram.counts.items()}
+    for key, counts in sorted(snapshot.items()):
+        total = counts[-1]
+
+        def estimate(q: float) -> float:
+            rank = q * total
+            lower, previous = 0.0, 0
+            for bound, count in zip(bounds, counts):
+                if count >= rank:
+                    if bound == float('inf'):
+                        return round(lower * 1000, 2)
+                    share = (rank - previous) / (count - previous) if count > previous else 1.0
+                    return round((lower + (bound - lower) * share) * 1000, 2)
+                lower, previous = bound, count
+            return round(lower * 1000, 2)
+
+        stages[key[0]] = {"count": total, "p50_ms": estimate(0.5), "p95_ms": estimate(0.95),
+                          "p99_ms": estimate(0.99), "avg_ms": round(histogram.sums[key] / total * 1000, 2)}
+    return stages
+
+
+def cumulative_peak_rss_mb() -> dict:
+    # ru_maxrss only grows over the process lifetime, so later scenarios include the peaks of earlier ones.
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+
+def current_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def sample_peak_rss(peak: dict, interval: float = 0.05):
+    while True:
+        rss = current_rss_mb()
+        if rss is not None:
+            peak["mb"] = max(peak.get("mb", 0.0), rss)
+        await asyncio.sleep(interval)
+
+
+async def run_load(call, items: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outputs, errors = [], [], []
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                outputs.append(await call(item))
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "latencies": latencies, "outputs": outputs, "errors": errors}
+
+
+def summarize(load: dict, items: int) -> dict:
+    return {"requests": items, "errors": len(load["errors"]), "elapsed_s": round(load["elapsed"], 3),
+            "throughput_per_s": round(len(load["latencies"]) / load["elapsed"], 2) if load["elapsed"] else 0.0,
+            "latency": percentiles(load["latencies"]), "error_samples": load["errors"][:5]}
+
+
+async def ingest_scenario(args, work_dir: str) -> dict:
+    from ingestion import ingest_document
+    from metrics import ingestion_stage_seconds
+
+    paths = write_documents(os.path.join(work_dir, "documents"), args.documents, args.paragraphs, args.seed)
+    load = await run_load(lambda path: ingest_document(path, os.path.basename(path)), paths,
+        args.ingest_concurrency)
+    results = [result for result in load["outputs"] if result is not None]
+    chunks = sum(result["chunks"] for result in results)
+    summary = summarize(load, len(paths))
+    summary.update({"documents_ingested": len(results), "chunks": chunks,
+                    "chunks_per_s": round(chunks / load["elapsed"], 2) if load["elapsed"] else 0.0,
+                    "stages": histogram_percentiles(ingestion_stage_seconds)})
+    return summary
+
+
+async def rag_scenario(args, questions: list) -> dict:
+    from rag import ask_question_rag
+
+    async def ask(i: int):
+        answer, metadata = await ask_question_rag(args.user_base + i % args.users, questions[i % len(questions)])
+        return metadata
+
+    load = await run_load(ask, list(range(args.requests)), args.concurrency)
+    summary = summarize(load, args.requests)
+    summary.update({"cache_hits": sum(1 for metadata in load["outputs"] if metadata.get("cache_hit")),
+                    "stages": stage_percentiles([metadata.get("stage_timings", {}) for metadata in load["outputs"]])})
+    return summary
+
+
+async def rag_stream_scenario(args, questions: list) -> dict:
+    from rag import ask_question_rag_stream
+
+    async def ask(i: int):
+        started = time.perf_counter()
+        first_token = None
+        metrics = {}
+        async for event in ask_question_rag_stream(args.user_base + i % args.users, questions[i % len(questions)]):
+            if event["type"] == "delta" and first_token is None:
+                first_token = time.perf_counter() - started
+            elif event["type"] == "done":
+                metrics = event["metrics"]
+        return first_token, metrics
+
+    load = await run_load(ask, list(range(args.requests)), args.concurrency)
+    summary = summarize(load, args.requests)
+    summary.update({"time_to_first_token": percentiles([ttft for ttft, _ in load["outputs"] if ttft is not None]),
+                    "stages": stage_percentiles([metrics.get("stage_timings", {}) for _, metrics in load["outputs"]])})
+    return summary
+
+
+async def api_scenario(args, questions: list) -> dict:
+    from api import app
+
+    status_codes = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def ask(i: int):
+            response = await client.post("/ask", json={"user_id": args.user_base + i % args.users,
+                                                       "question": questions[i % len(questions)]})
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            response.raise_for_status()
+            return response.json()["metrics"]
+
+        load = await run_load(ask, list(range(args.requests)), args.concurrency)
+        metrics_text = (await client.get("/metrics")).text
+
+    summary = summarize(load, args.requests)
+    summary.update({"status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+                    "stages": stage_percentiles([metrics.get("stage_timings", {}) for metrics in load["outputs"]]),
+                    "metrics_lines": len(metrics_text.splitlines())})
+    return summary
+
+
+async def initialize_backend(args) -> dict:
+    from answer_cache import initialize_answer_cache
+    from database import initialize_database
+    from http_client import initialize_http_clients
+    from startup import initialize_dependency, initialize_models_with_warm_up, dependency_status, REQUIRED_DEPENDENCIES
+    from vector_store import initialize_vector_store
+
+    if args.mongo_uri:
+        mongo = initialize_database
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        mongo_client = AsyncMongoMockClient()
+        mongo = lambda: initialize_database(mongo_client)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        initialize_dependency("mongo", mongo),
+        initialize_dependency("vector_store", initialize_vector_store),
+        initialize_dependency("models", initialize_models_with_warm_up),
+        initialize_dependency("llm_http", initialize_http_clients),
+        initialize_dependency("answer_cache", initialize_answer_cache))
+    failed = [name for name in REQUIRED_DEPENDENCIES if not dependency_status.get(name, {}).get("ready")]
+    if failed:
+        raise RuntimeError(f"Dependencies failed to start: {', '.join(failed)} ({dependency_status})")
+    return {"seconds": round(time.perf_counter() - started, 3), "dependencies": dict(dependency_status)}
+
+
+async def shutdown_backend():
+    from answer_cache import close_answer_cache
+    from conversation import stop_conversation_writer
+    from database import close_database
+    from embeddings import close_models
+    from executors import shutdown_executors
+    from http_client import close_http_clients
+    from vector_store import close_vector_store
+
+    await close_answer_cache()
+    await close_models()
+    await close_http_clients()
+    await close_vector_store()
+    await stop_conversation_writer()
+    await close_database()
+    shutdown_executors()
+
+
+async def run_suite(args, work_dir: str) -> dict:
+    questions = load_questions(args.questions)
+    results = {"startup": await initialize_backend(args)}
+    runners = {"ingest": lambda: ingest_scenario(args, work_dir), "rag": lambda: rag_scenario(args, questions),
+               "rag_stream": lambda: rag_stream_scenario(args, questions), "api": lambda: api_scenario(args, questions)}
+    try:
+        for scenario in args.scenarios:
+            print(f"Running scenario '{scenario}'...")
+            peak: dict = {}
+            sampler = asyncio.create_task(sample_peak_rss(peak))
+            try:
+                results[scenario] = await runners[scenario]()
+            finally:
+                sampler.cancel()
+            results[scenario]["scenario_peak_rss_mb"] = round(peak["mb"], 1) if "mb" in peak else None
+            results[scenario]["cumulative_peak_rss_mb"] = cumulative_peak_rss_mb()
+    finally:
+        await shutdown_backend()
+    return results
+
+
+def git_revision() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=BENCHMARK_DIR, capture_output=True, text=True,
+                check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--", ".."))}
+
+
+def compare_with_baseline(results: dict, baseline: dict) -> dict:
+    changes = {}
+    for scenario in SCENARIOS:
+        current, previous = results.get(scenario), baseline.get("results", {}).get(scenario)
+        if not current or not previous:
+            continue
+        scenario_changes = {}
+        for metric, path in (("throughput_per_s", ("throughput_per_s",)), ("p95_ms", ("latency", "p95_ms")),
+                             ("p99_ms", ("latency", "p99_ms"))):
+            now, before = current, previous
+            for key in path:
+                now, before = (now or {}).get(key), (before or {}).get(key)
+            if now is not None and before:
+                scenario_changes[metric] = {"baseline": before, "current": now,
+                                            "change_pct": round((now - before) / before * 100, 1)}
+        changes[scenario] = scenario_changes
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for ingestion, RAG and /ask with a fake LLM, "
+                                                 "the local vector store and mongomock")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=64, help="Questions per RAG scenario")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent questions")
+    parser.add_argument('--users', type=int, default=16, help="Distinct user ids the questions are spread over")
+    parser.add_argument('--user-base', type=int, default=900000000)
+    parser.add_argument('--questions', help="File with one question per line (defaults to built-in samples)")
+    parser.add_argument('--documents', type=int, default=20, help="Synthetic documents to ingest")
+    parser.add_argument('--paragraphs', type=int, default=40, help="Paragraphs per synthetic document")
+    parser.add_argument('--ingest-concurrency', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument('--llm-tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--llm-answer-tokens', type=int, default=120)
+    parser.add_argument('--embedding-model', default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument('--reranker-model', default=DEFAULT_RERANKER_MODEL)
+    parser.add_argument('--vector-size', type=int, default=384, help="Dimension of --embedding-model")
+    parser.add_argument('--inference-backend', choices=['torch', 'onnx'], default='torch')
+    parser.add_argument('--download-models', action='store_true',
+        help="Download missing models instead of failing when they are not in the Hugging Face cache")
+    parser.add_argument('--answer-cache', action='store_true', help="Keep the semantic answer cache enabled")
+    parser.add_argument('--mongo-uri', help="Scratch mongod to use instead of mongomock (the benchmark writes to it)")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary working directory")
+    args = parser.parse_args()
+    check_prerequisites(args)
+
+    work_dir = tempfile.mkdtemp(prefix="rag_benchmark_")
+    port = free_port()
+    configure_environment(args, work_dir, f"http://127.0.0.1:{port}/v1")
+    llm_process = start_fake_llm(args, port)
+    try:
+        results = asyncio.run(run_suite(args, work_dir))
+    finally:
+        llm_process.terminate()
+        llm_process.wait()
+        if args.keep:
+            print(f"Working directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"timestamp": datetime.now(timezone.utc).isoformat(), "git": git_revision(),
+              "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+              "results": results}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report["baseline_comparison"] = compare_with_baseline(results, json.load(f))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
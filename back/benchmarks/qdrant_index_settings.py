@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, SearchRequest, SearchParams, QuantizationSearchParams
+
+from config import QDRANT_HOST, QDRANT_PORT, QDRANT_GRPC_PORT, QDRANT_PREFER_GRPC, QDRANT_COLLECTION_NAME, \
+    QDRANT_VECTORS_ON_DISK, VECTOR_SIZE
+from vector_store import collection_config, search_params
+
+
+def load_vectors(client: QdrantClient, args) -> np.ndarray:
+    if args.from_collection:
+        vectors, offset = [], None
+        while len(vectors) < args.points:
+            records, offset = client.scroll(collection_name=QDRANT_COLLECTION_NAME, limit=256, offset=offset,
+                with_payload=False, with_vectors=True)
+            vectors.extend(record.vector.get("") if isinstance(record.vector, dict) else record.vector
+                           for record in records)
+            if offset is None:
+                break
+        return np.asarray(vectors[:args.points], dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, args.points // 200), args.dim))
+    vectors = centers[rng.integers(0, len(centers), args.points)] + rng.normal(scale=0.3, size=(args.points, args.dim))
+    return vectors.astype(np.float32)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    sample = vectors[rng.integers(0, len(vectors), count)]
+    return (sample + rng.normal(scale=0.05 * float(np.abs(sample).mean()), size=sample.shape)).astype(np.float32)
+
+
+def wait_until_indexed(client: QdrantClient, name: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get_collection(collection_name=name)
+        if info.status == "green" and (info.indexed_vectors_count or 0) >= (info.vectors_count or 0) * 0.99:
+            return
+        time.sleep(1)
+    print(f"Collection '{name}' was not fully indexed after {timeout}s, results may be optimistic")
+
+
+def server_memory_mb() -> Optional[float]:
+    try:
+        response = httpx.get(f"http://{QDRANT_HOST}:{QDRANT_PORT}/metrics", timeout=10)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    for line in response.text.splitlines():
+        if line.startswith("memory_resident_bytes "):
+            return round(float(line.split()[1]) / 1024 / 1024, 2)
+    return None
+
+
+def estimate_ram_mb(points: int, dim: int, quantization: str, m: int) -> float:
+    # A formula for vectors, quantized codes and HNSW links only, reported next to the measured server RSS.
+    originals = 0 if QDRANT_VECTORS_ON_DISK and quantization != 'none' else points * dim * 4
+    quantized = {'none': 0, 'scalar': points * dim, 'binary': points * dim / 8}[quantization]
+    graph_links = points * m * 2 * 4
+    return round((originals + quantized + graph_links) / 1024 / 1024, 2)
+
+
+def run_queries(client: QdrantClient, name: str, queries: np.ndarray, k: int, params: SearchParams,
+        batch_size: int) -> tuple:
+    latencies = []
+    for query in queries[:min(len(queries), 100)]:
+        started = time.perf_counter()
+        client.search(collection_name=name, query_vector=query.tolist(), limit=k, search_params=params)
+        latencies.append(time.perf_counter() - started)
+
+    results = []
+    started = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        results.extend(client.search_batch(collection_name=name, requests=[
+            SearchRequest(vector=query.tolist(), limit=k, params=params) for query in queries[start:start + batch_size]]))
+    elapsed = time.perf_counter() - started
+    return results, latencies, len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k, latency, QPS and RAM of Qdrant quantization and "
+                                                 "HNSW settings. RAM is the growth of the server's resident memory "
+                                                 "from its /metrics endpoint while a setting is built and queried, "
+                                                 "plus a formula estimate; run one quantization per invocation for "
+                                                 "the cleanest RSS numbers")
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=VECTOR_SIZE)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--quantization', default='none,scalar,binary')
+    parser.add_argument('--hnsw-m', type=int, default=16)
+    parser.add_argument('--ef-construct', type=int, default=100)
+    parser.add_argument('--hnsw-ef', default='32,64,128,256')
+    parser.add_argument('--batch-size', type=int, default=32, help="Queries per search_batch call when measuring QPS")
+    parser.add_argument('--from-collection', action='store_true',
+        help=f"Sample vectors from '{QDRANT_COLLECTION_NAME}' instead of synthetic clustered vectors")
+    parser.add_argument('--index-timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark collections")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_PREFER_GRPC, timeout=120)
+    vectors = load_vectors(client, args)
+    dim = vectors.shape[1]
+    queries = make_queries(vectors, args.queries, args.seed)
+    ef_values = [int(value) for value in args.hnsw_ef.split(',')]
+    results = {"points": len(vectors), "dim": dim, "queries": len(queries), "k": args.k, "hnsw_m": args.hnsw_m,
+               "ef_construct": args.ef_construct, "settings": []}
+
+    if server_memory_mb() is None:
+        print(f"Qdrant /metrics at {QDRANT_HOST}:{QDRANT_PORT} has no memory_resident_bytes, "
+              f"only the formula RAM estimate is reported")
+
+    ground_truth = None
+    for quantization in args.quantization.split(','):
+        name = f"bench_{quantization}_m{args.hnsw_m}"
+        if client.collection_exists(collection_name=name):
+            client.delete_collection(collection_name=name)
+        memory_before = server_memory_mb()
+        client.create_collection(collection_name=name, **collection_config(quantization=quantization,
+            hnsw_m=args.hnsw_m, hnsw_ef_construct=args.ef_construct, vector_size=dim, sparse=False))
+
+        started = time.perf_counter()
+        client.upload_points(collection_name=name, points=(PointStruct(id=i, vector=vector.tolist())
+                                                           for i, vector in enumerate(vectors)), batch_size=256)
+        wait_until_indexed(client, name, args.index_timeout)
+        build_seconds = round(time.perf_counter() - started, 2)
+
+        if ground_truth is None:
+            exact_params = SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+            exact, _, _ = run_queries(client, name, queries, args.k, exact_params, args.batch_size)
+            ground_truth = [{hit.id for hit in hits} for hits in exact]
+
+        settings = []
+        for ef in ef_values:
+            hits, latencies, qps = run_queries(client, name, queries, args.k, search_params(ef, quantization),
+                args.batch_size)
+            recall = np.mean([len(truth & {hit.id for hit in found}) / max(1, len(truth))
+                              for truth, found in zip(ground_truth, hits)])
+            settings.append({
+                "quantization": quantization, "hnsw_ef": ef, f"recall@{args.k}": round(float(recall), 4),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2), "qps": round(qps, 1),
+                "estimated_ram_mb": estimate_ram_mb(len(vectors), dim, quantization, args.hnsw_m),
+                "build_seconds": build_seconds})
+
+        memory_after = server_memory_mb()
+        measured_ram_mb = round(memory_after - memory_before, 2) \
+            if memory_before is not None and memory_after is not None else None
+        for setting in settings:
+            setting["measured_ram_mb"] = measured_ram_mb
+        results["settings"].extend(settings)
+
+        if not args.keep:
+            client.delete_collection(collection_name=name)
+
+    print(f"{'quantization':12} {'ef':>5} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'qps':>8} {'rss MB':>8} "
+          f"{'est MB':>8}")
+    for setting in results["settings"]:
+        measured = setting['measured_ram_mb'] if setting['measured_ram_mb'] is not None else "n/a"
+        print(f"{setting['quantization']:12} {setting['hnsw_ef']:>5} {setting[f'recall@{args.k}']:>7} "
+              f"{setting['latency_p50_ms']:>8} {setting['latency_p95_ms']:>8} {setting['qps']:>8} "
+              f"{measured:>8} {setting['estimated_ram_mb']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+from typing import Tuple
+
+from qdrant_client.http.models import PointStruct, CreateAliasOperation, CreateAlias, DeleteAliasOperation, \
+    DeleteAlias
+
+import vector_store
+from config import QDRANT_COLLECTION_NAME, SPARSE_ENABLED, SPARSE_VECTOR_NAME
+from vector_store import initialize_vector_store, close_vector_store, collection_config, \
+    new_physical_collection_name
+
+
+async def resolve_collection() -> Tuple[str, bool]:
+    aliases = await vector_store.qdrant_client.get_aliases()
+    for alias in aliases.aliases:
+        if alias.alias_name == QDRANT_COLLECTION_NAME:
+            return alias.collection_name, True
+    return QDRANT_COLLECTION_NAME, False
+
+
+def to_target_vector(vector):
+    if not isinstance(vector, dict):
+        return vector
+    if not SPARSE_ENABLED:
+        return vector.get("")
+    return {name: value for name, value in vector.items() if name in ("", SPARSE_VECTOR_NAME)}
+
+
+async def copy_points(source: str, target: str, batch_size: int) -> int:
+    client = vector_store.qdrant_client
+    copied = 0
+    offset = None
+    while True:
+        records, offset = await client.scroll(collection_name=source, limit=batch_size, offset=offset,
+            with_payload=True, with_vectors=True)
+        if records:
+            await client.upsert(collection_name=target, wait=True,
+                points=[PointStruct(id=record.id, vector=to_target_vector(record.vector), payload=record.payload)
+                        for record in records])
+            copied += len(records)
+            print(f"Copied {copied} points")
+        if offset is None:
+            return copied
+
+
+async def replace_collection_with_alias(source: str, target: str, vector_size: int, batch_size: int,
+        attempts: int = 3):
+    # Qdrant refuses an alias named like an existing collection, so the source has to go before the alias exists.
+    # The copy is verified by then, and if the alias still cannot be created the source is rebuilt from it.
+    client = vector_store.qdrant_client
+    create_alias = CreateAliasOperation(create_alias=CreateAlias(collection_name=target,
+        alias_name=QDRANT_COLLECTION_NAME))
+    await client.delete_collection(collection_name=source)
+    for attempt in range(1, attempts + 1):
+        try:
+            await client.update_collection_aliases(change_aliases_operations=[create_alias])
+            return
+        except Exception as e:
+            print(f"Creating alias '{QDRANT_COLLECTION_NAME}' failed (attempt {attempt}/{attempts}): {e}")
+            if attempt < attempts:
+                await asyncio.sleep(attempt)
+
+    print(f"Restoring '{source}' from '{target}'")
+    await client.create_collection(collection_name=source, **collection_config(vector_size=vector_size))
+    await copy_points(target, source, batch_size)
+    raise RuntimeError(f"Could not create alias '{QDRANT_COLLECTION_NAME}', '{source}' was restored from '{target}'")
+
+
+async def migrate_collection(batch_size: int = 256, keep_old: bool = False) -> str:
+    client = vector_store.qdrant_client
+    source, aliased = await resolve_collection()
+    target = new_physical_collection_name()
+    print(f"Migrating '{source}' to '{target}' with the current collection settings")
+
+    source_info = await client.get_collection(collection_name=source)
+    vector_size = source_info.config.params.vectors.size
+    await client.create_collection(collection_name=target, **collection_config(vector_size=vector_size))
+    copied = await copy_points(source, target, batch_size)
+    source_count = (await client.count(collection_name=source, exact=True)).count
+    if copied != source_count:
+        await client.delete_collection(collection_name=target)
+        raise RuntimeError(f"Copied {copied} points but '{source}' now has {source_count}, "
+                           f"stop ingestion during the migration and retry")
+
+    if aliased:
+        await client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=QDRANT_COLLECTION_NAME)),
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=QDRANT_COLLECTION_NAME))])
+        if not keep_old:
+            await client.delete_collection(collection_name=source)
+    else:
+        print(f"'{source}' is a collection rather than an alias, it is replaced by an alias to '{target}'")
+        await replace_collection_with_alias(source, target, vector_size, batch_size)
+
+    print(f"Alias '{QDRANT_COLLECTION_NAME}' now points to '{target}' ({copied} points)")
+    return target
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Re-create the Qdrant collection with the current quantization, "
+                                                 "HNSW and sparse vector settings and switch the alias to it")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--keep-old', action='store_true', help="Keep the previous collection after switching")
+    args = parser.parse_args()
+
+    if not await initialize_vector_store():
+        raise SystemExit(1)
+    try:
+        await migrate_collection(args.batch_size, args.keep_old)
+    finally:
+        await close_vector_store()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
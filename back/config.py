@@ -5,10 +5,31 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGO_URI = os.getenv('MONGO_URI')
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 5))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 60000))
 EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL_NAME',)
 RERANKER_MODEL_NAME = os.getenv('RERANKER_MODEL_NAME')
 QDRANT_HOST = os.getenv('QDRANT_HOST', 'localhost')
 QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))
+QDRANT_GRPC_PORT = int(os.getenv('QDRANT_GRPC_PORT', 6334))
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', 'false').lower() == 'true'
+QDRANT_TIMEOUT = int(os.getenv('QDRANT_TIMEOUT', 30))
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv('QDRANT_UPSERT_BATCH_SIZE', 64))
+QDRANT_UPSERT_PARALLEL = int(os.getenv('QDRANT_UPSERT_PARALLEL', 4))
+QDRANT_QUANTIZATION = os.getenv('QDRANT_QUANTIZATION', 'none').lower()
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv('QDRANT_QUANTIZATION_ALWAYS_RAM', 'true').lower() == 'true'
+QDRANT_SCALAR_QUANTILE = float(os.getenv('QDRANT_SCALAR_QUANTILE', 0.99))
+QDRANT_VECTORS_ON_DISK = os.getenv('QDRANT_VECTORS_ON_DISK', 'false').lower() == 'true'
+QDRANT_HNSW_M = int(os.getenv('QDRANT_HNSW_M', 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv('QDRANT_HNSW_EF_CONSTRUCT', 100))
+QDRANT_HNSW_EF = int(os.getenv('QDRANT_HNSW_EF', 128))
+QDRANT_RESCORE = os.getenv('QDRANT_RESCORE', 'true').lower() == 'true'
+QDRANT_OVERSAMPLING = float(os.getenv('QDRANT_OVERSAMPLING', 2.0))
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'qdrant').lower()
+LOCAL_VECTOR_STORE_DIR = os.getenv('LOCAL_VECTOR_STORE_DIR', 'vector_index')
+LOCAL_VECTOR_STORE_INITIAL_CAPACITY = int(os.getenv('LOCAL_VECTOR_STORE_INITIAL_CAPACITY', 4096))
+LOCAL_VECTOR_STORE_COMPACT_RATIO = float(os.getenv('LOCAL_VECTOR_STORE_COMPACT_RATIO', 0.25))
 OPENAI_API_BASE = os.getenv('OPENAI_API_BASE',)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'DUMMY_KEY')
 OPENAI_MODEL_NAME = os.getenv('OPENAI_MODEL_NAME', )
@@ -20,8 +41,81 @@ VALID_CATEGORIES = ["Lookup", "Calculation"]
 TOTAL_CONTEXT_WINDOW_TOKENS = int(os.getenv('TOTAL_CONTEXT_WINDOW_TOKENS', 16000))
 RESPONSE_BUFFER_TOKENS = int(os.getenv('RESPONSE_BUFFER_TOKENS', 4096))
 BASE_PROMPT_TOKENS = 800
+LLM_TOKENIZER_NAME = os.getenv('LLM_TOKENIZER_NAME')
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv('TOKEN_COUNT_CACHE_SIZE', 50000))
 MAX_HISTORY_MESSAGES_TO_FETCH = 15
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 200))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 1000))
+HISTORY_STREAM_BATCH_SIZE = int(os.getenv('HISTORY_STREAM_BATCH_SIZE', 50))
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 2000))
+HISTORY_CONTEXT_MAX_AGE_SECONDS = float(os.getenv('HISTORY_CONTEXT_MAX_AGE_SECONDS', 1800))
+HISTORY_MEMORY_MAX_USERS = int(os.getenv('HISTORY_MEMORY_MAX_USERS', 1000))
+HISTORY_WRITE_BATCH_SIZE = int(os.getenv('HISTORY_WRITE_BATCH_SIZE', 100))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 1.0))
+HISTORY_WRITE_BUFFER_LIMIT = int(os.getenv('HISTORY_WRITE_BUFFER_LIMIT', 10000))
 MAX_QDRANT_RESULTS_TO_FETCH = 20
 QDRANT_SCORE_THRESHOLD = 0.6
 MIN_RERANK_SCORE = 0.8
-VECTOR_SIZE = 1024
+RERANK_TARGET_RESULTS = int(os.getenv('RERANK_TARGET_RESULTS', 6))
+RERANK_STEP_SIZE = int(os.getenv('RERANK_STEP_SIZE', 8))
+RERANK_DENSE_MARGIN = float(os.getenv('RERANK_DENSE_MARGIN', 0.15))
+RERANK_SCORE_CACHE_SIZE = int(os.getenv('RERANK_SCORE_CACHE_SIZE', 20000))
+VECTOR_SIZE = int(os.getenv('VECTOR_SIZE', 1024))
+SPARSE_ENABLED = os.getenv('SPARSE_ENABLED', 'true').lower() == 'true'
+SPARSE_VECTOR_NAME = os.getenv('SPARSE_VECTOR_NAME', 'text')
+SPARSE_BM25_K1 = float(os.getenv('SPARSE_BM25_K1', 1.2))
+SPARSE_BM25_B = float(os.getenv('SPARSE_BM25_B', 0.75))
+SPARSE_DEFAULT_AVG_CHUNK_TERMS = float(os.getenv('SPARSE_DEFAULT_AVG_CHUNK_TERMS', 120))
+RRF_K = int(os.getenv('RRF_K', 60))
+HYBRID_RERANK_CANDIDATES = int(os.getenv('HYBRID_RERANK_CANDIDATES', 24))
+LLM_HTTP2 = os.getenv('LLM_HTTP2', 'false').lower() == 'true'
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 50))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 10))
+LLM_GENERATION_TIMEOUT = float(os.getenv('LLM_GENERATION_TIMEOUT', 180))
+STAGE_TIMEOUT_CLASSIFY = float(os.getenv('STAGE_TIMEOUT_CLASSIFY', 15))
+STAGE_TIMEOUT_ENRICH = float(os.getenv('STAGE_TIMEOUT_ENRICH', 15))
+STAGE_TIMEOUT_EMBED = float(os.getenv('STAGE_TIMEOUT_EMBED', 30))
+STAGE_TIMEOUT_SEARCH = float(os.getenv('STAGE_TIMEOUT_SEARCH', 15))
+STAGE_TIMEOUT_RERANK = float(os.getenv('STAGE_TIMEOUT_RERANK', 60))
+STAGE_TIMEOUT_HISTORY = float(os.getenv('STAGE_TIMEOUT_HISTORY', 5))
+ASK_MAX_IN_FLIGHT = int(os.getenv('ASK_MAX_IN_FLIGHT', 16))
+ASK_MAX_QUEUE = int(os.getenv('ASK_MAX_QUEUE', 32))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 10))
+ADMISSION_RETRY_AFTER_MAX = int(os.getenv('ADMISSION_RETRY_AFTER_MAX', 30))
+STAGE_LIMIT_LLM = int(os.getenv('STAGE_LIMIT_LLM', 8))
+STAGE_QUEUE_LLM = int(os.getenv('STAGE_QUEUE_LLM', 32))
+STAGE_LIMIT_EMBEDDING = int(os.getenv('STAGE_LIMIT_EMBEDDING', 8))
+STAGE_QUEUE_EMBEDDING = int(os.getenv('STAGE_QUEUE_EMBEDDING', 64))
+STAGE_LIMIT_RERANK = int(os.getenv('STAGE_LIMIT_RERANK', 4))
+STAGE_QUEUE_RERANK = int(os.getenv('STAGE_QUEUE_RERANK', 32))
+STAGE_LIMIT_VECTOR_SEARCH = int(os.getenv('STAGE_LIMIT_VECTOR_SEARCH', 16))
+STAGE_QUEUE_VECTOR_SEARCH = int(os.getenv('STAGE_QUEUE_VECTOR_SEARCH', 64))
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch').lower()
+ONNX_QUANTIZE = os.getenv('ONNX_QUANTIZE', 'false').lower() == 'true'
+ONNX_CACHE_DIR = os.getenv('ONNX_CACHE_DIR', 'onnx_models')
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', 0))
+EMBEDDING_MICRO_BATCH_SIZE = int(os.getenv('EMBEDDING_MICRO_BATCH_SIZE', 32))
+RERANK_MICRO_BATCH_SIZE = int(os.getenv('RERANK_MICRO_BATCH_SIZE', 64))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 5))
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH', 'answer_cache.sqlite3')
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv('ANSWER_CACHE_SIMILARITY_THRESHOLD', 0.95))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 5000))
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', 'embedding_cache')
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv('EMBEDDING_CACHE_MEMORY_SIZE', 10000))
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.getenv('EMBEDDING_CACHE_DISK_CAPACITY', 50000))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 50))
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES',
+    os.getenv('PDF_EXTRACTION_PROCESSES', max(1, (os.cpu_count() or 2) // 2))))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 1))
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0))
+IO_WORKERS = int(os.getenv('IO_WORKERS', 16))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 10))
+PDF_SLOW_PAGE_SECONDS = float(os.getenv('PDF_SLOW_PAGE_SECONDS', 2.0))
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 2))
+INGESTION_QUEUE_SIZE = int(os.getenv('INGESTION_QUEUE_SIZE', 20))
+INGESTION_JOB_TTL_SECONDS = int(os.getenv('INGESTION_JOB_TTL_SECONDS', 24 * 3600))
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any, Deque
+
+from bson import ObjectId
+
+from config import MAX_HISTORY_MESSAGES_TO_FETCH, HISTORY_MEMORY_MAX_USERS, HISTORY_WRITE_BATCH_SIZE, \
+    HISTORY_FLUSH_INTERVAL, HISTORY_WRITE_BUFFER_LIMIT, HISTORY_CONTEXT_MAX_AGE_SECONDS
+from database import get_recent_messages, save_conversation_batch
+
+
+class ConversationWriter:
+    def __init__(self, batch_size: int, flush_interval: float, buffer_limit: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_limit = buffer_limit
+        self.buffer: List[Dict[str, Any]] = []
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def ensure_started(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def enqueue(self, turn: Dict[str, Any]):
+        if len(self.buffer) >= self.buffer_limit:
+            self.dropped += 1
+            return
+        self.buffer.append(turn)
+        self.ensure_started()
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def discard_user(self, user_id: int):
+        self.buffer = [turn for turn in self.buffer if turn["user_id"] != user_id]
+
+    async def flush(self):
+        async with self.flush_lock:
+            while self.buffer:
+                batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                messages = [message for turn in batch for message in turn["messages"]]
+                metrics = [turn["metrics"] for turn in batch if turn["metrics"]]
+                if await save_conversation_batch(messages, metrics):
+                    self.written += len(batch)
+                else:
+                    self.failed_batches += 1
+                    self.requeue(batch)
+                    break
+
+    def requeue(self, batch: List[Dict[str, Any]]):
+        self.buffer = batch + self.buffer
+        overflow = len(self.buffer) - self.buffer_limit
+        if overflow > 0:
+            self.buffer = self.buffer[:self.buffer_limit]
+            self.dropped += overflow
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+        self.stopping = False
+        if self.buffer:
+            print(f"Conversation writer stopped with {len(self.buffer)} unsaved turns")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"buffered_turns": len(self.buffer), "written_turns": self.written, "dropped_turns": self.dropped,
+                "failed_batches": self.failed_batches}
+
+
+recent_turns: "OrderedDict[int, Deque[Dict[str, Any]]]" = OrderedDict()
+writer = ConversationWriter(HISTORY_WRITE_BATCH_SIZE, HISTORY_FLUSH_INTERVAL, HISTORY_WRITE_BUFFER_LIMIT)
+
+
+def message_time(timestamp: Optional[datetime]) -> float:
+    if timestamp is None:
+        return 0.0
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def remember_messages(user_id: int, messages: List[Dict[str, Any]]) -> Deque[Dict[str, Any]]:
+    history = recent_turns.get(user_id)
+    if history is None:
+        history = deque(maxlen=MAX_HISTORY_MESSAGES_TO_FETCH)
+        recent_turns[user_id] = history
+    history.extend({"role": message["role"], "content": message["content"],
+                    "timestamp": message_time(message.get("timestamp"))} for message in messages)
+    recent_turns.move_to_end(user_id)
+    while len(recent_turns) > HISTORY_MEMORY_MAX_USERS:
+        recent_turns.popitem(last=False)
+    return history
+
+
+async def load_history(user_id: int, max_age: float = HISTORY_CONTEXT_MAX_AGE_SECONDS) -> List[Dict[str, Any]]:
+    history = recent_turns.get(user_id)
+    if history is None:
+        messages = await get_recent_messages(user_id, MAX_HISTORY_MESSAGES_TO_FETCH)
+        history = recent_turns.get(user_id)
+        if history is None:
+            history = remember_messages(user_id, messages)
+    recent_turns.move_to_end(user_id)
+    if max_age <= 0:
+        return list(history)
+    # Only recent turns make a question a follow-up; older ones would pin it to stale context.
+    newer_than = time.time() - max_age
+    return [message for message in history if message["timestamp"] >= newer_than]
+
+
+def save_turn(user_id: int, question: str, answer: str, metrics: Optional[Dict[str, Any]], asked_at: float):
+    now = datetime.now(timezone.utc)
+    user_message_id = ObjectId()
+    assistant_message_id = ObjectId()
+    messages = [{"_id": user_message_id, "user_id": user_id, "role": "user", "content": question,
+                 "timestamp": min(datetime.fromtimestamp(asked_at, timezone.utc), now)},
+                {"_id": assistant_message_id, "user_id": user_id, "role": "assistant", "content": answer,
+                 "timestamp": now}]
+    if user_id in recent_turns:
+        remember_messages(user_id, messages)
+
+    writer.enqueue({"user_id": user_id, "messages": messages,
+                    "metrics": {"message_id": assistant_message_id, "user_id": user_id, "metrics": metrics,
+                                "created_at": now} if metrics else None})
+
+
+async def forget_history(user_id: int):
+    recent_turns.pop(user_id, None)
+    writer.discard_user(user_id)
+    async with writer.flush_lock:
+        writer.discard_user(user_id)
+
+
+async def stop_conversation_writer():
+    await writer.stop()
+
+
+def get_conversation_stats() -> Dict[str, Any]:
+    stats = writer.get_stats()
+    stats["cached_users"] = len(recent_turns)
+    return stats
@@ -1,33 +1,51 @@
-import asyncio
-from typing import List, Dict, Any
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple, AsyncIterator
 
-from pymongo import MongoClient, DESCENDING
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from config import MONGO_URI
+from config import MONGO_URI, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, HISTORY_PAGE_SIZE, \
+    HISTORY_STREAM_BATCH_SIZE
 
 mongo_client = None
 db = None
 documents_collection = None
 messages_collection = None
 metrics_collection = None
+chunk_hashes_collection = None
+term_stats_collection = None
 
+CORPUS_STATS_ID = '__corpus__'
 
-async def initialize_database():
-    global mongo_client, db, documents_collection, messages_collection, metrics_collection
+
+async def initialize_database(client=None):
+    global mongo_client, db, documents_collection, messages_collection, metrics_collection, chunk_hashes_collection, \
+        term_stats_collection
 
     try:
-        mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=10000)
-        mongo_client.admin.command('ismaster')
+        if client is None:
+            client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=10000, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE, maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS)
+            await client.admin.command('ismaster')
+        mongo_client = client
         db = mongo_client['ai_assistant_telegram_db']
 
         documents_collection = db['documents']
         messages_collection = db['messages']
         metrics_collection = db['rag_metrics']
+        chunk_hashes_collection = db['chunk_hashes']
+        term_stats_collection = db['term_stats']
 
-        messages_collection.create_index([("user_id", 1), ("timestamp", DESCENDING)])
-        documents_collection.create_index([("upload_time", DESCENDING)])
-        metrics_collection.create_index([("message_id", 1)], unique=True)
-        metrics_collection.create_index([("user_id", 1), ("created_at", DESCENDING)])
+        await messages_collection.create_index([("user_id", 1), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+        await messages_collection.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+        await documents_collection.create_index([("upload_time", DESCENDING)])
+        await documents_collection.create_index([("filename", 1), ("status", 1)])
+        await chunk_hashes_collection.create_index([("document_mongo_id", 1), ("content_hash", 1)], unique=True)
+        await metrics_collection.create_index([("message_id", 1)], unique=True)
+        await metrics_collection.create_index([("user_id", 1), ("created_at", DESCENDING)])
 
         return True
     except Exception as e:
@@ -50,7 +68,7 @@ async def list_knowledge_base_documents() -> List[Dict[str, Any]]:
         cursor = documents_collection.find({'status': 'active'},
             {'filename': 1, 'upload_time': 1, 'chunk_count': 1}).sort("upload_time", DESCENDING)
 
-        docs = await asyncio.to_thread(list, cursor)
+        docs = await cursor.to_list(length=None)
 
         for doc in docs:
             doc['_id'] = str(doc['_id'])
@@ -61,11 +79,194 @@ async def list_knowledge_base_documents() -> List[Dict[str, Any]]:
         return []
 
 
+async def create_document_record(filename: str) -> Optional[str]:
+    if documents_collection is None:
+        return None
+    try:
+        insert_result = await documents_collection.insert_one(
+            {'filename': filename, 'upload_time': datetime.now(timezone.utc), 'chunk_count': 0,
+                'status': 'processing'})
+        return str(insert_result.inserted_id)
+    except Exception as e:
+        print(f"Error creating document record for '{filename}': {e}")
+        return None
+
+
+async def find_active_document_by_filename(filename: str) -> Optional[Dict[str, Any]]:
+    if documents_collection is None:
+        return None
+    try:
+        doc = await documents_collection.find_one({'filename': filename, 'status': 'active'},
+            sort=[("upload_time", DESCENDING)])
+        if doc:
+            doc['_id'] = str(doc['_id'])
+        return doc
+    except Exception as e:
+        print(f"Error finding document '{filename}': {e}")
+        return None
+
+
+async def find_document(doc_id_or_filename: str) -> Optional[Dict[str, Any]]:
+    if documents_collection is None:
+        return None
+    if ObjectId.is_valid(doc_id_or_filename):
+        try:
+            doc = await documents_collection.find_one({'_id': ObjectId(doc_id_or_filename)})
+            if doc:
+                doc['_id'] = str(doc['_id'])
+                return doc
+        except Exception as e:
+            print(f"Error finding document {doc_id_or_filename}: {e}")
+            return None
+    return await find_active_document_by_filename(doc_id_or_filename)
+
+
+async def activate_document_record(doc_id: str, chunk_count: int) -> bool:
+    if documents_collection is None:
+        return False
+    try:
+        update_result = await documents_collection.update_one({'_id': ObjectId(doc_id)},
+            {'$set': {'chunk_count': chunk_count, 'status': 'active', 'upload_time': datetime.now(timezone.utc)}})
+        return update_result.matched_count == 1
+    except Exception as e:
+        print(f"Error activating document record {doc_id}: {e}")
+        return False
+
+
+async def delete_document_record(doc_id: str) -> bool:
+    if documents_collection is None:
+        return False
+    try:
+        delete_result = await documents_collection.delete_one({'_id': ObjectId(doc_id)})
+        return delete_result.deleted_count == 1
+    except Exception as e:
+        print(f"Error deleting document record {doc_id}: {e}")
+        return False
+
+
+async def get_document_chunk_hashes(doc_id: str) -> Optional[Set[str]]:
+    if chunk_hashes_collection is None:
+        return None
+    try:
+        cursor = chunk_hashes_collection.find({'document_mongo_id': doc_id}, {'content_hash': 1, '_id': 0})
+        rows = await cursor.to_list(length=None)
+        return {row['content_hash'] for row in rows}
+    except Exception as e:
+        print(f"Error loading chunk hashes for document {doc_id}: {e}")
+        return None
+
+
+async def update_term_statistics(chunks: List[Dict[str, Any]], sign: int):
+    if term_stats_collection is None or not chunks:
+        return
+    document_frequencies = Counter(term_id for chunk in chunks for term_id in chunk.get('term_ids', []))
+    operations = [UpdateOne({'_id': term_id}, {'$inc': {'df': sign * count}}, upsert=True)
+                  for term_id, count in document_frequencies.items()]
+    operations.append(UpdateOne({'_id': CORPUS_STATS_ID},
+        {'$inc': {'chunks': sign * len(chunks), 'terms': sign * sum(chunk.get('term_count', 0) for chunk in chunks)}},
+        upsert=True))
+    try:
+        await term_stats_collection.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error updating term statistics: {e}")
+
+
+async def get_term_statistics(term_ids: List[int]) -> Tuple[Dict[int, int], int, int]:
+    if term_stats_collection is None:
+        return {}, 0, 0
+    try:
+        rows = await term_stats_collection.find({'_id': {'$in': list(set(term_ids)) + [CORPUS_STATS_ID]}}) \
+            .to_list(length=None)
+        corpus = next((row for row in rows if row['_id'] == CORPUS_STATS_ID), {})
+        return ({row['_id']: row.get('df', 0) for row in rows if row['_id'] != CORPUS_STATS_ID},
+                corpus.get('chunks', 0), corpus.get('terms', 0))
+    except Exception as e:
+        print(f"Error loading term statistics: {e}")
+        return {}, 0, 0
+
+
+async def add_document_chunk_hashes(doc_id: str, chunks: List[Dict[str, Any]]) -> bool:
+    if chunk_hashes_collection is None:
+        return False
+    if not chunks:
+        return True
+    rows = [{'document_mongo_id': doc_id, **chunk} for chunk in chunks]
+    try:
+        await chunk_hashes_collection.insert_many(rows, ordered=False)
+        await update_term_statistics(rows, 1)
+        return True
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        if all(error.get('code') == 11000 for error in write_errors):
+            duplicates = {error['index'] for error in write_errors}
+            await update_term_statistics([row for i, row in enumerate(rows) if i not in duplicates], 1)
+            return True
+        print(f"Error saving chunk hashes for document {doc_id}: {e}")
+        return False
+    except Exception as e:
+        print(f"Error saving chunk hashes for document {doc_id}: {e}")
+        return False
+
+
+async def delete_document_chunk_hashes(doc_id: str, content_hashes: Optional[List[str]] = None) -> bool:
+    if chunk_hashes_collection is None:
+        return False
+    query: Dict[str, Any] = {'document_mongo_id': doc_id}
+    if content_hashes is not None:
+        query['content_hash'] = {'$in': content_hashes}
+    try:
+        rows = await chunk_hashes_collection.find(query, {'term_ids': 1, 'term_count': 1}).to_list(length=None)
+        await chunk_hashes_collection.delete_many({'_id': {'$in': [row['_id'] for row in rows]}})
+        await update_term_statistics(rows, -1)
+        return True
+    except Exception as e:
+        print(f"Error deleting chunk hashes for document {doc_id}: {e}")
+        return False
+
+
+async def get_recent_messages(user_id: int, limit: int) -> List[Dict[str, Any]]:
+    if messages_collection is None:
+        return []
+    try:
+        cursor = messages_collection.find({'user_id': user_id}, {'role': 1, 'content': 1, 'timestamp': 1, '_id': 0}) \
+            .sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+        messages = await cursor.to_list(length=None)
+        messages.reverse()
+        return messages
+    except Exception as e:
+        print(f"Error loading recent messages for user_id {user_id}: {e}")
+        return []
+
+
+async def insert_many_ignoring_duplicates(collection, documents: List[Dict[str, Any]]):
+    # A retried batch may already be partly stored; documents carry their own ids, so duplicates mean "already saved".
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if e.details.get("writeConcernErrors") or \
+                any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+async def save_conversation_batch(messages: List[Dict[str, Any]], metrics: List[Dict[str, Any]]) -> bool:
+    if messages_collection is None or metrics_collection is None:
+        return False
+    try:
+        if messages:
+            await insert_many_ignoring_duplicates(messages_collection, messages)
+        if metrics:
+            await insert_many_ignoring_duplicates(metrics_collection, metrics)
+        return True
+    except Exception as e:
+        print(f"Error saving {len(messages)} messages and {len(metrics)} metrics: {e}")
+        return False
+
+
 async def clear_user_history(user_id: int) -> tuple[bool, str]:
     if messages_collection is None:
         return False, "Database connection not available."
     try:
-        delete_result = await asyncio.to_thread(messages_collection.delete_many, {"user_id": user_id})
+        delete_result = await messages_collection.delete_many({"user_id": user_id})
 
         deleted_count = delete_result.deleted_count
         return True, f"История сообщений ({deleted_count} сообщений) была очищена."
@@ -74,39 +275,58 @@ async def clear_user_history(user_id: int) -> tuple[bool, str]:
         return False, "An error occurred while clearing your history."
 
 
-async def get_chat_history_with_metrics() -> List[Dict[str, Any]]:
-    if messages_collection is None or metrics_collection is None:
-        print("MongoDB collections not initialized")
-        return []
-
-    try:
-        messages_cursor = messages_collection.find().sort([("user_id", 1), ("timestamp", 1)])
-        messages = await asyncio.to_thread(list, messages_cursor)
+def encode_history_cursor(message: Dict[str, Any]) -> str:
+    timestamp_ms = int(message["timestamp"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return f"{timestamp_ms}_{message['_id']}"
 
-        metrics_cursor = metrics_collection.find()
-        metrics = await asyncio.to_thread(list, metrics_cursor)
 
-        metrics_dict = {m["message_id"]: m["metrics"] for m in metrics}
+def decode_history_cursor(cursor: str) -> Optional[Tuple[datetime, ObjectId]]:
+    timestamp_ms, _, message_id = cursor.partition('_')
+    if not timestamp_ms.isdigit() or not ObjectId.is_valid(message_id):
+        return None
+    return datetime.fromtimestamp(int(timestamp_ms) / 1000, timezone.utc), ObjectId(message_id)
 
-        chats = {}
-        for msg in messages:
-            user_id = msg["user_id"]
-            if user_id not in chats:
-                chats[user_id] = {"user_id": user_id, "messages": [], "total_messages": 0,
-                    "first_message_time": msg["timestamp"], "last_message_time": msg["timestamp"]}
 
-            if msg["role"] == "assistant":
-                msg["metrics"] = metrics_dict.get(msg["_id"], {})
+def build_history_match(cursor: Optional[str], user_id: Optional[int], start: Optional[datetime],
+        end: Optional[datetime]) -> Dict[str, Any]:
+    match: Dict[str, Any] = {}
+    if user_id is not None:
+        match["user_id"] = user_id
+    if start is not None or end is not None:
+        match["timestamp"] = {}
+        if start is not None:
+            match["timestamp"]["$gte"] = start
+        if end is not None:
+            match["timestamp"]["$lt"] = end
+    if cursor:
+        position = decode_history_cursor(cursor)
+        if position is None:
+            raise ValueError(f"Invalid history cursor: {cursor}")
+        timestamp, message_id = position
+        match["$or"] = [{"timestamp": {"$lt": timestamp}},
+                        {"timestamp": timestamp, "_id": {"$lt": message_id}}]
+    return match
 
-            chats[user_id]["messages"].append(msg)
-            chats[user_id]["total_messages"] += 1
-            chats[user_id]["last_message_time"] = msg["timestamp"]
 
-        result = list(chats.values())
-        result.sort(key=lambda x: x["last_message_time"], reverse=True)
+async def iter_chat_history(cursor: Optional[str] = None, limit: int = HISTORY_PAGE_SIZE,
+        user_id: Optional[int] = None, start: Optional[datetime] = None,
+        end: Optional[datetime] = None) -> AsyncIterator[Dict[str, Any]]:
+    if messages_collection is None or metrics_collection is None:
+        print("MongoDB collections not initialized")
+        return
 
-        return result
+    pipeline = [
+        {"$match": build_history_match(cursor, user_id, start, end)},
+        {"$sort": {"timestamp": -1, "_id": -1}},
+        {"$limit": limit},
+        {"$lookup": {"from": metrics_collection.name, "localField": "_id", "foreignField": "message_id",
+                     "as": "metrics_docs"}},
+        {"$project": {"user_id": 1, "role": 1, "content": 1, "timestamp": 1,
+                      "metrics": {"$ifNull": [{"$arrayElemAt": ["$metrics_docs.metrics", 0]}, {}]}}},
+    ]
 
+    try:
+        async for message in messages_collection.aggregate(pipeline, batchSize=HISTORY_STREAM_BATCH_SIZE):
+            yield message
     except Exception as e:
-        print(f"Error getting chat history with metrics: {e}")
-        return []
+        print(f"Error streaming chat history: {e}")
@@ -1,55 +1,209 @@
 import asyncio
+import hashlib
+import itertools
 import os
 import re
-from typing import List, Optional
-
-import PyPDF2
-import docx
+import time
+from collections import deque
+from typing import List, Optional, Callable, Iterable, Iterator, Tuple, AsyncIterator
 
+from config import PDF_PARALLEL_MIN_PAGES, PARSE_PROCESSES, PDF_PAGES_PER_TASK, PDF_SLOW_PAGE_SECONDS
+from executors import parse_executor, io_executor
 from utils import allowed_file
 
+PageCallback = Callable[[int, float], None]
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?…;])\s+')
+CHUNK_SEPARATOR = "\n\n"
+TEXT_SECTION_CHARS = 1024 * 1024
+
+
+def iter_units(paragraphs: Iterable[str], max_size: int) -> Iterator[str]:
+    for paragraph in paragraphs:
+        if len(paragraph) <= max_size:
+            yield paragraph
+            continue
+        for sentence in SENTENCE_BREAK.split(paragraph):
+            for start in range(0, len(sentence), max_size):
+                piece = sentence[start:start + max_size].strip()
+                if piece:
+                    yield piece
+
+
+def is_chunk_boundary(unit: str, target_size: int) -> bool:
+    digest = int(hashlib.md5(unit.encode('utf-8')).hexdigest()[:8], 16)
+    return digest / 0xFFFFFFFF < len(unit) / target_size
+
+
+def overlap_units(units: List[str], overlap: int) -> List[str]:
+    return units[-1:] if units and len(units[-1]) <= overlap else []
+
+
+class TextChunker:
+    # Boundaries follow paragraphs and sentences, and a chunk ends after a unit whose own hash says so, so an edit
+    # only changes the chunks around it instead of shifting every later chunk. The state is plain data, so a
+    # document can be chunked section by section in the parse pool.
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.buffer = ""
+        self.units: List[str] = []
+        self.fresh = False
+
+    def split_paragraphs(self, piece: str) -> List[str]:
+        self.buffer += piece
+        parts = PARAGRAPH_BREAK.split(self.buffer)
+        self.buffer = parts.pop()
+        paragraphs = [part.strip() for part in parts if part.strip()]
+
+        max_buffer = self.chunk_size * 8
+        while len(self.buffer) > max_buffer:
+            cut = self.buffer.rfind("\n", 0, max_buffer)
+            cut = cut if cut > 0 else max_buffer
+            if self.buffer[:cut].strip():
+                paragraphs.append(self.buffer[:cut].strip())
+            self.buffer = self.buffer[cut:]
+        return paragraphs
+
+    def add_units(self, paragraphs: List[str]) -> List[str]:
+        chunks = []
+        for unit in iter_units(paragraphs, self.chunk_size):
+            if self.fresh and len(CHUNK_SEPARATOR.join(self.units + [unit])) > self.chunk_size:
+                chunks.append(CHUNK_SEPARATOR.join(self.units))
+                self.units, self.fresh = overlap_units(self.units, self.overlap), False
+            if len(CHUNK_SEPARATOR.join(self.units + [unit])) > self.chunk_size:
+                self.units = []
+            self.units.append(unit)
+            self.fresh = True
+            if is_chunk_boundary(unit, self.chunk_size):
+                chunks.append(CHUNK_SEPARATOR.join(self.units))
+                self.units, self.fresh = overlap_units(self.units, self.overlap), False
+        return chunks
+
+    def feed(self, pieces: Iterable[str]) -> List[str]:
+        return self.add_units([paragraph for piece in pieces for paragraph in self.split_paragraphs(piece)])
+
+    def finish(self) -> List[str]:
+        chunks = self.add_units([self.buffer.strip()] if self.buffer.strip() else [])
+        if self.fresh:
+            chunks.append(CHUNK_SEPARATOR.join(self.units))
+        self.buffer, self.units, self.fresh = "", [], False
+        return chunks
+
+
+def chunk_section(chunker: TextChunker, pieces: List[str], last: bool) -> Tuple[TextChunker, List[str]]:
+    chunks = chunker.feed(pieces)
+    if last:
+        chunks.extend(chunker.finish())
+    return chunker, chunks
+
+
+def split_text_stream(pieces: Iterable[str], chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+    chunker = TextChunker(chunk_size, overlap)
+    for piece in pieces:
+        yield from chunker.feed([piece])
+    yield from chunker.finish()
+
 
 def split_text_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     if not text:
         return []
+    return list(split_text_stream([text], chunk_size, overlap))
+
+
+def extract_page_text(page) -> Tuple[str, float]:
+    started = time.perf_counter()
+    try:
+        page_text = page.extract_text() or ""
+    except Exception as page_err:
+        print(f"Error extracting text from page: {page_err}")
+        page_text = ""
+    return page_text, time.perf_counter() - started
+
+
+def read_pdf_pages(reader, start: int, end: int) -> List[Tuple[int, str, float]]:
+    pages = []
+    for page_number in range(start, end):
+        page_text, elapsed = extract_page_text(reader.pages[page_number])
+        pages.append((page_number + 1, page_text, elapsed))
+    return pages
+
+
+def extract_pdf_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    import PyPDF2
+
+    with open(file_path, 'rb') as f:
+        return read_pdf_pages(PyPDF2.PdfReader(f), start, end)
 
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-        if start >= len(text):
-            if end < len(text):
-                chunks.append(text[start:])
-            break
 
-    return [c.strip() for c in chunks if c.strip()]
+def extract_pdf_head(file_path: str) -> Tuple[int, List[Tuple[int, str, float]]]:
+    import PyPDF2
 
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        if reader.is_encrypted:
+            print(f"PDF '{os.path.basename(file_path)}' is encrypted.")
+        page_count = len(reader.pages)
+        head_end = page_count if page_count < PDF_PARALLEL_MIN_PAGES else min(PDF_PAGES_PER_TASK, page_count)
+        return page_count, read_pdf_pages(reader, 0, head_end)
 
-def extract_text_from_pdf(file_path: str) -> Optional[str]:
-    text = ""
+
+def report_page(file_path: str, page_number: int, elapsed: float, on_page: Optional[PageCallback]):
+    if elapsed > PDF_SLOW_PAGE_SECONDS:
+        print(f"Slow page {page_number} in '{os.path.basename(file_path)}': {elapsed:.2f}s")
+    if on_page:
+        on_page(page_number, elapsed)
+
+
+def page_texts(file_path: str, pages: List[Tuple[int, str, float]], on_page: Optional[PageCallback]) -> List[str]:
+    texts = []
+    for page_number, page_text, elapsed in pages:
+        report_page(file_path, page_number, elapsed, on_page)
+        if page_text:
+            texts.append(page_text + "\n\n")
+    return texts
+
+
+async def iter_pdf_sections(file_path: str, on_page: Optional[PageCallback] = None) -> AsyncIterator[List[str]]:
+    # Small PDFs are read by a single parse task; large ones fan page ranges out over the pool, keeping a bounded
+    # window in flight so memory tracks the window rather than the document.
+    page_count, head = await parse_executor.run(extract_pdf_head, file_path)
+    yield page_texts(file_path, head, on_page)
+
+    page_ranges = iter([(start, min(start + PDF_PAGES_PER_TASK, page_count))
+                        for start in range(len(head), page_count, PDF_PAGES_PER_TASK)])
+    pending = deque(parse_executor.submit(extract_pdf_page_range, file_path, start, end)
+                    for start, end in itertools.islice(page_ranges, max(1, PARSE_PROCESSES) * 2))
     try:
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            if reader.is_encrypted:
-                print(f"PDF '{os.path.basename(file_path)}' is encrypted.")
+        while pending:
+            pages = await asyncio.wrap_future(pending[0])
+            pending.popleft()
+            next_range = next(page_ranges, None)
+            if next_range is not None:
+                pending.append(parse_executor.submit(extract_pdf_page_range, file_path, *next_range))
+            yield page_texts(file_path, pages, on_page)
+    finally:
+        for future in pending:
+            future.cancel()
 
-            for page in reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n\n"
-                except Exception as page_err:
-                    print(f"Error extracting text from page: {page_err}")
 
-            return text.strip() if text else None
+def extract_text_from_pdf(file_path: str, on_page: Optional[PageCallback] = None) -> Optional[str]:
+    try:
+        import PyPDF2
+
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            pages = read_pdf_pages(reader, 0, len(reader.pages))
+        text = "".join(page_texts(file_path, pages, on_page)).strip()
+        return text if text else None
     except Exception as e:
         print(f"Error reading PDF '{os.path.basename(file_path)}': {e}")
         return None
 
 
 def extract_content_from_docx(file_path: str) -> Optional[str]:
+    import docx
+
     try:
         doc = docx.Document(file_path)
         full_content = []
@@ -103,27 +257,71 @@ def extract_content_from_docx(file_path: str) -> Optional[str]:
         return None
 
 
-async def process_document(file_path: str, original_filename: str) -> Optional[List[str]]:
+def open_text_file(file_path: str):
+    return open(file_path, 'r', encoding='utf-8', errors='replace')
+
+
+async def iter_text_file_sections(file_path: str, on_page: Optional[PageCallback] = None) -> \
+        AsyncIterator[List[str]]:
+    f = await io_executor.run(open_text_file, file_path)
+    read_seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            section = await io_executor.run(f.read, TEXT_SECTION_CHARS)
+            read_seconds += time.perf_counter() - started
+            if not section:
+                break
+            yield [section]
+    finally:
+        await io_executor.run(f.close)
+    report_page(file_path, 1, read_seconds, on_page)
+
+
+async def iter_docx_sections(file_path: str, on_page: Optional[PageCallback] = None) -> AsyncIterator[List[str]]:
+    started = time.perf_counter()
+    content = await parse_executor.run(extract_content_from_docx, file_path)
+    report_page(file_path, 1, time.perf_counter() - started, on_page)
+    if content:
+        yield [content]
+
+
+DOCUMENT_SECTION_READERS = {'pdf': iter_pdf_sections, 'txt': iter_text_file_sections, 'docx': iter_docx_sections}
+
+
+async def stream_document_chunks(file_path: str, original_filename: str, batch_size: int,
+        on_page: Optional[PageCallback] = None) -> AsyncIterator[List[str]]:
     if not allowed_file(original_filename):
-        return None
+        return
+    file_ext = original_filename.lower().rsplit('.', 1)[1]
 
+    # Extraction and chunking both run in the parse pool; io threads only read files and never wait on it.
+    chunker, pending = TextChunker(), []
+    sections = DOCUMENT_SECTION_READERS[file_ext](file_path, on_page)
     try:
-        file_ext = original_filename.lower().rsplit('.', 1)[1]
-        text = None
+        async for pieces in sections:
+            chunker, chunks = await parse_executor.run(chunk_section, chunker, pieces, False)
+            pending.extend(chunks)
+            while len(pending) >= batch_size:
+                yield pending[:batch_size]
+                pending = pending[batch_size:]
+    finally:
+        await sections.aclose()
+    _, chunks = await parse_executor.run(chunk_section, chunker, [], True)
+    pending.extend(chunks)
+    for start in range(0, len(pending), batch_size):
+        yield pending[start:start + batch_size]
 
-        if file_ext == 'txt':
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                text = await asyncio.to_thread(f.read)
-        elif file_ext == 'pdf':
-            text = await asyncio.to_thread(extract_text_from_pdf, file_path)
-        elif file_ext == 'docx':
-            text = await asyncio.to_thread(extract_content_from_docx, file_path)
 
-        if not text:
-            return None
+async def process_document(file_path: str, original_filename: str,
+        on_page: Optional[PageCallback] = None) -> Optional[List[str]]:
+    if not allowed_file(original_filename):
+        return None
 
-        chunks = await asyncio.to_thread(split_text_into_chunks, text)
-        return chunks
+    try:
+        chunks = [chunk async for batch in stream_document_chunks(file_path, original_filename, 256, on_page)
+                  for chunk in batch]
+        return chunks if chunks else None
     except Exception as e:
         print(f"Error processing document: {e}")
         return None
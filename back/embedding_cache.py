@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+
+from utils import normalize_chunk_text
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, cache_dir: str, memory_size: int, disk_capacity: int):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.disk_capacity = disk_capacity
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.meta_path = os.path.join(cache_dir, 'meta.json')
+        self.vectors_path = os.path.join(cache_dir, 'vectors.npy')
+        self.keys_path = os.path.join(cache_dir, 'keys.log')
+        self.vectors: Optional[np.memmap] = None
+        self.keys_file = None
+        self.index: Dict[str, int] = {}
+        self.row_keys: Dict[int, str] = {}
+        self.next_row = 0
+
+        if disk_capacity > 0:
+            self.load_disk_store()
+
+    def make_key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{normalize_chunk_text(text)}".encode('utf-8')).hexdigest()
+
+    def load_disk_store(self):
+        try:
+            meta = None
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+
+            if not meta or meta.get('model_name') != self.model_name or meta.get('capacity') != self.disk_capacity:
+                if meta:
+                    print(f"Embedding cache at '{self.cache_dir}' belongs to another model or capacity, resetting")
+                shutil.rmtree(self.cache_dir, ignore_errors=True)
+                return
+
+            self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+            log_lines = 0
+            last_row = None
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    row_str, _, key = line.rstrip('\n').partition('\t')
+                    if not key:
+                        continue
+                    row = int(row_str)
+                    old_key = self.row_keys.get(row)
+                    if old_key is not None:
+                        self.index.pop(old_key, None)
+                    self.row_keys[row] = key
+                    self.index[key] = row
+                    last_row = row
+                    log_lines += 1
+            # The log is appended in write order, so its last row is the newest one even if meta.json is stale.
+            self.next_row = (last_row + 1) % self.disk_capacity if last_row is not None else 0
+
+            if log_lines > 2 * len(self.row_keys):
+                self.compact_keys_log()
+            self.keys_file = open(self.keys_path, 'a', encoding='utf-8')
+        except Exception as e:
+            print(f"Error loading embedding cache from '{self.cache_dir}': {e}")
+            self.vectors = None
+            self.index.clear()
+            self.row_keys.clear()
+            self.next_row = 0
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def create_disk_store(self, dim: int):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.vectors = np.lib.format.open_memmap(self.vectors_path, mode='w+', dtype=np.float32,
+            shape=(self.disk_capacity, dim))
+        self.keys_file = open(self.keys_path, 'w', encoding='utf-8')
+        self.write_meta()
+
+    def write_meta(self):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name, 'capacity': self.disk_capacity}, f)
+
+    def compact_keys_log(self):
+        tmp_path = self.keys_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for offset in range(self.disk_capacity):
+                row = (self.next_row + offset) % self.disk_capacity
+                if row in self.row_keys:
+                    f.write(f"{row}\t{self.row_keys[row]}\n")
+        os.replace(tmp_path, self.keys_path)
+
+    def remember(self, key: str, vector: np.ndarray):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = []
+        with self.lock:
+            for text in texts:
+                key = self.make_key(text)
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    self.memory_hits += 1
+                elif self.vectors is not None and key in self.index:
+                    vector = np.array(self.vectors[self.index[key]])
+                    self.remember(key, vector)
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, texts: List[str], vectors) -> None:
+        with self.lock:
+            try:
+                log_lines = []
+                for text, vector in zip(texts, vectors):
+                    key = self.make_key(text)
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self.remember(key, vector)
+                    if self.disk_capacity <= 0 or key in self.index:
+                        continue
+
+                    if self.vectors is None:
+                        self.create_disk_store(vector.shape[0])
+                    row = self.next_row
+                    old_key = self.row_keys.get(row)
+                    if old_key is not None:
+                        self.index.pop(old_key, None)
+                    self.vectors[row] = vector
+                    log_lines.append(f"{row}\t{key}\n")
+                    self.row_keys[row] = key
+                    self.index[key] = row
+                    self.next_row = (row + 1) % self.disk_capacity
+                if log_lines:
+                    # Vectors reach the file before their keys, so a crash never leaves a key pointing at an old row.
+                    self.vectors.flush()
+                    self.keys_file.writelines(log_lines)
+                    self.keys_file.flush()
+            except Exception as e:
+                print(f"Error writing embedding cache: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {"model_name": self.model_name, "memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory), "disk_entries": len(self.index)}
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.vectors is not None:
+                    self.vectors.flush()
+                    self.write_meta()
+                if self.keys_file is not None:
+                    self.keys_file.close()
+                    self.keys_file = None
+            except Exception as e:
+                print(f"Error closing embedding cache: {e}")
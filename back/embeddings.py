@@ -1,35 +1,171 @@
 import asyncio
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Callable, Sequence, Tuple
 
-from sentence_transformers import SentenceTransformer, CrossEncoder
+from config import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME, EMBEDDING_CACHE_DIR, \
+    EMBEDDING_CACHE_MEMORY_SIZE, EMBEDDING_CACHE_DISK_CAPACITY, EMBEDDING_MICRO_BATCH_SIZE, \
+    RERANK_MICRO_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS, MIN_RERANK_SCORE, RERANK_TARGET_RESULTS, RERANK_STEP_SIZE, \
+    RERANK_DENSE_MARGIN, RERANK_SCORE_CACHE_SIZE
+from embedding_cache import EmbeddingCache
+from executors import inference_executor, io_executor
+from inference_backend import load_embedding_model, load_reranker_model, backend_tag
+from sparse import fusion_rank_score, dense_similarity
+from utils import normalize_chunk_text
+
+
+class MicroBatcher:
+    def __init__(self, process_batch: Callable[[List[Any]], Sequence[Any]], max_batch_size: int,
+            max_wait_ms: float):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+
+    def ensure_started(self):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        self.ensure_started()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        for item, future in zip(items, futures):
+            self.queue.put_nowait((item, future))
+        return list(await asyncio.gather(*futures))
+
+    async def collect_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def run(self):
+        while True:
+            batch = await self.collect_batch()
+            if not batch:
+                continue
+
+            try:
+                results = await inference_executor.run(self.process_batch, [item for item, _ in batch])
+                self.batches += 1
+                self.items += len(batch)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "items": self.items,
+                "average_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "queue_depth": self.queue.qsize() if self.queue is not None else 0}
 
-from config import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME
 
 embedding_model = None
 reranker_model = None
+embedding_cache = None
+rerank_score_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+embedding_batcher = MicroBatcher(lambda texts: embedding_model.encode(texts, batch_size=EMBEDDING_MICRO_BATCH_SIZE),
+    EMBEDDING_MICRO_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS)
+rerank_batcher = MicroBatcher(lambda pairs: reranker_model.predict(pairs, batch_size=RERANK_MICRO_BATCH_SIZE),
+    RERANK_MICRO_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS)
 
 
 async def initialize_models():
-    global embedding_model, reranker_model
+    global embedding_model, reranker_model, embedding_cache
 
     try:
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
-        reranker_model = CrossEncoder(RERANKER_MODEL_NAME, device='cpu')
+        embedding_model, reranker_model, embedding_cache = await asyncio.gather(
+            io_executor.run(load_embedding_model, EMBEDDING_MODEL_NAME),
+            io_executor.run(load_reranker_model, RERANKER_MODEL_NAME),
+            io_executor.run(EmbeddingCache, f"{EMBEDDING_MODEL_NAME}|{backend_tag()}", EMBEDDING_CACHE_DIR,
+                EMBEDDING_CACHE_MEMORY_SIZE, EMBEDDING_CACHE_DISK_CAPACITY))
         return True
     except Exception as e:
         print(f"Error initializing embedding models: {e}")
         return False
 
 
+async def warm_up_models():
+    if embedding_model is None or reranker_model is None:
+        return False
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(embedding_batcher.submit_many(["Прогрев модели эмбеддингов"]),
+            rerank_batcher.submit_many([["Прогрев модели", "Фрагмент для прогрева модели реранкинга"]]))
+        print(f"Models warmed up in {time.perf_counter() - started:.2f}s")
+        return True
+    except Exception as e:
+        print(f"Error warming up models: {e}")
+        return False
+
+
+async def close_models():
+    await embedding_batcher.stop()
+    await rerank_batcher.stop()
+    if embedding_cache is not None:
+        await io_executor.run(embedding_cache.close)
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    return embedding_cache.get_stats() if embedding_cache is not None else {}
+
+
+def get_micro_batcher_stats() -> Dict[str, Any]:
+    return {"embedding": embedding_batcher.get_stats(), "rerank": rerank_batcher.get_stats()}
+
+
 async def generate_embedding(text: str) -> Optional[List[float]]:
-    if embedding_model is None:
+    vectors = await generate_embeddings_batch([text])
+    return vectors[0] if vectors else None
+
+
+async def generate_embeddings_batch(texts: List[str]) -> Optional[List[List[float]]]:
+    if embedding_model is None or not texts:
         return None
 
     try:
-        vector = await asyncio.to_thread(embedding_model.encode, text)
-        return vector.tolist()
+        cached = await io_executor.run(embedding_cache.get_many, texts) if embedding_cache is not None else \
+            [None] * len(texts)
+        missing_texts = [text for text, vector in zip(texts, cached) if vector is None]
+        if missing_texts:
+            encoded = await embedding_batcher.submit_many(missing_texts)
+            if embedding_cache is not None:
+                await io_executor.run(embedding_cache.put_many, missing_texts, encoded)
+            encoded_iter = iter(encoded)
+            cached = [vector if vector is not None else next(encoded_iter) for vector in cached]
+        return [vector.tolist() for vector in cached]
     except Exception as e:
-        print(f"Error generating embedding: {e}")
+        print(f"Error generating embeddings batch: {e}")
         return None
 
 
@@ -51,7 +187,7 @@ async def rerank_results(question: str, search_results: List[dict]) -> List[dict
         if not pairs:
             return search_results
 
-        scores = await asyncio.to_thread(reranker_model.predict, pairs)
+        scores = await rerank_batcher.submit_many(pairs)
 
         reranked_results = []
         for i, result in enumerate(valid_results):
@@ -67,3 +203,68 @@ async def rerank_results(question: str, search_results: List[dict]) -> List[dict
         print(f"Error during reranking: {e}")
         search_results.sort(key=lambda x: x.score, reverse=True)
         return search_results
+
+
+async def score_rerank_candidates(query_key: str, question: str, candidates: List[Any]) -> Tuple[List[float], int]:
+    scores: List[Optional[float]] = []
+    missing_pairs, missing_positions = [], []
+
+    for i, result in enumerate(candidates):
+        cache_key = (query_key, str(result.id))
+        score = rerank_score_cache.get(cache_key)
+        if score is not None:
+            rerank_score_cache.move_to_end(cache_key)
+        else:
+            missing_pairs.append([question, result.payload.get('text', '')])
+            missing_positions.append(i)
+        scores.append(score)
+
+    if missing_pairs:
+        predicted = await rerank_batcher.submit_many(missing_pairs)
+        for position, score in zip(missing_positions, predicted):
+            scores[position] = float(score)
+            rerank_score_cache[(query_key, str(candidates[position].id))] = float(score)
+        while len(rerank_score_cache) > RERANK_SCORE_CACHE_SIZE:
+            rerank_score_cache.popitem(last=False)
+
+    return scores, len(candidates) - len(missing_pairs)
+
+
+async def rerank_adaptive(question: str, search_results: List[Any], min_score: float = MIN_RERANK_SCORE,
+        target_results: int = RERANK_TARGET_RESULTS) -> Tuple[List[Any], Dict[str, Any]]:
+    candidates = [result for result in search_results if result.payload and result.payload.get('text')]
+    candidates.sort(key=fusion_rank_score, reverse=True)
+    stats = {"rerank_candidates": len(candidates), "rerank_scored": 0, "rerank_cache_hits": 0}
+    if not candidates or reranker_model is None:
+        return candidates, stats
+
+    query_key = normalize_chunk_text(question).lower()
+    dense_scores = [dense_similarity(candidate) for candidate in candidates]
+    known_scores = [score for score in dense_scores if score is not None]
+    dense_floor = max(known_scores) - RERANK_DENSE_MARGIN if known_scores else None
+    scored = []
+
+    try:
+        for start in range(0, len(candidates), RERANK_STEP_SIZE):
+            if sum(1 for _, score in scored if score >= min_score) >= target_results:
+                break
+            # Fused order is not dense order, so a close dense match can still sit behind a weak batch.
+            if scored and dense_floor is not None and not any(score is not None and score >= dense_floor
+                                                              for score in dense_scores[start:]):
+                break
+            batch = candidates[start:start + RERANK_STEP_SIZE]
+            scores, cache_hits = await score_rerank_candidates(query_key, question, batch)
+            stats["rerank_scored"] += len(batch)
+            stats["rerank_cache_hits"] += cache_hits
+            scored.extend(zip(batch, scores))
+    except Exception as e:
+        print(f"Error during adaptive reranking: {e}")
+        if not scored:
+            return candidates, stats
+
+    for result, score in scored:
+        result.score = score
+    reranked_results = sorted((result for result, _ in scored), key=lambda x: x.score, reverse=True)
+
+    strong_results = [result for result in reranked_results if result.score >= min_score]
+    return (strong_results if strong_results else reranked_results[:target_results]), stats
@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from config import INFERENCE_WORKERS, INFERENCE_THREADS, IO_WORKERS, PARSE_PROCESSES
+from metrics import register_collector
+
+
+@lru_cache(maxsize=1)
+def physical_cores() -> int:
+    try:
+        import psutil
+
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    except ImportError:
+        return max(1, (os.cpu_count() or 2) // 2)
+
+
+def inference_threads() -> int:
+    if INFERENCE_THREADS > 0:
+        return INFERENCE_THREADS
+    return max(1, physical_cores() // max(1, INFERENCE_WORKERS))
+
+
+class InstrumentedExecutor:
+    def __init__(self, name: str, workers: int, factory: Callable[[int], Executor]):
+        self.name = name
+        self.workers = workers
+        self.factory = factory
+        self.executor: Optional[Executor] = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def get_executor(self) -> Executor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = self.factory(self.workers)
+            return self.executor
+
+    def task_done(self, future: Future):
+        with self.lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, func: Callable, *args) -> Future:
+        executor = self.get_executor()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            with self.lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self.task_done)
+        return future
+
+    async def run(self, func: Callable, *args) -> Any:
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "in_flight": self.in_flight,
+                "queue_depth": max(0, self.in_flight - self.workers), "completed": self.completed,
+                "failed": self.failed}
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+inference_executor = InstrumentedExecutor("inference", INFERENCE_WORKERS,
+    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference"))
+io_executor = InstrumentedExecutor("io", IO_WORKERS,
+    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io"))
+parse_executor = InstrumentedExecutor("parse", PARSE_PROCESSES,
+    lambda workers: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')))
+
+
+async def warm_up_parse_pool():
+    await parse_executor.run(os.getpid)
+    return True
+
+
+def shutdown_executors():
+    for executor in (parse_executor, inference_executor, io_executor):
+        executor.shutdown()
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    stats = {executor.name: executor.get_stats() for executor in (inference_executor, io_executor, parse_executor)}
+    stats["inference"]["threads_per_worker"] = inference_threads()
+    return stats
+
+
+def collect_executor_metrics():
+    executors = (inference_executor, io_executor, parse_executor)
+    return [("executor_in_flight", "gauge", "Tasks submitted to an executor and not finished",
+             [({"executor": executor.name}, executor.in_flight) for executor in executors]),
+            ("executor_queue_depth", "gauge", "Tasks waiting for a free executor worker",
+             [({"executor": executor.name}, max(0, executor.in_flight - executor.workers)) for executor in executors]),
+            ("executor_tasks_total", "counter", "Finished executor tasks",
+             [({"executor": executor.name, "result": "completed"}, executor.completed) for executor in executors] +
+             [({"executor": executor.name, "result": "failed"}, executor.failed) for executor in executors])]
+
+
+register_collector(collect_executor_metrics)
@@ -0,0 +1,64 @@
+import html
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, Any, Optional
+from urllib.parse import urlencode
+
+from database import encode_history_cursor
+
+HISTORY_PAGE_HEAD = ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>История чатов</title>"
+                     "<style>table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:4px;"
+                     "vertical-align:top}td.content{white-space:pre-wrap}</style></head><body>"
+                     "<h1>История чатов</h1><table><tr><th>Время (UTC)</th><th>Пользователь</th><th>Роль</th>"
+                     "<th>Сообщение</th><th>Метрики</th></tr>")
+
+
+def format_metrics(metrics: Dict[str, Any]) -> str:
+    if not metrics:
+        return ""
+    return (f"фрагментов: {metrics.get('used_chunks', 'N/A')}, токенов контекста: "
+            f"{metrics.get('context_tokens', 'N/A')}, время: {metrics.get('generation_time', 'N/A')} с")
+
+
+def next_page_url(cursor: str, params: Dict[str, Any]) -> str:
+    query = {key: value.isoformat() if isinstance(value, datetime) else value
+             for key, value in params.items() if value is not None}
+    query["cursor"] = cursor
+    return f"/history?{urlencode(query)}"
+
+
+async def render_history_html(messages: AsyncIterator[Dict[str, Any]], limit: int,
+        params: Dict[str, Any]) -> AsyncIterator[str]:
+    yield HISTORY_PAGE_HEAD
+    count = 0
+    last_message: Optional[Dict[str, Any]] = None
+    async for message in messages:
+        count += 1
+        last_message = message
+        yield (f"<tr><td>{message['timestamp']:%Y-%m-%d %H:%M:%S}</td><td>{html.escape(str(message['user_id']))}</td>"
+               f"<td>{html.escape(message['role'])}</td><td class='content'>{html.escape(message['content'])}</td>"
+               f"<td>{html.escape(format_metrics(message.get('metrics')))}</td></tr>")
+    yield "</table>"
+
+    if count == 0:
+        yield "<p>Сообщений нет.</p>"
+    elif count == limit:
+        url = next_page_url(encode_history_cursor(last_message), params)
+        yield f"<p><a href='{html.escape(url, quote=True)}'>Следующая страница</a></p>"
+    yield "</body></html>"
+
+
+async def render_history_json(messages: AsyncIterator[Dict[str, Any]], limit: int) -> AsyncIterator[str]:
+    yield '{"messages": ['
+    count = 0
+    last_message: Optional[Dict[str, Any]] = None
+    async for message in messages:
+        item = {"id": str(message["_id"]), "user_id": message["user_id"], "role": message["role"],
+                "content": message["content"], "timestamp": message["timestamp"].isoformat(),
+                "metrics": message.get("metrics") or {}}
+        yield ("," if count else "") + json.dumps(item, ensure_ascii=False, default=str)
+        count += 1
+        last_message = message
+
+    next_cursor = encode_history_cursor(last_message) if count == limit else None
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
@@ -0,0 +1,73 @@
+from typing import Optional, Dict, Any
+
+import httpx
+
+from config import OPENAI_API_BASE, OPENAI_API_KEY, LLM_HTTP2, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, \
+    LLM_KEEPALIVE_EXPIRY, LLM_CONNECT_TIMEOUT, LLM_GENERATION_TIMEOUT
+
+llm_client: Optional[httpx.AsyncClient] = None
+connection_stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0}
+
+
+async def trace_connections(event_name: str, info: Dict[str, Any]):
+    if event_name == "connection.connect_tcp.complete":
+        connection_stats["new_connections"] += 1
+    elif event_name == "connection.start_tls.complete":
+        connection_stats["tls_handshakes"] += 1
+
+
+def create_llm_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+    return httpx.AsyncClient(base_url=OPENAI_API_BASE or "",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
+        timeout=httpx.Timeout(LLM_GENERATION_TIMEOUT, connect=LLM_CONNECT_TIMEOUT), limits=limits, http2=LLM_HTTP2)
+
+
+async def initialize_http_clients():
+    global llm_client
+
+    try:
+        llm_client = create_llm_client()
+        return True
+    except Exception as e:
+        print(f"Error initializing HTTP clients: {e}")
+        return False
+
+
+async def close_http_clients():
+    global llm_client
+
+    if llm_client is not None:
+        try:
+            await llm_client.aclose()
+        except Exception as e:
+            print(f"Error closing LLM HTTP client: {e}")
+        llm_client = None
+
+
+def get_llm_client() -> httpx.AsyncClient:
+    global llm_client
+
+    if llm_client is None:
+        llm_client = create_llm_client()
+    return llm_client
+
+
+async def post_llm(path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+    connection_stats["requests"] += 1
+    return await get_llm_client().post(path, json=payload,
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT, extensions={"trace": trace_connections})
+
+
+def stream_llm(path: str, payload: Dict[str, Any], timeout: Optional[float] = None):
+    connection_stats["requests"] += 1
+    return get_llm_client().stream("POST", path, json=payload,
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT, extensions={"trace": trace_connections})
+
+
+def get_http_client_stats() -> Dict[str, Any]:
+    requests = connection_stats["requests"]
+    reused = max(requests - connection_stats["new_connections"], 0)
+    return {**connection_stats, "reused_connections": reused,
+            "reuse_ratio": round(reused / requests, 4) if requests else 0.0, "http2": LLM_HTTP2}
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+from typing import List, Union, Callable
+
+import numpy as np
+
+from config import INFERENCE_BACKEND, ONNX_QUANTIZE, ONNX_CACHE_DIR, ONNX_INTRA_OP_THREADS
+from executors import inference_threads
+
+
+def backend_tag() -> str:
+    if INFERENCE_BACKEND != 'onnx':
+        return 'torch'
+    return 'onnx-int8' if ONNX_QUANTIZE else 'onnx'
+
+
+def artifact_dir(model_name: str, kind: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name), kind)
+
+
+def create_session(model_path: str):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS if ONNX_INTRA_OP_THREADS > 0 else inference_threads()
+    return ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+
+def export_onnx(module, forward: Callable, tokenizer, input_names_sample: dict, output_name: str, model_path: str):
+    import torch
+
+    class ExportWrapper(torch.nn.Module):
+        def __init__(self, wrapped, input_names):
+            super().__init__()
+            self.wrapped = wrapped
+            self.input_names = input_names
+
+        def forward(self, *inputs):
+            return forward(self.wrapped, dict(zip(self.input_names, inputs)))
+
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in input_names_sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes[output_name] = {0: 'batch'}
+
+    with torch.no_grad():
+        torch.onnx.export(ExportWrapper(module, input_names).eval(),
+            tuple(input_names_sample[name] for name in input_names), model_path, input_names=input_names,
+            output_names=[output_name], dynamic_axes=dynamic_axes, opset_version=14, do_constant_folding=True)
+    tokenizer.save_pretrained(os.path.dirname(model_path))
+
+
+def ensure_artifact(model_name: str, kind: str, export: Callable[[str], dict], quantize: bool = ONNX_QUANTIZE) -> str:
+    directory = artifact_dir(model_name, kind)
+    fp32_path = os.path.join(directory, 'model.onnx')
+    meta_path = os.path.join(directory, 'meta.json')
+
+    if not os.path.exists(fp32_path) or not os.path.exists(meta_path):
+        os.makedirs(directory, exist_ok=True)
+        print(f"Exporting '{model_name}' ({kind}) to ONNX at '{directory}'")
+        meta = export(fp32_path)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = os.path.join(directory, 'model.int8.onnx')
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"Quantizing '{model_name}' ({kind}) to int8")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def load_meta(model_path: str) -> dict:
+    with open(os.path.join(os.path.dirname(model_path), 'meta.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class OnnxEmbeddingModel:
+    def __init__(self, model_path: str):
+        from transformers import AutoTokenizer
+
+        self.session = create_session(model_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+        self.max_seq_length = load_meta(model_path)['max_seq_length']
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single_input = isinstance(sentences, str)
+        texts = [sentences] if single_input else list(sentences)
+        outputs = []
+
+        for start in range(0, len(texts), batch_size):
+            features = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: features[name].astype(np.int64) for name in self.input_names}
+            outputs.append(self.session.run(['sentence_embedding'], feed)[0])
+
+        embeddings = np.concatenate(outputs).astype(np.float32) if outputs else np.zeros((0, 0), np.float32)
+        return embeddings[0] if single_input else embeddings
+
+
+class OnnxCrossEncoder:
+    def __init__(self, model_path: str):
+        from transformers import AutoTokenizer
+
+        self.session = create_session(model_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+        meta = load_meta(model_path)
+        self.max_length = meta['max_length']
+        self.num_labels = meta['num_labels']
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def predict(self, sentences: List[List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        outputs = []
+
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            features = self.tokenizer([pair[0] for pair in batch], [pair[1] for pair in batch], padding=True,
+                truncation='longest_first', max_length=self.max_length, return_tensors='np')
+            feed = {name: features[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(['logits'], feed)[0]
+            outputs.append(1 / (1 + np.exp(-logits[:, 0])) if self.num_labels == 1 else logits)
+
+        return np.concatenate(outputs) if outputs else np.zeros(0, np.float32)
+
+
+def export_embedding_model(model_name: str, model_path: str) -> dict:
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    sample = model.tokenizer(["Пример текста для экспорта модели"], return_tensors='pt', padding=True)
+
+    export_onnx(model, lambda module, features: module(features)['sentence_embedding'], model.tokenizer, sample,
+        'sentence_embedding', model_path)
+    return {'max_seq_length': model.max_seq_length}
+
+
+def export_reranker_model(model_name: str, model_path: str) -> dict:
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name, device='cpu')
+    sample = model.tokenizer(["Пример вопроса"], ["Пример фрагмента документа"], return_tensors='pt', padding=True)
+
+    export_onnx(model.model, lambda module, features: module(**features).logits, model.tokenizer, sample, 'logits',
+        model_path)
+    return {'max_length': model.max_length or model.tokenizer.model_max_length,
+            'num_labels': model.config.num_labels}
+
+
+def configure_torch_threads():
+    import torch
+
+    if torch.get_num_threads() != inference_threads():
+        torch.set_num_threads(inference_threads())
+
+
+def load_embedding_model(model_name: str):
+    if INFERENCE_BACKEND != 'onnx':
+        from sentence_transformers import SentenceTransformer
+
+        configure_torch_threads()
+
+        return SentenceTransformer(model_name, device='cpu')
+
+    model_path = ensure_artifact(model_name, 'embedding',
+        lambda path: export_embedding_model(model_name, path))
+    return OnnxEmbeddingModel(model_path)
+
+
+def load_reranker_model(model_name: str):
+    if INFERENCE_BACKEND != 'onnx':
+        from sentence_transformers import CrossEncoder
+
+        configure_torch_threads()
+        return CrossEncoder(model_name, device='cpu')
+
+    model_path = ensure_artifact(model_name, 'reranker',
+        lambda path: export_reranker_model(model_name, path))
+    return OnnxCrossEncoder(model_path)
@@ -0,0 +1,249 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Dict, Any, AsyncIterator, Set, Tuple
+
+from answer_cache import invalidate_cached_answers
+from config import EMBEDDING_BATCH_SIZE, PDF_SLOW_PAGE_SECONDS
+from database import create_document_record, activate_document_record, delete_document_record, \
+    find_active_document_by_filename, get_document_chunk_hashes, add_document_chunk_hashes, \
+    delete_document_chunk_hashes, find_document, get_term_statistics
+from document_processing import stream_document_chunks
+from embeddings import generate_embeddings_batch
+from executors import io_executor
+from metrics import ingestion_stage_seconds, ingestion_chunks_total, ingestion_documents_total
+from sparse import term_counts, document_sparse_vector
+from utils import chunk_content_hash, count_tokens_batch
+from vector_store import upsert_vectors, delete_document_vectors
+
+
+class EmptyDocumentError(Exception):
+    def __init__(self, filename: str):
+        super().__init__(f"В файле '{filename}' не найден текст: документ пуст или содержит только изображения "
+                         "без текстового слоя")
+        self.filename = filename
+
+
+@dataclass
+class IngestionProgress:
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+    parse_seconds: float = 0.0
+    slowest_page: Optional[int] = None
+    slowest_page_seconds: float = 0.0
+    slow_pages: List[Dict[str, float]] = field(default_factory=list)
+
+    def page_parsed(self, page_number: int, elapsed: float):
+        self.pages_parsed += 1
+        self.parse_seconds += elapsed
+        ingestion_stage_seconds.observe(elapsed, stage="parse_page")
+        if elapsed > self.slowest_page_seconds:
+            self.slowest_page = page_number
+            self.slowest_page_seconds = elapsed
+        if elapsed > PDF_SLOW_PAGE_SECONDS:
+            self.slow_pages.append({"page": page_number, "seconds": round(elapsed, 3)})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def analyze_chunks(chunks: List[str], avg_chunk_terms: Optional[float]) -> List[Dict[str, Any]]:
+    analyses = []
+    for chunk, token_count in zip(chunks, count_tokens_batch(chunks)):
+        counts = term_counts(chunk)
+        analyses.append({"token_count": token_count, "term_ids": sorted(counts), "term_count": sum(counts.values()),
+                         "sparse_vector": document_sparse_vector(counts, avg_chunk_terms)})
+    return analyses
+
+
+def build_points(doc_id: str, filename: str, chunks: List[str], content_hashes: List[str],
+        vectors: List[List[float]], analyses: List[Dict[str, Any]], start_index: int) -> List[dict]:
+    return [{"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:{content_hash}")), "vector": vector,
+             "sparse_vector": analysis["sparse_vector"],
+             "payload": {"text": chunk, "document_mongo_id": doc_id, "filename": filename,
+                         "chunk_index": start_index + i, "content_hash": content_hash,
+                         "token_count": analysis["token_count"]}}
+            for i, (chunk, content_hash, vector, analysis)
+            in enumerate(zip(chunks, content_hashes, vectors, analyses))]
+
+
+def build_chunk_rows(content_hashes: List[str], analyses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"content_hash": content_hash, "term_ids": analysis["term_ids"], "term_count": analysis["term_count"]}
+            for content_hash, analysis in zip(content_hashes, analyses)]
+
+
+async def timed_stage(stage: str, awaitable):
+    with ingestion_stage_seconds.time(stage=stage):
+        return await awaitable
+
+
+async def next_batch(batches: AsyncIterator[List[str]]) -> Optional[List[str]]:
+    return await anext(batches, None)
+
+
+async def embed_and_upsert_chunks(doc_id: str, filename: str, batches: AsyncIterator[List[str]],
+        known_hashes: Set[str], added_hashes: Set[str], progress: Optional[IngestionProgress] = None,
+        avg_chunk_terms: Optional[float] = None) -> Optional[Set[str]]:
+    progress = progress or IngestionProgress()
+    seen_hashes: Set[str] = set()
+    pending_upsert: Optional[asyncio.Task] = None
+    pending_rows: List[Dict[str, Any]] = []
+    next_batch_task: Optional[asyncio.Task] = None
+    chunk_index = 0
+
+    async def finish_pending_upsert() -> bool:
+        if pending_upsert is None:
+            return True
+        if not await pending_upsert or not await add_document_chunk_hashes(doc_id, pending_rows):
+            return False
+        progress.chunks_upserted += len(pending_rows)
+        return True
+
+    try:
+        batch = await next_batch(batches)
+        while batch is not None:
+            progress.chunks_total += len(batch)
+            next_batch_task = asyncio.create_task(next_batch(batches))
+
+            new_chunks, new_hashes = [], []
+            for chunk in batch:
+                content_hash = chunk_content_hash(chunk)
+                if content_hash in seen_hashes:
+                    continue
+                seen_hashes.add(content_hash)
+                if content_hash in known_hashes:
+                    progress.chunks_reused += 1
+                else:
+                    new_chunks.append(chunk)
+                    new_hashes.append(content_hash)
+
+            vectors, analyses = await asyncio.gather(timed_stage("embed", generate_embeddings_batch(new_chunks)),
+                timed_stage("analyze", io_executor.run(analyze_chunks, new_chunks, avg_chunk_terms))) \
+                if new_chunks else ([], [])
+            if vectors is None:
+                return None
+            progress.chunks_embedded += len(new_chunks)
+            ingestion_chunks_total.inc(len(new_chunks), kind="embedded")
+            ingestion_chunks_total.inc(len(batch) - len(new_chunks), kind="skipped")
+
+            following_batch = await next_batch_task
+            if not await finish_pending_upsert():
+                return None
+            pending_upsert = None
+
+            if new_chunks:
+                added_hashes.update(new_hashes)
+                points = build_points(doc_id, filename, new_chunks, new_hashes, vectors, analyses, chunk_index)
+                pending_upsert = asyncio.create_task(timed_stage("upsert",
+                    upsert_vectors(points, wait=following_batch is None)))
+                pending_rows = build_chunk_rows(new_hashes, analyses)
+            chunk_index += len(batch)
+            batch = following_batch
+
+        if not await finish_pending_upsert():
+            return None
+        pending_upsert = None
+        return seen_hashes
+    finally:
+        if next_batch_task is not None and not next_batch_task.done():
+            await asyncio.gather(next_batch_task, return_exceptions=True)
+        if pending_upsert is not None and not pending_upsert.done():
+            pending_upsert.cancel()
+
+
+async def ingest_document(file_path: str, filename: str, progress: Optional[IngestionProgress] = None) -> \
+        Optional[Dict[str, Any]]:
+    try:
+        with ingestion_stage_seconds.time(stage="document"):
+            result = await ingest_document_stages(file_path, filename, progress or IngestionProgress())
+    except EmptyDocumentError:
+        ingestion_documents_total.inc(status="empty")
+        raise
+    ingestion_documents_total.inc(status="completed" if result is not None else "failed")
+    return result
+
+
+async def ingest_document_stages(file_path: str, filename: str, progress: IngestionProgress) -> \
+        Optional[Dict[str, Any]]:
+
+    known_hashes: Set[str] = set()
+    replaced_doc_id = None
+    existing_doc = await find_active_document_by_filename(filename)
+    if existing_doc:
+        known_hashes = await get_document_chunk_hashes(existing_doc['_id'])
+        if known_hashes is None:
+            return None
+        if known_hashes or not existing_doc.get('chunk_count'):
+            doc_id = existing_doc['_id']
+        else:
+            replaced_doc_id = existing_doc['_id']
+            doc_id = None
+    else:
+        doc_id = None
+
+    is_new_document = doc_id is None
+    if is_new_document:
+        doc_id = await create_document_record(filename)
+        if doc_id is None:
+            return None
+
+    added_hashes: Set[str] = set()
+    _, corpus_chunks, corpus_terms = await get_term_statistics([])
+    avg_chunk_terms = corpus_terms / corpus_chunks if corpus_chunks > 0 and corpus_terms > 0 else None
+    batches = stream_document_chunks(file_path, filename, EMBEDDING_BATCH_SIZE, on_page=progress.page_parsed)
+    try:
+        seen_hashes = await embed_and_upsert_chunks(doc_id, filename, batches, known_hashes, added_hashes, progress,
+            avg_chunk_terms)
+    except Exception as e:
+        print(f"Error processing document '{filename}': {e}")
+        seen_hashes = None
+    finally:
+        await batches.aclose()
+
+    if not seen_hashes:
+        print(f"Error ingesting '{filename}', rolling back document {doc_id}")
+        if is_new_document:
+            await delete_document_vectors(doc_id)
+            await delete_document_chunk_hashes(doc_id)
+            await delete_document_record(doc_id)
+        else:
+            await delete_document_vectors(doc_id, list(added_hashes))
+            await delete_document_chunk_hashes(doc_id, list(added_hashes))
+        if seen_hashes is not None and not progress.chunks_total:
+            raise EmptyDocumentError(filename)
+        return None
+
+    vanished_hashes = list(known_hashes - seen_hashes)
+    if vanished_hashes:
+        if not await delete_document_vectors(doc_id, vanished_hashes):
+            print(f"Error deleting {len(vanished_hashes)} vanished chunks of document {doc_id}")
+        await delete_document_chunk_hashes(doc_id, vanished_hashes)
+    progress.chunks_deleted = len(vanished_hashes)
+    ingestion_chunks_total.inc(len(vanished_hashes), kind="deleted")
+
+    if replaced_doc_id:
+        await delete_document_vectors(replaced_doc_id)
+        await delete_document_record(replaced_doc_id)
+
+    await activate_document_record(doc_id, len(seen_hashes))
+    await invalidate_cached_answers([doc_id] + ([replaced_doc_id] if replaced_doc_id else []))
+    return {"document_id": doc_id, "chunks": len(seen_hashes), "chunks_embedded": len(added_hashes),
+            "chunks_reused": progress.chunks_reused, "chunks_deleted": len(vanished_hashes)}
+
+
+async def delete_document(doc_id_or_filename: str) -> Tuple[bool, str]:
+    doc = await find_document(doc_id_or_filename)
+    if not doc:
+        return False, f"Документ '{doc_id_or_filename}' не найден."
+
+    doc_id = doc['_id']
+    if not await delete_document_vectors(doc_id):
+        return False, f"Не удалось удалить фрагменты документа '{doc['filename']}'."
+    await delete_document_chunk_hashes(doc_id)
+    await delete_document_record(doc_id)
+    await invalidate_cached_answers([doc_id])
+    return True, f"Документ '{doc['filename']}' удалён из базы знаний."
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Any, List
+
+from config import INGESTION_WORKERS, INGESTION_QUEUE_SIZE, INGESTION_JOB_TTL_SECONDS
+from ingestion import ingest_document, IngestionProgress
+
+job_queue: Optional[asyncio.Queue] = None
+workers: List[asyncio.Task] = []
+jobs: Dict[str, "IngestionJob"] = {}
+filename_locks: Dict[str, asyncio.Lock] = {}
+filename_lock_users: Dict[str, int] = {}
+
+
+@dataclass
+class IngestionJob:
+    file_path: str
+    filename: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    progress: IngestionProgress = field(default_factory=IngestionProgress)
+    document_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"job_id": self.id, "filename": self.filename, "status": self.status,
+                "progress": self.progress.to_dict(), "document_id": self.document_id, "error": self.error,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at}
+
+
+def remove_upload_file(file_path: str):
+    if os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            print(f"Error removing uploaded file '{file_path}': {e}")
+
+
+@asynccontextmanager
+async def filename_lock(filename: str):
+    # Jobs for the same filename diff against the same stored chunk hashes, so they must not overlap.
+    lock = filename_locks.setdefault(filename, asyncio.Lock())
+    filename_lock_users[filename] = filename_lock_users.get(filename, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        filename_lock_users[filename] -= 1
+        if not filename_lock_users[filename]:
+            del filename_lock_users[filename]
+            del filename_locks[filename]
+
+
+async def run_job(job: IngestionJob):
+    try:
+        async with filename_lock(job.filename):
+            job.status = "running"
+            job.started_at = time.time()
+            result = await ingest_document(job.file_path, job.filename, job.progress)
+        if result:
+            job.document_id = result["document_id"]
+            job.status = "completed"
+        else:
+            job.error = "Ошибка обработки файла"
+            job.status = "failed"
+    except Exception as e:
+        print(f"Error running ingestion job {job.id}: {e}")
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+        remove_upload_file(job.file_path)
+
+
+async def worker_loop():
+    while True:
+        job = await job_queue.get()
+        try:
+            await run_job(job)
+        finally:
+            job_queue.task_done()
+
+
+def prune_finished_jobs():
+    expire_before = time.time() - INGESTION_JOB_TTL_SECONDS
+    for job_id in [job_id for job_id, job in jobs.items() if job.finished_at and job.finished_at < expire_before]:
+        del jobs[job_id]
+
+
+async def start_ingestion_workers():
+    global job_queue
+
+    job_queue = asyncio.Queue(maxsize=INGESTION_QUEUE_SIZE)
+    for _ in range(INGESTION_WORKERS):
+        workers.append(asyncio.create_task(worker_loop()))
+
+
+async def stop_ingestion_workers():
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    workers.clear()
+
+    for job in jobs.values():
+        if job.status == "queued":
+            job.status = "failed"
+            job.error = "Сервис остановлен до начала обработки"
+            remove_upload_file(job.file_path)
+
+
+def submit_ingestion_job(file_path: str, filename: str) -> Optional[IngestionJob]:
+    if job_queue is None:
+        return None
+
+    prune_finished_jobs()
+    job = IngestionJob(file_path=file_path, filename=filename)
+    try:
+        job_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        return None
+    jobs[job.id] = job
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestionJob]:
+    return jobs.get(job_id)
@@ -1,24 +1,28 @@
-from typing import List, Optional, Dict, Any
+import json
+from typing import List, Optional, Dict, Any, AsyncIterator
 
-import httpx
+from config import OPENAI_MODEL_NAME, VALID_CATEGORIES, STAGE_TIMEOUT_CLASSIFY, STAGE_TIMEOUT_ENRICH
+from http_client import post_llm, stream_llm
 
-from config import OPENAI_API_BASE, OPENAI_API_KEY, OPENAI_MODEL_NAME, VALID_CATEGORIES
 
-
-async def make_llm_request(prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None) -> \
-        Optional[str]:
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+def build_llm_payload(prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]],
+        stream: bool) -> Dict[str, Any]:
     messages_payload = [{"role": "user", "content": prompt}]
     payload: Dict[str, Any] = {"model": OPENAI_MODEL_NAME, "messages": messages_payload, "max_tokens": max_tokens,
-                               "temperature": temperature, "stream": False}
+                               "temperature": temperature, "stream": stream}
     if stop:
         payload["stop"] = stop
+    return payload
+
+
+async def make_llm_request(prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None,
+        timeout: Optional[float] = None) -> Optional[str]:
+    payload = build_llm_payload(prompt, max_tokens, temperature, stop, stream=False)
 
     try:
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.post(f"{OPENAI_API_BASE}/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            llm_response_data = response.json()
+        response = await post_llm("/chat/completions", payload, timeout=timeout)
+        response.raise_for_status()
+        llm_response_data = response.json()
         if llm_response_data and 'choices' in llm_response_data and llm_response_data['choices']:
             choice = llm_response_data['choices'][0]
             if 'message' in choice and isinstance(choice['message'], dict) and 'content' in choice['message']:
@@ -31,11 +35,39 @@ async def make_llm_request(prompt: str, max_tokens: int, temperature: float, sto
         return None
 
 
+async def stream_llm_request(prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None,
+        timeout: Optional[float] = None) -> AsyncIterator[str]:
+    payload = build_llm_payload(prompt, max_tokens, temperature, stop, stream=True)
+
+    async with stream_llm("/chat/completions", payload, timeout=timeout) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if not chunk.get('choices'):
+                continue
+            choice = chunk['choices'][0]
+            delta = choice.get('delta') or {}
+            content = delta.get('content') if isinstance(delta, dict) else None
+            if content is None:
+                content = choice.get('text')
+            if content:
+                yield content
+
+
 async def classify_question_llm(question: str) -> str:
     prompt = f"""You are an expert in question classification. Determine the most appropriate category for the following employee question. Choose ONLY ONE category from the list below and write ONLY ITS NAME in your response. DO NOT ADD any other words or explanations.\n\nCategories and their descriptions:\n1. Lookup: Searching for specific information.\n2. Calculation: Performing calculations.\n\nEmployee question: \"{question}\"\nCategory:"""
     default_category = "Lookup"
     try:
-        result = await make_llm_request(prompt, max_tokens=20, temperature=0.0, stop=["\n", "."])
+        result = await make_llm_request(prompt, max_tokens=20, temperature=0.0, stop=["\n", "."],
+            timeout=STAGE_TIMEOUT_CLASSIFY)
         if result:
             cleaned = result.strip().replace('"', '').replace("'", "").replace('*', '').replace('.', '').split('\n')[
                 0].strip()
@@ -49,7 +81,8 @@ async def classify_question_llm(question: str) -> str:
 async def enrich_query_with_llm(question: str) -> str:
     prompt = f"You are an expert in information search. Transform the user's question into an effective search query. Please provide the response in Russian.\nUser question: \"{question}\"\nEffective search query:"
     try:
-        enriched = await make_llm_request(prompt, max_tokens=60, temperature=0.0, stop=["\n"])
+        enriched = await make_llm_request(prompt, max_tokens=60, temperature=0.0, stop=["\n"],
+            timeout=STAGE_TIMEOUT_ENRICH)
         if enriched and len(enriched) > 3:
             cleaned = enriched.strip().replace('"', '').replace("'", "").replace("Improved query:", "").strip()
             if cleaned.lower() != question.lower():
@@ -0,0 +1,263 @@
+import json
+import os
+import threading
+from typing import List, Optional, Dict, Any, Tuple
+
+import numpy as np
+from qdrant_client.http.models import ScoredPoint
+
+
+def condition_matches(payload: Dict[str, Any], condition) -> bool:
+    value = payload.get(condition.key)
+    match = condition.match
+    if getattr(match, 'any', None) is not None:
+        return value in match.any
+    return value == match.value
+
+
+class LocalVectorIndex:
+    def __init__(self, index_dir: str, dim: int, initial_capacity: int, compact_ratio: float):
+        self.index_dir = index_dir
+        self.dim = dim
+        self.initial_capacity = max(1, initial_capacity)
+        self.compact_ratio = compact_ratio
+        self.lock = threading.Lock()
+
+        self.meta_path = os.path.join(index_dir, 'meta.json')
+        self.vectors_path = os.path.join(index_dir, 'vectors.npy')
+        self.points_path = os.path.join(index_dir, 'points.jsonl')
+        self.vectors: Optional[np.memmap] = None
+        self.points_file = None
+        self.rows = 0
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids: List[Optional[str]] = []
+        self.payloads: List[Optional[Dict[str, Any]]] = []
+        self.sparse_rows: Dict[int, Tuple[List[int], List[float]]] = {}
+        self.postings: Dict[int, Dict[int, float]] = {}
+        self.id_rows: Dict[str, int] = {}
+
+        os.makedirs(index_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        meta = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        if meta and meta.get('dim') != self.dim:
+            raise ValueError(f"Local vector index at '{self.index_dir}' has dimension {meta.get('dim')}, "
+                             f"expected {self.dim}")
+        if meta.get('compacting'):
+            self.finish_compaction()
+
+        if os.path.exists(self.vectors_path):
+            self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+        else:
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode='w+', dtype=np.float32,
+                shape=(self.initial_capacity, self.dim))
+        self.alive = np.zeros(self.vectors.shape[0], dtype=bool)
+        self.ids = [None] * self.vectors.shape[0]
+        self.payloads = [None] * self.vectors.shape[0]
+
+        if os.path.exists(self.points_path):
+            with open(self.points_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record['op'] == 'upsert':
+                        self.set_row(record['row'], record['id'], record['payload'], record.get('sparse'))
+                    else:
+                        self.clear_row(record['row'])
+        self.points_file = open(self.points_path, 'a', encoding='utf-8')
+        self.write_meta()
+
+    def write_meta(self, compacting: bool = False):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'compacting': compacting}, f)
+
+    def set_row(self, row: int, point_id: str, payload: Optional[Dict[str, Any]], sparse: Optional[list]):
+        self.alive[row] = True
+        self.ids[row] = point_id
+        self.payloads[row] = payload or {}
+        self.id_rows[point_id] = row
+        self.rows = max(self.rows, row + 1)
+        if sparse:
+            self.sparse_rows[row] = (sparse[0], sparse[1])
+            for index, value in zip(sparse[0], sparse[1]):
+                self.postings.setdefault(index, {})[row] = value
+
+    def clear_row(self, row: int):
+        if not self.alive[row]:
+            return
+        self.alive[row] = False
+        if self.id_rows.get(self.ids[row]) == row:
+            del self.id_rows[self.ids[row]]
+        self.ids[row] = None
+        self.payloads[row] = None
+        for index in self.sparse_rows.pop(row, ([], []))[0]:
+            postings = self.postings.get(index)
+            if postings is not None:
+                postings.pop(row, None)
+                if not postings:
+                    del self.postings[index]
+
+    def ensure_capacity(self, rows: int):
+        capacity = max(1, self.vectors.shape[0])
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+
+        tmp_path = self.vectors_path + '.tmp'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, self.dim))
+        grown[:self.rows] = self.vectors[:self.rows]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+        extra = capacity - len(self.alive)
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.ids.extend([None] * extra)
+        self.payloads.extend([None] * extra)
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def upsert(self, points: List[dict]):
+        if not points:
+            return
+        with self.lock:
+            self.ensure_capacity(self.rows + len(points))
+            vectors = self.normalize([point["vector"] for point in points])
+            start = self.rows
+            self.vectors[start:start + len(points)] = vectors
+            self.vectors.flush()
+
+            for offset, point in enumerate(points):
+                row = start + offset
+                old_row = self.id_rows.get(point["id"])
+                if old_row is not None:
+                    self.clear_row(old_row)
+                    self.points_file.write(json.dumps({"op": "delete", "row": old_row}) + "\n")
+
+                sparse = point.get("sparse_vector")
+                sparse = [list(sparse[0]), list(sparse[1])] if sparse else None
+                self.set_row(row, point["id"], point.get("payload"), sparse)
+                self.points_file.write(json.dumps({"op": "upsert", "row": row, "id": point["id"],
+                    "payload": point.get("payload"), "sparse": sparse}, ensure_ascii=False, default=str) + "\n")
+            self.points_file.flush()
+            self.compact_if_needed()
+
+    def delete(self, must: List) -> int:
+        with self.lock:
+            rows = [row for row in np.flatnonzero(self.alive[:self.rows])
+                    if all(condition_matches(self.payloads[row], condition) for condition in must)]
+            for row in rows:
+                self.clear_row(int(row))
+                self.points_file.write(json.dumps({"op": "delete", "row": int(row)}) + "\n")
+            self.points_file.flush()
+            self.compact_if_needed()
+            return len(rows)
+
+    def candidate_mask(self, should: Optional[List]) -> np.ndarray:
+        mask = self.alive[:self.rows].copy()
+        if should:
+            for row in np.flatnonzero(mask):
+                mask[row] = any(condition_matches(self.payloads[row], condition) for condition in should)
+        return mask
+
+    def to_scored_points(self, rows, scores) -> List[ScoredPoint]:
+        return [ScoredPoint(id=self.ids[row], version=0, score=float(score), payload=self.payloads[row])
+                for row, score in zip(rows, scores)]
+
+    def search(self, query_vectors: List[List[float]], limit: int, score_threshold: Optional[float] = None,
+            should: Optional[List] = None) -> List[List[ScoredPoint]]:
+        with self.lock:
+            mask = self.candidate_mask(should)
+            candidates = int(mask.sum())
+            if candidates == 0 or limit <= 0:
+                return [[] for _ in query_vectors]
+
+            scores = self.normalize(query_vectors) @ self.vectors[:self.rows].T
+            scores[:, ~mask] = -np.inf
+            if score_threshold is not None:
+                scores[scores < score_threshold] = -np.inf
+
+            k = min(limit, candidates)
+            results = []
+            for query_scores in scores:
+                top = np.argpartition(-query_scores, k - 1)[:k]
+                top = top[np.argsort(-query_scores[top])]
+                top = top[np.isfinite(query_scores[top])]
+                results.append(self.to_scored_points(top, query_scores[top]))
+            return results
+
+    def search_sparse(self, indices: List[int], values: List[float], limit: int) -> List[ScoredPoint]:
+        with self.lock:
+            scores: Dict[int, float] = {}
+            for index, value in zip(indices, values):
+                for row, weight in self.postings.get(index, {}).items():
+                    scores[row] = scores.get(row, 0.0) + value * weight
+            rows = sorted(scores, key=scores.get, reverse=True)[:limit]
+            return self.to_scored_points(rows, [scores[row] for row in rows])
+
+    def compact_if_needed(self):
+        live = int(self.alive[:self.rows].sum())
+        deleted = self.rows - live
+        if deleted == 0 or deleted < self.rows * self.compact_ratio:
+            return
+
+        rows = np.flatnonzero(self.alive[:self.rows])
+        capacity = max(self.initial_capacity, self.vectors.shape[0])
+        compacted = np.lib.format.open_memmap(self.vectors_path + '.tmp', mode='w+', dtype=np.float32,
+            shape=(capacity, self.dim))
+        compacted[:live] = self.vectors[rows]
+        compacted.flush()
+        del compacted
+        with open(self.points_path + '.tmp', 'w', encoding='utf-8') as f:
+            for new_row, row in enumerate(rows):
+                sparse = self.sparse_rows.get(int(row))
+                f.write(json.dumps({"op": "upsert", "row": new_row, "id": self.ids[row],
+                    "payload": self.payloads[row], "sparse": list(sparse) if sparse else None},
+                    ensure_ascii=False, default=str) + "\n")
+
+        self.points_file.close()
+        self.vectors = None
+        self.write_meta(compacting=True)
+        self.finish_compaction()
+        self.reset()
+        self.load()
+        print(f"Compacted local vector index at '{self.index_dir}': removed {deleted} deleted points")
+
+    def finish_compaction(self):
+        for path in (self.vectors_path, self.points_path):
+            if os.path.exists(path + '.tmp'):
+                os.replace(path + '.tmp', path)
+        self.write_meta()
+
+    def reset(self):
+        self.rows = 0
+        self.sparse_rows.clear()
+        self.postings.clear()
+        self.id_rows.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        live = int(self.alive[:self.rows].sum())
+        return {"points": live, "deleted": self.rows - live, "capacity": int(self.vectors.shape[0])}
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.vectors is not None:
+                    self.vectors.flush()
+                if self.points_file is not None:
+                    self.points_file.close()
+                    self.points_file = None
+            except Exception as e:
+                print(f"Error closing local vector index: {e}")
@@ -0,0 +1,145 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Callable, Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(zip(self.label_names, key)))} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.lock:
+            counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, counts in sorted(self.counts.items()):
+                labels = dict(zip(self.label_names, key))
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(self.sums[key])}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+metrics: List = []
+collectors: List[Callable[[], List[Family]]] = []
+
+
+def counter(name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, documentation, label_names)
+    metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, documentation, label_names, buckets)
+    metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Callable[[], List[Family]]):
+    collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collector in collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+            continue
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+rag_stage_seconds = histogram("rag_stage_seconds", "Duration of RAG pipeline stages", ["stage"])
+rag_request_seconds = histogram("rag_request_seconds", "End-to-end duration of /ask requests", ["outcome"])
+rag_time_to_first_token_seconds = histogram("rag_time_to_first_token_seconds",
+    "Time until the first streamed answer token")
+rag_requests_total = counter("rag_requests_total", "Answered /ask requests", ["outcome"])
+rag_stage_fallbacks_total = counter("rag_stage_fallbacks_total", "RAG stages that used their fallback", ["stage"])
+rag_context_tokens = histogram("rag_context_tokens", "Context tokens packed into the prompt",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+ingestion_stage_seconds = histogram("ingestion_stage_seconds", "Duration of document ingestion stages", ["stage"])
+ingestion_chunks_total = counter("ingestion_chunks_total", "Chunks handled during ingestion", ["kind"])
+ingestion_documents_total = counter("ingestion_documents_total", "Ingested documents by result", ["status"])
+
+
+def observe_stage_timings(timings: Dict[str, float], fallbacks: Sequence[str]):
+    for stage, seconds in timings.items():
+        rag_stage_seconds.observe(seconds, stage=stage)
+    for stage in fallbacks:
+        rag_stage_fallbacks_total.inc(stage=stage)
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from pydantic import BaseModel, Field
 
@@ -12,6 +12,7 @@ class RAGMetrics(BaseModel):
     average_relevance_score: float
     context_chunks: List[str]
     qdrant_filters: List[str]
+    stage_timings: Dict[str, float] = {}
 
     class Config:
         from_attributes = True
@@ -39,3 +40,28 @@ class DeleteResponse(BaseModel):
 class ClearHistoryResponse(BaseModel):
     success: bool = Field(..., description="Статус успешности операции")
     message: str = Field(..., description="Сообщение о результате операции")
+
+
+class JobProgress(BaseModel):
+    pages_parsed: int = Field(..., description="Обработано страниц")
+    chunks_total: int = Field(..., description="Всего фрагментов")
+    chunks_embedded: int = Field(..., description="Фрагментов с эмбеддингами")
+    chunks_upserted: int = Field(..., description="Фрагментов записано в векторное хранилище")
+    chunks_reused: int = Field(..., description="Неизменённых фрагментов, взятых из предыдущей версии")
+    chunks_deleted: int = Field(..., description="Удалённых фрагментов предыдущей версии")
+    parse_seconds: float = Field(..., description="Суммарное время извлечения текста страниц")
+    slowest_page: Optional[int] = Field(None, description="Номер самой медленной страницы")
+    slowest_page_seconds: float = Field(..., description="Время извлечения самой медленной страницы")
+    slow_pages: List[Dict[str, float]] = Field(..., description="Страницы, превысившие порог времени извлечения")
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str = Field(..., description="Идентификатор задачи загрузки")
+    filename: str = Field(..., description="Имя загружаемого файла")
+    status: str = Field(..., description="Статус задачи: queued, running, completed, failed")
+    progress: JobProgress = Field(..., description="Прогресс обработки документа")
+    document_id: Optional[str] = Field(None, description="ID документа в базе знаний")
+    error: Optional[str] = Field(None, description="Описание ошибки")
+    created_at: float = Field(..., description="Время постановки в очередь")
+    started_at: Optional[float] = Field(None, description="Время начала обработки")
+    finished_at: Optional[float] = Field(None, description="Время завершения обработки")
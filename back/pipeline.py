@@ -0,0 +1,72 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class Stage:
+    name: str
+    func: StageFunc
+    deps: Sequence[str] = ()
+    timeout: Optional[float] = None
+    fallback: Optional[Callable[[Dict[str, Any]], Any]] = None
+    optional: bool = False
+
+
+@dataclass
+class StageRun:
+    tasks: Dict[str, asyncio.Task] = field(default_factory=dict)
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    fallbacks: List[str] = field(default_factory=list)
+
+    async def wait(self, *names: str) -> Dict[str, Any]:
+        await asyncio.gather(*(self.tasks[name] for name in names))
+        return self.results
+
+    async def finish(self) -> Dict[str, Any]:
+        await asyncio.gather(*self.tasks.values())
+        return self.results
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+
+class StageGraph:
+    def __init__(self, propagate: Tuple[Type[BaseException], ...] = ()):
+        self.stages: Dict[str, Stage] = {}
+        self.propagate = propagate
+
+    def add(self, name: str, func: StageFunc, deps: Sequence[str] = (), timeout: Optional[float] = None,
+            fallback: Optional[Callable[[Dict[str, Any]], Any]] = None, optional: bool = False) -> "StageGraph":
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+        self.stages[name] = Stage(name, func, tuple(deps), timeout, fallback, optional)
+        return self
+
+    async def run_stage(self, stage: Stage, run: StageRun):
+        await asyncio.gather(*(run.tasks[dep] for dep in stage.deps))
+        started = time.perf_counter()
+        try:
+            run.results[stage.name] = await asyncio.wait_for(stage.func(run.results), stage.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, self.propagate) and not stage.optional:
+                raise
+            print(f"Stage '{stage.name}' failed ({type(e).__name__}: {e}), using fallback")
+            run.fallbacks.append(stage.name)
+            run.results[stage.name] = stage.fallback(run.results) if stage.fallback else None
+        finally:
+            run.timings[stage.name] = round(time.perf_counter() - started, 4)
+
+    def start(self, initial: Optional[Dict[str, Any]] = None) -> StageRun:
+        run = StageRun(results=dict(initial or {}))
+        for stage in self.stages.values():
+            run.tasks[stage.name] = asyncio.create_task(self.run_stage(stage, run))
+        return run
@@ -1,41 +1,328 @@
+import asyncio
 import time
-from typing import Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
 
-from config import MAX_QDRANT_RESULTS_TO_FETCH
-from embeddings import generate_embedding, rerank_results
-from llm import classify_question_llm, enrich_query_with_llm, make_llm_request
-from utils import filter_duplicate_chunks
-from vector_store import search_vectors
+from qdrant_client.http.models import ScoredPoint
 
+from admission import OverloadedError, limit
+from answer_cache import lookup_cached_answer, store_cached_answer
+from config import MAX_QDRANT_RESULTS_TO_FETCH, TOTAL_CONTEXT_WINDOW_TOKENS, RESPONSE_BUFFER_TOKENS, \
+    BASE_PROMPT_TOKENS, HISTORY_TOKEN_BUDGET, RRF_K, HYBRID_RERANK_CANDIDATES, STAGE_TIMEOUT_CLASSIFY, \
+    STAGE_TIMEOUT_ENRICH, STAGE_TIMEOUT_EMBED, STAGE_TIMEOUT_SEARCH, STAGE_TIMEOUT_RERANK, STAGE_TIMEOUT_HISTORY
+from conversation import load_history, save_turn
+from database import get_term_statistics
+from embeddings import generate_embedding, rerank_adaptive
+from executors import inference_executor
+from llm import classify_question_llm, enrich_query_with_llm, make_llm_request, stream_llm_request
+from metrics import rag_stage_seconds, rag_request_seconds, rag_requests_total, rag_context_tokens, \
+    rag_time_to_first_token_seconds, observe_stage_timings
+from models import RAGMetrics
+from pipeline import StageGraph, StageRun
+from sparse import tokenize, term_id, query_sparse_vector, reciprocal_rank_fusion, fusion_rank_score
+from utils import filter_duplicate_chunks, count_tokens
+import vector_store
+from vector_store import search_vectors, search_vectors_batch, search_sparse_vectors
 
-async def ask_question_rag(user_id: int, question: str) -> Tuple[str, Dict[str, Any]]:
-    start_time = time.time()
-    metadata = {"user_id": user_id}
-    final_answer = "Ошибка обработки запроса."
+CONTEXT_SEPARATOR = "\n---\n"
+HISTORY_ROLE_LABELS = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+async def classify_stage(results: Dict[str, Any]) -> str:
+    async with limit("llm"):
+        return await classify_question_llm(results["question"])
+
+
+async def enrich_stage(results: Dict[str, Any]) -> str:
+    async with limit("llm"):
+        return await enrich_query_with_llm(results["question"])
+
+
+async def embed_raw_stage(results: Dict[str, Any]):
+    async with limit("embedding"):
+        return await generate_embedding(results["question"])
+
+
+async def embed_query_stage(results: Dict[str, Any]):
+    if results["enrich"] == results["question"] and results["embed_raw"]:
+        return results["embed_raw"]
+    async with limit("embedding"):
+        return await generate_embedding(results["enrich"]) or results["embed_raw"]
+
+
+async def sparse_query_stage(results: Dict[str, Any]) -> Tuple[List[int], List[float]]:
+    query_term_ids = [term_id(term) for term in tokenize(results["question"])]
+    if not query_term_ids:
+        return [], []
+    document_frequencies, total_chunks, _ = await get_term_statistics(query_term_ids)
+    return query_sparse_vector(query_term_ids, document_frequencies, total_chunks)
+
+
+async def dense_search(results: Dict[str, Any]) -> List[ScoredPoint]:
+    if not results["embed_raw"] or results["embed_raw"] == results["embed_query"]:
+        return await search_vectors(results["embed_query"], limit=MAX_QDRANT_RESULTS_TO_FETCH * 2)
+
+    best_hits: Dict[Any, ScoredPoint] = {}
+    for hits in await search_vectors_batch([results["embed_query"], results["embed_raw"]],
+            limit=MAX_QDRANT_RESULTS_TO_FETCH * 2):
+        for hit in hits:
+            if hit.id not in best_hits or hit.score > best_hits[hit.id].score:
+                best_hits[hit.id] = hit
+    return sorted(best_hits.values(), key=lambda hit: hit.score, reverse=True)[:MAX_QDRANT_RESULTS_TO_FETCH * 2]
+
+
+async def search_stage(results: Dict[str, Any]):
+    if not results["embed_query"]:
+        return []
+    indices, values = results["sparse_query"]
+    async with limit("vector_search"):
+        dense_hits, sparse_hits = await asyncio.gather(dense_search(results),
+            search_sparse_vectors(indices, values, limit=MAX_QDRANT_RESULTS_TO_FETCH * 2))
+    if not sparse_hits:
+        return dense_hits
+    return reciprocal_rank_fusion([dense_hits, sparse_hits], RRF_K, HYBRID_RERANK_CANDIDATES)
+
+
+async def rerank_stage(results: Dict[str, Any]):
+    async with limit("rerank"):
+        return await rerank_adaptive(results["question"], results["search"])
+
+
+def chunk_tokens(hit: ScoredPoint) -> int:
+    token_count = hit.payload.get('token_count')
+    return token_count if isinstance(token_count, int) else count_tokens(hit.payload.get('text', ''))
+
+
+def pack_history(history: List[Dict[str, Any]]) -> Tuple[List[str], int]:
+    lines, history_tokens = [], 0
+    for message in reversed(history):
+        line = f"{HISTORY_ROLE_LABELS.get(message['role'], message['role'])}: {message['content']}"
+        tokens = count_tokens(line)
+        if history_tokens + tokens > HISTORY_TOKEN_BUDGET:
+            break
+        lines.append(line)
+        history_tokens += tokens
+    lines.reverse()
+    return lines, history_tokens
+
+
+def pack_context(question: str, hits: List[ScoredPoint], history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    history_lines, history_tokens = pack_history(history)
+    budget = TOTAL_CONTEXT_WINDOW_TOKENS - RESPONSE_BUFFER_TOKENS - BASE_PROMPT_TOKENS - count_tokens(question) - \
+        history_tokens
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    packed, context_tokens, skipped = [], 0, 0
+
+    for hit in filter_duplicate_chunks(hits[:MAX_QDRANT_RESULTS_TO_FETCH]):
+        if not hit.payload:
+            continue
+        tokens = chunk_tokens(hit) + (separator_tokens if packed else 0)
+        if context_tokens + tokens > budget:
+            skipped += 1
+            continue
+        packed.append(hit)
+        context_tokens += tokens
+
+    return {"hits": packed, "context_tokens": context_tokens, "context_budget_tokens": max(budget, 0),
+            "skipped_chunks": skipped, "history": history_lines, "history_tokens": history_tokens}
+
+
+async def history_stage(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return await load_history(results["user_id"])
+
+
+async def pack_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+    search_results, _ = results["rerank"]
+    return await inference_executor.run(pack_context, results["question"], search_results, results["history"])
 
-    classified_category = await classify_question_llm(question)
-    metadata["classified_category"] = classified_category
 
-    enriched_question = await enrich_query_with_llm(question)
-    question_embedding = await generate_embedding(enriched_question)
-    if not question_embedding:
-        return "Ошибка генерации эмбеддинга.", metadata
+retrieval_graph = (StageGraph(propagate=(OverloadedError,))
+    .add("classify", classify_stage, timeout=STAGE_TIMEOUT_CLASSIFY, fallback=lambda r: "Lookup", optional=True)
+    .add("enrich", enrich_stage, timeout=STAGE_TIMEOUT_ENRICH, fallback=lambda r: r["question"], optional=True)
+    .add("embed_raw", embed_raw_stage, timeout=STAGE_TIMEOUT_EMBED)
+    .add("embed_query", embed_query_stage, deps=["enrich", "embed_raw"], timeout=STAGE_TIMEOUT_EMBED,
+        fallback=lambda r: r["embed_raw"])
+    .add("sparse_query", sparse_query_stage, timeout=STAGE_TIMEOUT_SEARCH, fallback=lambda r: ([], []))
+    .add("search", search_stage, deps=["embed_query", "sparse_query"], timeout=STAGE_TIMEOUT_SEARCH,
+        fallback=lambda r: [])
+    .add("rerank", rerank_stage, deps=["search"], timeout=STAGE_TIMEOUT_RERANK,
+        fallback=lambda r: (sorted(r["search"], key=fusion_rank_score, reverse=True), {}), optional=True)
+    .add("history", history_stage, timeout=STAGE_TIMEOUT_HISTORY, fallback=lambda r: [])
+    .add("pack", pack_stage, deps=["rerank", "history"],
+        fallback=lambda r: {"hits": [], "context_tokens": 0, "context_budget_tokens": 0, "skipped_chunks": 0,
+                            "history": [], "history_tokens": 0}))
 
-    search_results = await search_vectors(question_embedding, limit=MAX_QDRANT_RESULTS_TO_FETCH * 2)
-    search_results = await rerank_results(question, search_results)
-    search_results = search_results[:MAX_QDRANT_RESULTS_TO_FETCH]
-    search_results = filter_duplicate_chunks(search_results)
 
-    context_chunks = [hit.payload.get('text', '') for hit in search_results if hit.payload]
-    context = "\n---\n".join(context_chunks)
+async def build_rag_prompt(question: str, run: StageRun, metadata: Dict[str, Any]) -> Optional[str]:
+    results = await run.wait("pack")
+    if not results["embed_query"]:
+        return None
+
+    _, rerank_stats = results["rerank"]
+    packed = results["pack"]
+    metadata["enriched_question"] = results["enrich"]
+    metadata["qdrant_filters"] = ["dense"] + (["sparse+rrf"] if results["sparse_query"][0] and
+                                              vector_store.sparse_enabled else [])
+    metadata.update(rerank_stats)
+
+    context_chunks = [hit.payload.get('text', '') for hit in packed["hits"]]
+    context = CONTEXT_SEPARATOR.join(context_chunks)
     metadata["context_chunks"] = context_chunks
+    metadata["used_chunks"] = len(context_chunks)
+    metadata["context_tokens"] = packed["context_tokens"]
+    metadata["context_budget_tokens"] = packed["context_budget_tokens"]
+    metadata["skipped_chunks"] = packed["skipped_chunks"]
+    metadata["history_messages"] = len(packed["history"])
+    metadata["history_tokens"] = packed["history_tokens"]
+    metadata["relevance_scores"] = [round(hit.score, 4) for hit in packed["hits"]]
+    metadata["source_documents"] = sorted({hit.payload['document_mongo_id'] for hit in packed["hits"]
+                                           if hit.payload.get('document_mongo_id')})
 
-    prompt = f"Вопрос: {question}\n\nКонтекст:\n{context}\n\nОтвет:"
-    answer = await make_llm_request(prompt, max_tokens=512, temperature=0.1)
-    if answer:
-        final_answer = answer
-    else:
-        final_answer = "Не удалось получить ответ от LLM."
+    if packed["history"]:
+        history = "\n".join(packed["history"])
+        return f"История диалога:\n{history}\n\nВопрос: {question}\n\nКонтекст:\n{context}\n\nОтвет:"
+    return f"Вопрос: {question}\n\nКонтекст:\n{context}\n\nОтвет:"
+
+
+async def has_recent_history(user_id: int) -> bool:
+    try:
+        return bool(await asyncio.wait_for(load_history(user_id), STAGE_TIMEOUT_HISTORY))
+    except Exception as e:
+        print(f"Error loading history for cache lookup: {e}")
+        return True
+
+
+async def find_cached_answer(user_id: int, question: str, start_time: float) -> \
+        Optional[Tuple[str, Dict[str, Any]]]:
+    # Cached answers carry no conversation context, so questions that get recent history in their prompt skip them.
+    if await has_recent_history(user_id):
+        return None
+    with rag_stage_seconds.time(stage="cache_lookup"):
+        async with limit("embedding"):
+            embedding = await generate_embedding(question)
+        cached = await lookup_cached_answer(embedding)
+    if cached is None:
+        return None
+    rag_requests_total.inc(outcome="cache_hit")
+    rag_request_seconds.observe(time.time() - start_time, outcome="cache_hit")
+
+    metadata = dict(cached["metrics"])
+    metadata.update({"user_id": user_id, "cache_hit": True, "cache_similarity": cached["similarity"],
+                     "generation_time": round(time.time() - start_time, 2)})
+    return cached["answer"], metadata
 
+
+async def cache_answer(run: StageRun, answer: str, metadata: Dict[str, Any]):
+    if metadata.get("history_messages"):
+        return
+    await store_cached_answer(run.results.get("embed_raw"), answer, metadata, metadata.get("source_documents", []))
+
+
+def build_rag_metrics(metadata: Dict[str, Any], answer: str) -> Dict[str, Any]:
+    relevance_scores = metadata.get("relevance_scores", [])
+    return RAGMetrics(relevance_scores=relevance_scores, context_tokens=metadata.get("context_tokens", 0),
+        used_chunks=metadata.get("used_chunks", 0), generation_time=metadata["generation_time"],
+        answer_tokens=count_tokens(answer),
+        average_relevance_score=round(sum(relevance_scores) / len(relevance_scores), 4) if relevance_scores else 0.0,
+        context_chunks=metadata.get("context_chunks", []), qdrant_filters=metadata.get("qdrant_filters", []),
+        stage_timings=metadata.get("stage_timings", {})).model_dump()
+
+
+def finalize_metadata(metadata: Dict[str, Any], run: StageRun, start_time: float, answer: str, generated: bool):
+    metadata["cache_hit"] = False
+    metadata["classified_category"] = run.results.get("classify")
+    metadata["stage_timings"] = run.timings
+    metadata["stage_fallbacks"] = run.fallbacks
     metadata["generation_time"] = round(time.time() - start_time, 2)
+    metadata["rag_metrics"] = build_rag_metrics(metadata, answer)
+
+    outcome = "answered" if generated else "failed"
+    observe_stage_timings(run.timings, run.fallbacks)
+    rag_requests_total.inc(outcome=outcome)
+    rag_request_seconds.observe(time.time() - start_time, outcome=outcome)
+    if metadata.get("context_tokens"):
+        rag_context_tokens.observe(metadata["context_tokens"])
+    if metadata.get("time_to_first_token") is not None:
+        rag_time_to_first_token_seconds.observe(metadata["time_to_first_token"])
+
+
+async def ask_question_rag(user_id: int, question: str) -> Tuple[str, Dict[str, Any]]:
+    start_time = time.time()
+    cached = await find_cached_answer(user_id, question, start_time)
+    if cached is not None:
+        save_turn(user_id, question, cached[0], cached[1].get("rag_metrics"), start_time)
+        return cached
+
+    metadata = {"user_id": user_id}
+    answer = None
+
+    run = retrieval_graph.start({"question": question, "user_id": user_id})
+    try:
+        prompt = await build_rag_prompt(question, run, metadata)
+        if prompt is None:
+            final_answer = "Ошибка генерации эмбеддинга."
+        else:
+            async with limit("llm"):
+                generate_started = time.perf_counter()
+                answer = await make_llm_request(prompt, max_tokens=512, temperature=0.1)
+                run.timings["generate"] = round(time.perf_counter() - generate_started, 4)
+            final_answer = answer if answer else "Не удалось получить ответ от LLM."
+        await run.finish()
+    except BaseException:
+        run.cancel()
+        raise
+
+    finalize_metadata(metadata, run, start_time, final_answer, bool(answer))
+    save_turn(user_id, question, final_answer, metadata["rag_metrics"], start_time)
+    if answer:
+        await cache_answer(run, final_answer, metadata)
     return final_answer, metadata
+
+
+async def ask_question_rag_stream(user_id: int, question: str) -> AsyncIterator[Dict[str, Any]]:
+    start_time = time.time()
+    cached = await find_cached_answer(user_id, question, start_time)
+    if cached is not None:
+        cached_answer, cached_metadata = cached
+        save_turn(user_id, question, cached_answer, cached_metadata.get("rag_metrics"), start_time)
+        yield {"type": "delta", "text": cached_answer}
+        yield {"type": "done", "answer": cached_answer, "metrics": cached_metadata}
+        return
+
+    metadata = {"user_id": user_id}
+    answer_parts = []
+    generated = False
+
+    run = retrieval_graph.start({"question": question, "user_id": user_id})
+    try:
+        prompt = await build_rag_prompt(question, run, metadata)
+        if prompt is None:
+            answer_parts.append("Ошибка генерации эмбеддинга.")
+            yield {"type": "delta", "text": answer_parts[-1]}
+        else:
+            async with limit("llm"):
+                generate_started = time.perf_counter()
+                try:
+                    async for delta in stream_llm_request(prompt, max_tokens=512, temperature=0.1):
+                        if not answer_parts:
+                            metadata["time_to_first_token"] = round(time.time() - start_time, 2)
+                        answer_parts.append(delta)
+                        yield {"type": "delta", "text": delta}
+                    generated = bool("".join(answer_parts).strip())
+                except Exception as e:
+                    print(f"LLM streaming error: {e}")
+                run.timings["generate"] = round(time.perf_counter() - generate_started, 4)
+
+            if not "".join(answer_parts).strip():
+                answer_parts = ["Не удалось получить ответ от LLM."]
+                yield {"type": "delta", "text": answer_parts[0]}
+        await run.finish()
+    except BaseException:
+        run.cancel()
+        raise
+
+    final_answer = "".join(answer_parts).strip()
+    finalize_metadata(metadata, run, start_time, final_answer, generated)
+    save_turn(user_id, question, final_answer, metadata["rag_metrics"], start_time)
+    if generated:
+        await cache_answer(run, final_answer, metadata)
+    yield {"type": "done", "answer": final_answer, "metrics": metadata}
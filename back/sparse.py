@@ -0,0 +1,113 @@
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+from config import SPARSE_BM25_K1, SPARSE_BM25_B, SPARSE_DEFAULT_AVG_CHUNK_TERMS
+
+TOKEN_PATTERN = re.compile(r'[0-9a-zа-я]+(?:[-./_][0-9a-zа-я]+)*')
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его', 'но',
+    'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от', 'меня',
+    'еще', 'нет', 'о', 'из', 'ему', 'теперь', 'когда', 'даже', 'ну', 'ли', 'если', 'уже', 'или', 'ни',
+    'быть', 'был', 'него', 'до', 'вас', 'нибудь', 'опять', 'уж', 'вам', 'ведь', 'там', 'потом', 'себя', 'ничего',
+    'ей', 'может', 'они', 'тут', 'где', 'есть', 'надо', 'ней', 'для', 'мы', 'тебя', 'их', 'чем', 'была', 'сам',
+    'чтоб', 'без', 'будто', 'чего', 'раз', 'тоже', 'себе', 'под', 'будет', 'ж', 'тогда', 'кто', 'этот', 'того',
+    'потому', 'этого', 'какой', 'ним', 'здесь', 'этом', 'один', 'почти', 'мой', 'тем', 'чтобы', 'нее', 'были',
+    'куда', 'зачем', 'всех', 'можно', 'при', 'об', 'другой', 'после', 'над', 'больше', 'тот', 'через', 'эти',
+    'нас', 'про', 'всего', 'них', 'какая', 'много', 'разве', 'эту', 'моя', 'свою', 'этой', 'перед', 'иногда',
+    'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 'более', 'всегда', 'конечно', 'всю', 'между', 'это',
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'is', 'are', 'be', 'with', 'by', 'at', 'as',
+}
+RUSSIAN_SUFFIXES = sorted({
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ией', 'ием', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя',
+    'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям', 'ов', 'ев', 'ия', 'ию',
+    'ии', 'ать', 'ять', 'ить', 'еть', 'уть', 'ешь', 'ет', 'ут', 'ют', 'ат', 'ят', 'ил', 'ила', 'ило', 'или', 'ал',
+    'ала', 'ало', 'али', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+}, key=len, reverse=True)
+CYRILLIC_WORD = re.compile(r'^[а-я]+$')
+
+
+def stem_token(token: str) -> str:
+    if len(token) <= 4 or not CYRILLIC_WORD.match(token):
+        return token
+    for suffix in RUSSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text.lower().replace('ё', 'е')):
+        token = match.group()
+        if token in STOP_WORDS:
+            continue
+        if any(separator in token for separator in '-./_'):
+            terms.append(token)
+            terms.extend(stem_token(part) for part in re.split(r'[-./_]', token) if part not in STOP_WORDS)
+        else:
+            terms.append(stem_token(token))
+    return terms
+
+
+def term_id(term: str) -> int:
+    return zlib.crc32(term.encode('utf-8')) & 0x7FFFFFFF
+
+
+def term_counts(text: str) -> Counter:
+    return Counter(term_id(term) for term in tokenize(text))
+
+
+def document_sparse_vector(counts: Counter, avg_chunk_terms: Optional[float] = None) -> Tuple[List[int], List[float]]:
+    length = sum(counts.values())
+    avgdl = avg_chunk_terms or SPARSE_DEFAULT_AVG_CHUNK_TERMS
+    norm = SPARSE_BM25_K1 * (1 - SPARSE_BM25_B + SPARSE_BM25_B * length / avgdl)
+    indices = sorted(counts)
+    return indices, [round(counts[index] * (SPARSE_BM25_K1 + 1) / (counts[index] + norm), 4) for index in indices]
+
+
+def query_sparse_vector(query_term_ids: List[int], document_frequencies: Dict[int, int],
+        total_chunks: int) -> Tuple[List[int], List[float]]:
+    counts = Counter(query_term_ids)
+    indices, values = [], []
+    for index in sorted(counts):
+        df = document_frequencies.get(index, 0)
+        if df <= 0:
+            continue
+        indices.append(index)
+        values.append(round(counts[index] * math.log(1 + (total_chunks - df + 0.5) / (df + 0.5)), 4))
+    return indices, values
+
+
+def reciprocal_rank_fusion(result_lists: List[list], k: int, limit: int) -> list:
+    # The first list holds dense hits: fused hits keep the dense similarity as their score (0.0 if only found by
+    # the other lists), and the RRF value that orders them goes to the payload.
+    fused_scores: Dict = {}
+    hits: Dict = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results):
+            fused_scores[hit.id] = fused_scores.get(hit.id, 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(hit.id, hit)
+    dense_scores = {hit.id: hit.score for hit in result_lists[0]} if result_lists else {}
+
+    ranked = sorted(fused_scores, key=fused_scores.get, reverse=True)[:limit]
+    fused = []
+    for point_id in ranked:
+        hit = hits[point_id]
+        payload = {**(hit.payload or {}), "rrf_score": round(fused_scores[point_id], 6)}
+        if point_id in dense_scores:
+            payload["dense_score"] = dense_scores[point_id]
+        fused.append(hit.model_copy(update={"score": dense_scores.get(point_id, 0.0), "payload": payload}))
+    return fused
+
+
+def fusion_rank_score(hit) -> float:
+    return hit.payload.get("rrf_score", hit.score) if hit.payload else hit.score
+
+
+def dense_similarity(hit) -> Optional[float]:
+    if hit.payload and "rrf_score" in hit.payload:
+        return hit.payload.get("dense_score")
+    return hit.score
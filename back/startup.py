@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from answer_cache import initialize_answer_cache
+from database import initialize_database
+from embeddings import initialize_models, warm_up_models
+from executors import warm_up_parse_pool
+from http_client import initialize_http_clients
+from vector_store import initialize_vector_store
+
+REQUIRED_DEPENDENCIES = ("mongo", "vector_store", "models")
+
+dependency_status: Dict[str, Dict[str, Any]] = {}
+startup_timings: Dict[str, Optional[float]] = {"started_at": None, "total_seconds": None}
+startup_task: Optional[asyncio.Task] = None
+
+
+async def initialize_dependency(name: str, initializer: Callable[[], Awaitable[Any]]) -> bool:
+    dependency_status[name] = {"status": "starting", "ready": False}
+    started = time.perf_counter()
+    error = None
+    try:
+        ready = bool(await initializer())
+        if not ready:
+            error = "initialization failed"
+    except Exception as e:
+        ready, error = False, f"{type(e).__name__}: {e}"
+
+    dependency_status[name] = {"status": "ready" if ready else "failed", "ready": ready,
+                               "seconds": round(time.perf_counter() - started, 3)}
+    if error:
+        dependency_status[name]["error"] = error
+    return ready
+
+
+async def initialize_models_with_warm_up():
+    return await initialize_models() and await warm_up_models()
+
+
+async def initialize_services():
+    started = time.perf_counter()
+    startup_timings["started_at"] = time.time()
+    await asyncio.gather(
+        initialize_dependency("mongo", initialize_database),
+        initialize_dependency("vector_store", initialize_vector_store),
+        initialize_dependency("models", initialize_models_with_warm_up),
+        initialize_dependency("llm_http", initialize_http_clients),
+        initialize_dependency("answer_cache", initialize_answer_cache),
+        initialize_dependency("parse_pool", warm_up_parse_pool))
+    startup_timings["total_seconds"] = round(time.perf_counter() - started, 3)
+    summary = ", ".join(f"{name}={status['status']}" for name, status in dependency_status.items())
+    print(f"Startup finished in {startup_timings['total_seconds']}s: {summary}")
+
+
+def start_services():
+    global startup_task
+
+    startup_task = asyncio.create_task(initialize_services())
+
+
+async def cancel_startup():
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+
+
+def is_ready() -> bool:
+    return all(dependency_status.get(name, {}).get("ready") for name in REQUIRED_DEPENDENCIES)
+
+
+def get_readiness() -> Dict[str, Any]:
+    if is_ready():
+        status = "ready"
+    elif any(dependency_status.get(name, {}).get("status") == "failed" for name in REQUIRED_DEPENDENCIES):
+        status = "failed"
+    else:
+        status = "starting"
+    return {"status": status, "dependencies": dependency_status, "startup": startup_timings}
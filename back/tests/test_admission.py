@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from admission import OverloadedError, StageLimiter
+
+
+def test_full_queue_is_rejected_immediately():
+    async def scenario():
+        limiter = StageLimiter("llm", concurrency=1, max_queue=0, max_wait=5, status_code=429)
+        async with limiter.slot():
+            with pytest.raises(OverloadedError) as error:
+                await limiter.acquire()
+        return limiter, error.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.stage == "llm"
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+    assert limiter.get_stats()["rejected"] == 1
+    assert limiter.get_stats()["active"] == 0
+
+
+def test_waiting_request_is_rejected_after_max_wait():
+    async def scenario():
+        limiter = StageLimiter("rerank", concurrency=1, max_queue=5, max_wait=0.05)
+        async with limiter.slot():
+            with pytest.raises(OverloadedError):
+                await limiter.acquire()
+        return limiter
+
+    stats = asyncio.run(scenario()).get_stats()
+    assert stats["rejected"] == 1
+    assert stats["waiting"] == 0
+
+
+def test_queued_request_gets_slot_when_released():
+    async def scenario():
+        limiter = StageLimiter("embedding", concurrency=1, max_queue=1, max_wait=1)
+        order = []
+
+        async def worker(name, hold):
+            async with limiter.slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(worker("first", 0.05), worker("second", 0))
+        return limiter, order
+
+    limiter, order = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert limiter.get_stats()["admitted"] == 2
+    assert limiter.get_stats()["rejected"] == 0
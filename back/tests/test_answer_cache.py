@@ -0,0 +1,109 @@
+import asyncio
+import time
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import answer_cache
+import conversation
+import database
+import ingestion
+import rag
+from answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), threshold=0.95, ttl_seconds=3600, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_lookup_returns_similar_answer(cache):
+    cache.store([1.0, 0.0, 0.0], "Ответ", {"used_chunks": 2}, ["doc-1"])
+
+    hit = cache.lookup([1.0, 0.05, 0.0])
+    assert hit["answer"] == "Ответ"
+    assert hit["metrics"] == {"used_chunks": 2}
+    assert hit["similarity"] >= 0.95
+
+
+def test_lookup_below_threshold_misses(cache):
+    cache.store([1.0, 0.0, 0.0], "Ответ", {}, ["doc-1"])
+
+    assert cache.lookup([0.7, 0.7, 0.0]) is None
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_expired_answers_are_not_returned(cache, monkeypatch):
+    cache.store([1.0, 0.0, 0.0], "Ответ", {}, ["doc-1"])
+    now = time.time()
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now + 7200)
+
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+
+
+def test_invalidate_documents_removes_dependent_answers(cache):
+    cache.store([1.0, 0.0, 0.0], "Первый", {}, ["doc-1"])
+    cache.store([0.0, 1.0, 0.0], "Второй", {}, ["doc-2"])
+
+    assert cache.invalidate_documents(["doc-1"]) == 1
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0, 0.0])["answer"] == "Второй"
+
+
+def test_oldest_entries_are_evicted_over_capacity(cache):
+    for i in range(4):
+        vector = [0.0] * 4
+        vector[i] = 1.0
+        cache.store(vector, f"Ответ {i}", {}, [f"doc-{i}"])
+
+    assert cache.get_stats()["entries"] == 3
+    assert cache.lookup([1.0, 0.0, 0.0, 0.0]) is None
+
+
+def test_delete_document_invalidates_cached_answers(cache, monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def no_vectors(doc_id, content_hashes=None):
+        return True
+
+    monkeypatch.setattr(answer_cache, "answer_cache", cache)
+    monkeypatch.setattr(ingestion, "delete_document_vectors", no_vectors)
+
+    async def scenario():
+        await database.initialize_database(mongomock_motor.AsyncMongoMockClient())
+        doc_id = await database.create_document_record("regulation.txt")
+        cache.store([1.0, 0.0, 0.0], "Ответ", {}, [doc_id])
+        deleted, _ = await ingestion.delete_document(doc_id)
+        return deleted
+
+    assert asyncio.run(scenario())
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+
+
+def test_cache_is_skipped_only_with_recent_history(monkeypatch):
+    lookups = []
+
+    async def fake_embedding(text):
+        return [1.0, 0.0]
+
+    async def fake_lookup(embedding):
+        lookups.append(embedding)
+        return {"answer": "Кэш", "metrics": {}, "similarity": 1.0}
+
+    monkeypatch.setattr(rag, "generate_embedding", fake_embedding)
+    monkeypatch.setattr(rag, "lookup_cached_answer", fake_lookup)
+    old = datetime.now(timezone.utc) - timedelta(seconds=conversation.HISTORY_CONTEXT_MAX_AGE_SECONDS + 60)
+    conversation.remember_messages(501, [{"role": "user", "content": "Вопрос", "timestamp": old}])
+    conversation.remember_messages(502, [{"role": "user", "content": "Вопрос",
+                                          "timestamp": datetime.now(timezone.utc)}])
+
+    async def scenario():
+        return await rag.find_cached_answer(501, "Вопрос", time.time()), \
+            await rag.find_cached_answer(502, "А подробнее?", time.time())
+
+    returning_user, follow_up = asyncio.run(scenario())
+    assert returning_user[0] == "Кэш"
+    assert follow_up is None
+    assert len(lookups) == 1
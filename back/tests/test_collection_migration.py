@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.models import PointStruct
+
+import collection_migration
+import vector_store
+from vector_store import collection_config
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = AsyncQdrantClient(location=":memory:")
+    monkeypatch.setattr(vector_store, "qdrant_client", client)
+    monkeypatch.setattr(vector_store, "QDRANT_COLLECTION_NAME", "kb")
+    monkeypatch.setattr(collection_migration, "QDRANT_COLLECTION_NAME", "kb")
+    return client
+
+
+async def create_legacy_collection(client, name: str, points: int):
+    await client.create_collection(collection_name=name, **collection_config(vector_size=4))
+    await client.upsert(collection_name=name, points=[
+        PointStruct(id=i, vector={"": [1.0, 0.0, 0.0, float(i)]}, payload={"text": f"chunk {i}"})
+        for i in range(points)])
+
+
+def test_legacy_collection_is_replaced_by_alias(client):
+    async def scenario():
+        await create_legacy_collection(client, "kb", 5)
+        target = await collection_migration.migrate_collection(batch_size=2)
+        aliases = (await client.get_aliases()).aliases
+        return target, aliases, (await client.count(collection_name="kb", exact=True)).count
+
+    target, aliases, count = asyncio.run(scenario())
+    assert [(alias.alias_name, alias.collection_name) for alias in aliases] == [("kb", target)]
+    assert count == 5
+
+
+def test_source_is_restored_when_alias_cannot_be_created(client, monkeypatch):
+    async def failing_alias_update(**kwargs):
+        raise RuntimeError("alias update rejected")
+
+    async def scenario():
+        await create_legacy_collection(client, "kb", 3)
+        await create_legacy_collection(client, "kb_copy", 3)
+        monkeypatch.setattr(client, "update_collection_aliases", failing_alias_update)
+        with pytest.raises(RuntimeError, match="restored"):
+            await collection_migration.replace_collection_with_alias("kb", "kb_copy", 4, 2, attempts=1)
+        return (await client.count(collection_name="kb", exact=True)).count
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_migration_adds_missing_sparse_vector(client):
+    async def scenario():
+        await client.create_collection(collection_name="kb", **collection_config(vector_size=4, sparse=False))
+        before = await vector_store.collection_has_sparse_vectors()
+        await collection_migration.migrate_collection(batch_size=2)
+        return before, await vector_store.collection_has_sparse_vectors()
+
+    assert asyncio.run(scenario()) == (False, True)
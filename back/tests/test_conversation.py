@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import conversation
+import database
+from conversation import ConversationWriter
+
+
+def make_turn(user_id: int, number: int) -> dict:
+    return {"user_id": user_id, "metrics": None,
+            "messages": [{"_id": f"{user_id}-{number}-q", "role": "user", "content": f"q{number}"},
+                         {"_id": f"{user_id}-{number}-a", "role": "assistant", "content": f"a{number}"}]}
+
+
+def test_stop_waits_for_running_flush(monkeypatch):
+    saved = []
+
+    async def slow_save(messages, metrics):
+        await asyncio.sleep(0.2)
+        saved.extend(messages)
+        return True
+
+    monkeypatch.setattr(conversation, "save_conversation_batch", slow_save)
+
+    async def scenario():
+        writer = ConversationWriter(batch_size=2, flush_interval=0.01, buffer_limit=100)
+        for number in range(3):
+            writer.enqueue(make_turn(1, number))
+        await asyncio.sleep(0.05)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert len(saved) == 6
+    assert writer.get_stats()["written_turns"] == 3
+    assert writer.get_stats()["buffered_turns"] == 0
+
+
+def test_failed_batch_is_requeued_and_retried(monkeypatch):
+    attempts = []
+
+    async def flaky_save(messages, metrics):
+        attempts.append(len(messages))
+        return len(attempts) > 1
+
+    monkeypatch.setattr(conversation, "save_conversation_batch", flaky_save)
+
+    async def scenario():
+        writer = ConversationWriter(batch_size=10, flush_interval=60, buffer_limit=100)
+        writer.enqueue(make_turn(1, 0))
+        await writer.flush()
+        stats_after_failure = writer.get_stats()
+        await writer.stop()
+        return stats_after_failure, writer.get_stats()
+
+    after_failure, after_stop = asyncio.run(scenario())
+    assert after_failure["buffered_turns"] == 1
+    assert after_failure["failed_batches"] == 1
+    assert after_stop["written_turns"] == 1
+    assert after_stop["buffered_turns"] == 0
+
+
+def test_requeue_respects_buffer_limit():
+    writer = ConversationWriter(batch_size=2, flush_interval=60, buffer_limit=3)
+    writer.buffer = [make_turn(2, number) for number in range(2)]
+    writer.requeue([make_turn(1, number) for number in range(2)])
+
+    assert [turn["user_id"] for turn in writer.buffer] == [1, 1, 2]
+    assert writer.dropped == 1
+
+
+def test_retried_batch_ignores_already_saved_messages():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        await database.initialize_database(mongomock_motor.AsyncMongoMockClient())
+        messages = make_turn(1, 0)["messages"]
+        await database.messages_collection.insert_one(dict(messages[0]))
+        saved = await database.save_conversation_batch(messages, [])
+        return saved, await database.messages_collection.count_documents({})
+
+    assert asyncio.run(scenario()) == (True, 2)
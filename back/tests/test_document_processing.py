@@ -0,0 +1,82 @@
+import random
+
+from document_processing import split_text_into_chunks
+from utils import chunk_content_hash
+
+SENTENCES = ["Сотрудник имеет право на ежегодный оплачиваемый отпуск продолжительностью {n} календарных дней.",
+             "Возврат товара без чека оформляется по заявлению покупателя в течение {n} дней.",
+             "Перед открытием смены кассир пересчитывает наличные в денежном ящике и сверяет их с отчетом.",
+             "Товар на витрине выкладывается по принципу ротации: более ранние партии ставятся вперед.",
+             "Премия продавца составляет {n} процентов от выполнения плана продаж за месяц."]
+
+
+def build_paragraphs(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    return [f"Пункт {i + 1}. " + " ".join(sentence.format(n=rng.randint(2, 60))
+                                          for sentence in rng.sample(SENTENCES, rng.randint(1, 4)))
+            for i in range(count)]
+
+
+def reuse_ratio(original: str, edited: str) -> float:
+    known = {chunk_content_hash(chunk) for chunk in split_text_into_chunks(original)}
+    edited_hashes = [chunk_content_hash(chunk) for chunk in split_text_into_chunks(edited)]
+    return sum(1 for content_hash in edited_hashes if content_hash in known) / len(edited_hashes)
+
+
+def test_chunks_respect_size_limit():
+    chunks = split_text_into_chunks("\n\n".join(build_paragraphs(200)) + "\n\n" + "а" * 2500)
+    assert chunks
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+
+
+def test_chunks_cover_every_paragraph():
+    paragraphs = build_paragraphs(50)
+    text = "\n\n".join(split_text_into_chunks("\n\n".join(paragraphs)))
+    assert all(paragraph in text for paragraph in paragraphs)
+
+
+def test_edit_reuses_unchanged_chunks():
+    paragraphs = build_paragraphs(200)
+    edited = list(paragraphs)
+    edited[5] += " Дополнение к пункту."
+
+    assert reuse_ratio("\n\n".join(paragraphs), "\n\n".join(edited)) >= 0.9
+
+
+def test_insert_and_delete_reuse_unchanged_chunks():
+    paragraphs = build_paragraphs(200)
+    inserted = paragraphs[:20] + ["Новый пункт о порядке инвентаризации на складе."] + paragraphs[20:]
+    deleted = paragraphs[:100] + paragraphs[101:]
+
+    assert reuse_ratio("\n\n".join(paragraphs), "\n\n".join(inserted)) >= 0.9
+    assert reuse_ratio("\n\n".join(paragraphs), "\n\n".join(deleted)) >= 0.9
+
+
+def test_streamed_pieces_match_whole_text():
+    from document_processing import split_text_stream
+
+    text = "\n\n".join(build_paragraphs(100))
+    pieces = [text[i:i + 777] for i in range(0, len(text), 777)]
+    assert list(split_text_stream(pieces)) == split_text_into_chunks(text)
+
+
+def test_text_file_is_chunked_section_by_section_in_parse_pool(tmp_path, monkeypatch):
+    import asyncio
+
+    import document_processing
+    from executors import parse_executor
+
+    text = "\n\n".join(build_paragraphs(300))
+    path = tmp_path / "regulation.txt"
+    path.write_text(text, encoding="utf-8")
+    monkeypatch.setattr(document_processing, "TEXT_SECTION_CHARS", 5000)
+
+    async def collect():
+        return [batch async for batch in document_processing.stream_document_chunks(str(path), "regulation.txt", 8)]
+
+    try:
+        batches = asyncio.run(collect())
+    finally:
+        parse_executor.shutdown()
+    assert all(len(batch) == 8 for batch in batches[:-1])
+    assert [chunk for batch in batches for chunk in batch] == split_text_into_chunks(text)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def test_reopened_cache_continues_after_newest_row(tmp_path):
+    cache_dir = str(tmp_path / "embeddings")
+    cache = EmbeddingCache("model", cache_dir, memory_size=0, disk_capacity=2)
+    cache.put_many(["a", "b", "c"], np.eye(3, dtype=np.float32))
+    cache.keys_file.close()
+
+    reopened = EmbeddingCache("model", cache_dir, memory_size=0, disk_capacity=2)
+    reopened.put_many(["d"], [np.ones(3, dtype=np.float32)])
+
+    cached = reopened.get_many(["a", "b", "c", "d"])
+    assert cached[0] is None and cached[1] is None
+    np.testing.assert_array_equal(cached[2], [0.0, 0.0, 1.0])
+    np.testing.assert_array_equal(cached[3], [1.0, 1.0, 1.0])
+    reopened.close()
+
+
+def test_compacted_log_keeps_newest_row_last(tmp_path):
+    cache_dir = str(tmp_path / "embeddings")
+    cache = EmbeddingCache("model", cache_dir, memory_size=0, disk_capacity=3)
+    cache.put_many(["a", "b", "c", "d", "e", "f", "g"], np.eye(7, 3, dtype=np.float32))
+    cache.close()
+
+    reopened = EmbeddingCache("model", cache_dir, memory_size=0, disk_capacity=3)
+    assert reopened.next_row == cache.next_row
+    with open(reopened.keys_path, encoding="utf-8") as f:
+        assert [line.split("\t")[0] for line in f] == ["1", "2", "0"]
+    reopened.close()
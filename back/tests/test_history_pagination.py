@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import database
+from database import encode_history_cursor, decode_history_cursor, iter_chat_history
+
+BASE_TIME = datetime(2026, 3, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def messages():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    # Pairs of messages share a millisecond so the _id tiebreaker in the cursor is exercised.
+    documents = [{"_id": ObjectId(), "user_id": 1 if i % 3 else 2, "role": "user", "content": f"m{i}",
+                  "timestamp": BASE_TIME + timedelta(milliseconds=i // 2)} for i in range(11)]
+
+    async def setup():
+        await database.initialize_database(mongomock_motor.AsyncMongoMockClient())
+        await database.messages_collection.insert_many([dict(document) for document in documents])
+        await database.metrics_collection.insert_one({"message_id": documents[4]["_id"], "user_id": 1,
+                                                      "metrics": {"used_chunks": 3}})
+
+    asyncio.run(setup())
+    return sorted(documents, key=lambda document: (document["timestamp"], document["_id"]), reverse=True)
+
+
+def read_pages(limit: int, **filters):
+    async def scenario():
+        pages, cursor = [], None
+        while True:
+            page = [message async for message in iter_chat_history(cursor, limit, **filters)]
+            if not page:
+                return pages
+            pages.append(page)
+            cursor = encode_history_cursor(page[-1])
+
+    return asyncio.run(scenario())
+
+
+def test_pages_cover_every_message_once_in_order(messages):
+    pages = read_pages(3)
+
+    assert all(len(page) == 3 for page in pages[:-1])
+    assert [message["_id"] for page in pages for message in page] == [message["_id"] for message in messages]
+
+
+def test_pages_respect_user_filter_and_join_metrics(messages):
+    pages = read_pages(2, user_id=1)
+    read = [message for page in pages for message in page]
+
+    assert [message["_id"] for message in read] == [message["_id"] for message in messages if message["user_id"] == 1]
+    assert next(message for message in read if message["content"] == "m4")["metrics"] == {"used_chunks": 3}
+
+
+def test_invalid_cursor_is_rejected():
+    assert decode_history_cursor("not-a-cursor") is None
+    assert decode_history_cursor(f"abc_{ObjectId()}") is None
@@ -0,0 +1,66 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+import database
+import ingestion
+import vector_store
+from executors import parse_executor
+from local_vector_store import LocalVectorIndex
+
+PARAGRAPHS = [f"Пункт {i}. Продавец проверяет ценник на товар номер {i} и сверяет его с накладной поставщика "
+              f"перед выкладкой на витрину в торговом зале." for i in range(60)]
+
+
+async def fake_embeddings(texts):
+    return [np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:16], dtype=np.uint8).astype(np.float32)
+            .tolist() for text in texts]
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=16, initial_capacity=8, compact_ratio=0.5)
+    monkeypatch.setattr(vector_store, "local_index", index)
+    monkeypatch.setattr(vector_store, "sparse_enabled", True)
+    monkeypatch.setattr(ingestion, "generate_embeddings_batch", fake_embeddings)
+    asyncio.run(database.initialize_database(mongomock_motor.AsyncMongoMockClient()))
+    yield index
+    index.close()
+    parse_executor.shutdown()
+
+
+def ingest(path, paragraphs):
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return asyncio.run(ingestion.ingest_document(str(path), "rules.txt"))
+
+
+def test_reingestion_embeds_only_changed_chunks(backend, tmp_path):
+    path = tmp_path / "rules.txt"
+    first = ingest(path, PARAGRAPHS)
+    edited = list(PARAGRAPHS)
+    edited[30] = "Пункт 30. Ценники на акционный товар печатаются на желтой бумаге."
+    second = ingest(path, edited)
+
+    assert first["chunks_embedded"] == first["chunks"]
+    assert second["document_id"] == first["document_id"]
+    assert 0 < second["chunks_embedded"] <= 3
+    assert second["chunks_reused"] == second["chunks"] - second["chunks_embedded"]
+    assert second["chunks_deleted"] == second["chunks_embedded"]
+    assert backend.get_stats()["points"] == second["chunks"]
+
+    hashes = asyncio.run(database.get_document_chunk_hashes(first["document_id"]))
+    stored = {backend.payloads[row]["content_hash"] for row in range(backend.rows) if backend.alive[row]}
+    assert stored == hashes
+
+
+def test_unchanged_document_is_not_reembedded(backend, tmp_path):
+    path = tmp_path / "rules.txt"
+    first = ingest(path, PARAGRAPHS)
+    second = ingest(path, PARAGRAPHS)
+
+    assert second["chunks_embedded"] == 0
+    assert second["chunks_reused"] == first["chunks"]
+    assert backend.get_stats()["points"] == first["chunks"]
@@ -0,0 +1,66 @@
+import pytest
+from qdrant_client.http.models import FieldCondition, MatchValue
+
+from local_vector_store import LocalVectorIndex
+
+
+def point(point_id: str, vector, document: str, sparse=None) -> dict:
+    return {"id": point_id, "vector": vector, "payload": {"document_mongo_id": document, "text": point_id},
+            "sparse_vector": sparse}
+
+
+def by_document(document: str) -> FieldCondition:
+    return FieldCondition(key="document_mongo_id", match=MatchValue(value=document))
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=3, initial_capacity=2, compact_ratio=0.5)
+    index.upsert([point("a", [1.0, 0.0, 0.0], "d1", ([1], [0.5])),
+                  point("b", [0.0, 1.0, 0.0], "d2", ([1, 2], [0.2, 0.9])),
+                  point("c", [0.9, 0.1, 0.0], "d2")])
+    yield index
+    index.close()
+
+
+def test_search_returns_nearest_points_by_cosine(index):
+    hits = index.search([[2.0, 0.0, 0.0]], limit=2)[0]
+
+    assert [hit.id for hit in hits] == ["a", "c"]
+    assert hits[0].score == pytest.approx(1.0)
+
+
+def test_search_applies_filters_and_threshold(index):
+    assert [hit.id for hit in index.search([[1.0, 0.0, 0.0]], limit=3, should=[by_document("d2")])[0]] == ["c", "b"]
+    assert [hit.id for hit in index.search([[1.0, 0.0, 0.0]], limit=3, score_threshold=0.5)[0]] == ["a", "c"]
+
+
+def test_sparse_search_scores_postings(index):
+    assert [hit.id for hit in index.search_sparse([1, 2], [1.0, 1.0], limit=5)] == ["b", "a"]
+
+
+def test_replaced_and_deleted_points_stay_gone_after_reopen(index, tmp_path):
+    index.upsert([point("a", [0.0, 0.0, 1.0], "d1")])
+    assert index.delete([by_document("d2")]) == 2
+    index.close()
+
+    reopened = LocalVectorIndex(str(tmp_path / "index"), dim=3, initial_capacity=2, compact_ratio=0.99)
+    hits = reopened.search([[0.0, 0.0, 1.0]], limit=5)[0]
+    assert [(hit.id, round(hit.score, 4)) for hit in hits] == [("a", 1.0)]
+    assert reopened.search_sparse([1, 2], [1.0, 1.0], limit=5) == []
+    reopened.close()
+
+
+def test_interrupted_compaction_is_finished_on_load(index, tmp_path, monkeypatch):
+    def crash():
+        raise RuntimeError("killed during compaction")
+
+    monkeypatch.setattr(index, "finish_compaction", crash)
+    with pytest.raises(RuntimeError):
+        index.delete([by_document("d2")])
+
+    reopened = LocalVectorIndex(str(tmp_path / "index"), dim=3, initial_capacity=2, compact_ratio=0.5)
+    assert reopened.get_stats()["points"] == 1
+    assert reopened.get_stats()["deleted"] == 0
+    assert [hit.id for hit in reopened.search([[1.0, 0.0, 0.0]], limit=5)[0]] == ["a"]
+    reopened.close()
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from admission import OverloadedError
+from pipeline import StageGraph
+
+
+def run_graph(graph: StageGraph, initial=None):
+    async def scenario():
+        run = graph.start(initial)
+        return await run.finish(), run
+
+    return asyncio.run(scenario())
+
+
+def test_dependent_stages_see_earlier_results():
+    async def double(results):
+        return results["value"] * 2
+
+    async def add_one(results):
+        return results["double"] + 1
+
+    graph = StageGraph().add("double", double).add("add_one", add_one, deps=["double"])
+
+    results, run = run_graph(graph, {"value": 5})
+    assert results["add_one"] == 11
+    assert run.fallbacks == []
+    assert set(run.timings) == {"double", "add_one"}
+
+
+def test_timed_out_stage_uses_fallback_for_dependents():
+    async def slow(results):
+        await asyncio.sleep(1)
+        return "slow"
+
+    async def use(results):
+        return f"got {results['slow']}"
+
+    graph = StageGraph().add("slow", slow, timeout=0.05, fallback=lambda r: "fallback").add("use", use, deps=["slow"])
+
+    results, run = run_graph(graph)
+    assert results["use"] == "got fallback"
+    assert run.fallbacks == ["slow"]
+    assert run.timings["slow"] < 0.5
+
+
+def test_failed_stage_without_fallback_yields_none():
+    async def broken(results):
+        raise RuntimeError("boom")
+
+    results, run = run_graph(StageGraph().add("broken", broken))
+    assert results["broken"] is None
+    assert run.fallbacks == ["broken"]
+
+
+def test_propagated_errors_fail_required_stages_only():
+    async def overloaded(results):
+        raise OverloadedError("rerank", 2, 503)
+
+    optional = StageGraph(propagate=(OverloadedError,)).add("rerank", overloaded, fallback=lambda r: [],
+                                                            optional=True)
+    results, _ = run_graph(optional)
+    assert results["rerank"] == []
+
+    required = StageGraph(propagate=(OverloadedError,)).add("rerank", overloaded, fallback=lambda r: [])
+    with pytest.raises(OverloadedError):
+        run_graph(required)
+
+
+def test_unknown_dependency_is_rejected():
+    async def stage(results):
+        return None
+
+    with pytest.raises(ValueError):
+        StageGraph().add("pack", stage, deps=["rerank"])
@@ -0,0 +1,69 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import embeddings
+
+
+class Hit:
+    def __init__(self, point_id, rrf_score, dense_score):
+        self.id = point_id
+        self.score = rrf_score
+        self.payload = {"text": f"chunk {point_id}", "rrf_score": rrf_score, "dense_score": dense_score}
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.pairs = []
+
+    async def submit_many(self, pairs):
+        self.pairs.extend(pairs)
+        return [0.1] * len(pairs)
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    batcher = FakeBatcher()
+    monkeypatch.setattr(embeddings, "reranker_model", object())
+    monkeypatch.setattr(embeddings, "rerank_batcher", batcher)
+    monkeypatch.setattr(embeddings, "rerank_score_cache", OrderedDict())
+    monkeypatch.setattr(embeddings, "RERANK_STEP_SIZE", 2)
+    monkeypatch.setattr(embeddings, "RERANK_DENSE_MARGIN", 0.15)
+    return batcher
+
+
+def rerank(hits):
+    return asyncio.run(embeddings.rerank_adaptive("вопрос", hits, min_score=0.8, target_results=6))
+
+
+def test_stops_when_no_remaining_candidate_is_close_in_dense_score(batcher):
+    dense_scores = [0.9, 0.85, 0.5, 0.4, 0.3, 0.2]
+    hits = [Hit(i, 1.0 - i / 10, dense) for i, dense in enumerate(dense_scores)]
+
+    _, stats = rerank(hits)
+
+    assert stats["rerank_scored"] == 2
+    assert len(batcher.pairs) == 2
+
+
+def test_keeps_scoring_past_a_weak_batch_when_a_later_one_is_close(batcher):
+    dense_scores = [0.9, 0.85, 0.5, 0.4, 0.3, 0.88]
+    hits = [Hit(i, 1.0 - i / 10, dense) for i, dense in enumerate(dense_scores)]
+
+    results, stats = rerank(hits)
+
+    assert stats["rerank_scored"] == 6
+    assert 5 in {result.id for result in results}
+
+
+def test_repeated_question_reuses_cached_scores(batcher):
+    hits = [Hit(i, 1.0 - i / 10, 0.9) for i in range(4)]
+
+    _, first = rerank(hits)
+    _, second = rerank([Hit(i, 1.0 - i / 10, 0.9) for i in range(4)])
+
+    assert first["rerank_cache_hits"] == 0
+    assert second["rerank_scored"] == first["rerank_scored"] == 4
+    assert second["rerank_cache_hits"] == 4
+    assert len(batcher.pairs) == 4
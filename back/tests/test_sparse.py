@@ -0,0 +1,59 @@
+from collections import Counter
+
+import pytest
+from qdrant_client.http.models import ScoredPoint
+
+from sparse import tokenize, term_id, term_counts, document_sparse_vector, query_sparse_vector, \
+    reciprocal_rank_fusion, fusion_rank_score, dense_similarity
+
+
+def hit(point_id: str, score: float) -> ScoredPoint:
+    return ScoredPoint(id=point_id, version=0, score=score, payload={"text": point_id})
+
+
+def test_tokenize_stems_words_and_keeps_codes():
+    assert tokenize("Товаров и товара, товары") == ["товар", "товар", "товар"]
+    assert tokenize("Тариф X-100") == ["тариф", "x-100", "x", "100"]
+
+
+def test_bm25_weight_saturates_with_term_frequency_and_shrinks_with_length():
+    short = document_sparse_vector(Counter({1: 1, 2: 1}), avg_chunk_terms=10)
+    repeated = document_sparse_vector(Counter({1: 4, 2: 1}), avg_chunk_terms=10)
+    long = document_sparse_vector(Counter({1: 1, 2: 49}), avg_chunk_terms=10)
+
+    assert short[0] == [1, 2]
+    assert short[1][0] < repeated[1][0] < 2.2
+    assert long[1][0] < short[1][0]
+
+
+def test_query_weights_favor_rare_terms_and_skip_unknown_ones():
+    common, rare, unknown = term_id("товар"), term_id("инвентаризац"), term_id("отсутствует")
+    indices, values = query_sparse_vector([common, rare, unknown], {common: 90, rare: 2}, total_chunks=100)
+
+    weights = dict(zip(indices, values))
+    assert unknown not in weights
+    assert weights[rare] > weights[common] > 0
+
+
+def test_term_counts_match_tokenize():
+    assert term_counts("касса кассы кассой") == Counter({term_id("касс"): 3})
+
+
+def test_rrf_orders_by_fused_rank_and_keeps_dense_similarity():
+    dense = [hit("a", 0.9), hit("b", 0.8), hit("c", 0.7)]
+    sparse = [hit("c", 12.0), hit("d", 9.0), hit("a", 3.0)]
+
+    fused = reciprocal_rank_fusion([dense, sparse], k=60, limit=3)
+
+    assert [point.id for point in fused] == ["a", "c", "b"]
+    assert fused[0].payload["rrf_score"] == pytest.approx(1 / 61 + 1 / 63, abs=1e-6)
+    assert [dense_similarity(point) for point in fused] == [0.9, 0.7, 0.8]
+    assert fusion_rank_score(fused[0]) == fused[0].payload["rrf_score"]
+
+
+def test_sparse_only_hits_have_no_dense_similarity():
+    fused = reciprocal_rank_fusion([[hit("a", 0.9)], [hit("d", 5.0), hit("a", 1.0)]], k=60, limit=5)
+
+    only_sparse = next(point for point in fused if point.id == "d")
+    assert only_sparse.score == 0.0
+    assert dense_similarity(only_sparse) is None
@@ -0,0 +1,37 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import api
+
+
+def test_upload_rejects_unsupported_type_before_queueing(tmp_path, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(api, "is_ready", lambda: True)
+    monkeypatch.setattr(api, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(api, "submit_ingestion_job", lambda *args: submitted.append(args))
+
+    response = TestClient(api.app).post("/upload", files={"file": ("malware.exe", b"MZ")})
+
+    assert response.status_code == 400
+    assert submitted == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_saves_file_and_queues_job(tmp_path, monkeypatch):
+    class Job:
+        id = "job-1"
+        status = "queued"
+
+    submitted = []
+    monkeypatch.setattr(api, "is_ready", lambda: True)
+    monkeypatch.setattr(api, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(api, "submit_ingestion_job", lambda *args: submitted.append(args) or Job())
+
+    response = TestClient(api.app).post("/upload", files={"file": ("regulation.txt", b"text")})
+
+    assert response.status_code == 202
+    file_path, filename = submitted[0]
+    assert filename == "regulation.txt"
+    with open(file_path, "rb") as f:
+        assert f.read() == b"text"
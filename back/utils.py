@@ -1,7 +1,25 @@
+import hashlib
+import re
+from functools import lru_cache
 from typing import List
 
 from qdrant_client.http.models import ScoredPoint
 
+from config import LLM_TOKENIZER_NAME, TOKEN_COUNT_CACHE_SIZE
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    if not LLM_TOKENIZER_NAME:
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(LLM_TOKENIZER_NAME, use_fast=True)
+    except Exception as e:
+        print(f"Error loading tokenizer '{LLM_TOKENIZER_NAME}', falling back to estimation: {e}")
+        return None
+
 
 def estimate_tokens(text: str) -> int:
     if not text:
@@ -11,6 +29,31 @@ def estimate_tokens(text: str) -> int:
     return max(words, chars // 4)
 
 
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)['input_ids'])
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    tokenizer = get_tokenizer()
+    if tokenizer is None or not texts:
+        return [count_tokens(text) for text in texts]
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']]
+
+
+def normalize_chunk_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def chunk_content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_chunk_text(text).encode('utf-8')).hexdigest()
+
+
 def filter_duplicate_chunks(hits: List[ScoredPoint]) -> List[ScoredPoint]:
     seen_texts = set()
     unique_hits = []
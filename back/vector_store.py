@@ -1,39 +1,136 @@
 import asyncio
-from typing import List, Optional
+import time
+from typing import List, Optional, Dict, Any
 
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, ScoredPoint, Filter, FilterSelector
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.models import Distance, VectorParams, ScoredPoint, Filter, FilterSelector, PointStruct, \
+    FieldCondition, MatchValue, MatchAny, SearchRequest, SparseVectorParams, SparseIndexParams, SparseVector, \
+    NamedSparseVector, HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType, \
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams, CreateAliasOperation, \
+    CreateAlias
 
-from config import QDRANT_HOST, QDRANT_PORT, QDRANT_COLLECTION_NAME, VECTOR_SIZE
+from config import QDRANT_HOST, QDRANT_PORT, QDRANT_GRPC_PORT, QDRANT_PREFER_GRPC, QDRANT_TIMEOUT, \
+    QDRANT_COLLECTION_NAME, VECTOR_SIZE, QDRANT_UPSERT_BATCH_SIZE, QDRANT_UPSERT_PARALLEL, SPARSE_ENABLED, \
+    SPARSE_VECTOR_NAME, QDRANT_QUANTIZATION, QDRANT_QUANTIZATION_ALWAYS_RAM, QDRANT_SCALAR_QUANTILE, \
+    QDRANT_VECTORS_ON_DISK, QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_HNSW_EF, QDRANT_RESCORE, \
+    QDRANT_OVERSAMPLING, VECTOR_STORE_BACKEND, LOCAL_VECTOR_STORE_DIR, LOCAL_VECTOR_STORE_INITIAL_CAPACITY, \
+    LOCAL_VECTOR_STORE_COMPACT_RATIO
+from executors import io_executor
+from local_vector_store import LocalVectorIndex
 
-qdrant_client = None
+qdrant_client: Optional[AsyncQdrantClient] = None
+local_index: Optional[LocalVectorIndex] = None
+sparse_enabled = False
+
+
+def sparse_vectors_config():
+    return {SPARSE_VECTOR_NAME: SparseVectorParams(index=SparseIndexParams(on_disk=False))}
+
+
+def quantization_config(quantization: str = QDRANT_QUANTIZATION):
+    if quantization == 'scalar':
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8,
+            quantile=QDRANT_SCALAR_QUANTILE, always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM))
+    if quantization == 'binary':
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM))
+    if quantization != 'none':
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION '{quantization}', expected none, scalar or binary")
+    return None
+
+
+def collection_config(quantization: str = QDRANT_QUANTIZATION, hnsw_m: int = QDRANT_HNSW_M,
+        hnsw_ef_construct: int = QDRANT_HNSW_EF_CONSTRUCT, vector_size: int = VECTOR_SIZE,
+        sparse: bool = SPARSE_ENABLED) -> Dict[str, Any]:
+    return {"vectors_config": VectorParams(size=vector_size, distance=Distance.COSINE,
+                on_disk=QDRANT_VECTORS_ON_DISK),
+            "hnsw_config": HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct),
+            "quantization_config": quantization_config(quantization),
+            "optimizers_config": {"default_segment_number": 2, "max_optimization_threads": 2,
+                "memmap_threshold": 1000000, "indexing_threshold": 50000, "flush_interval_sec": 5,
+                "max_segment_size": 1000000, "deleted_threshold": 0.2, "vacuum_min_vector_number": 1000},
+            "sparse_vectors_config": sparse_vectors_config() if sparse else None,
+            "on_disk_payload": True}
+
+
+def search_params(hnsw_ef: int = QDRANT_HNSW_EF, quantization: str = QDRANT_QUANTIZATION) -> SearchParams:
+    if quantization == 'none':
+        return SearchParams(hnsw_ef=hnsw_ef)
+    return SearchParams(hnsw_ef=hnsw_ef,
+        quantization=QuantizationSearchParams(rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING))
+
+
+def new_physical_collection_name() -> str:
+    return f"{QDRANT_COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}"
+
+
+async def create_aliased_collection() -> str:
+    physical_name = new_physical_collection_name()
+    await qdrant_client.create_collection(collection_name=physical_name, **collection_config())
+    await qdrant_client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=physical_name,
+            alias_name=QDRANT_COLLECTION_NAME))])
+    return physical_name
+
+
+async def collection_has_sparse_vectors() -> bool:
+    # Qdrant cannot add a sparse vector to an existing collection, only a migration into a new one can.
+    collection = await qdrant_client.get_collection(collection_name=QDRANT_COLLECTION_NAME)
+    if SPARSE_VECTOR_NAME in (collection.config.params.sparse_vectors or {}):
+        return True
+    print(f"Collection '{QDRANT_COLLECTION_NAME}' was created without the sparse vector '{SPARSE_VECTOR_NAME}', "
+          f"so hybrid BM25 search is disabled and only dense search is used. Run 'python collection_migration.py' "
+          f"to re-create the collection with it, or set SPARSE_ENABLED=false to silence this message.")
+    return False
 
 
 async def initialize_vector_store():
-    global qdrant_client
+    global qdrant_client, local_index, sparse_enabled
+
+    if VECTOR_STORE_BACKEND == 'local':
+        try:
+            local_index = await io_executor.run(LocalVectorIndex, LOCAL_VECTOR_STORE_DIR, VECTOR_SIZE,
+                LOCAL_VECTOR_STORE_INITIAL_CAPACITY, LOCAL_VECTOR_STORE_COMPACT_RATIO)
+            sparse_enabled = SPARSE_ENABLED
+            return True
+        except Exception as e:
+            print(f"Error initializing local vector index: {e}")
+            return False
 
     try:
-        qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, timeout=30, prefer_grpc=False)
+        qdrant_client = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT,
+            prefer_grpc=QDRANT_PREFER_GRPC, timeout=QDRANT_TIMEOUT)
 
         try:
-            qdrant_client.get_collection(collection_name=QDRANT_COLLECTION_NAME)
+            await qdrant_client.get_collection(collection_name=QDRANT_COLLECTION_NAME)
         except Exception as e:
             if "not found" in str(e).lower() or "status_code=404" in str(e):
-                qdrant_client.create_collection(collection_name=QDRANT_COLLECTION_NAME,
-                    vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
-                    optimizers_config={"default_segment_number": 2, "max_optimization_threads": 2,
-                        "memmap_threshold": 1000000, "indexing_threshold": 50000, "flush_interval_sec": 5,
-                        "max_segment_size": 1000000, "deleted_threshold": 0.2, "vacuum_min_vector_number": 1000},
-                    on_disk_payload=True)
+                await create_aliased_collection()
 
+        sparse_enabled = SPARSE_ENABLED and await collection_has_sparse_vectors()
         return True
     except Exception as e:
         print(f"Error initializing Qdrant: {e}")
         return False
 
 
+async def close_vector_store():
+    global qdrant_client, local_index
+
+    if local_index is not None:
+        await io_executor.run(local_index.close)
+        local_index = None
+    if qdrant_client is not None:
+        try:
+            await qdrant_client.close()
+        except Exception as e:
+            print(f"Error closing Qdrant client: {e}")
+        qdrant_client = None
+
+
 async def search_vectors(query_vector: List[float], limit: int = 20, score_threshold: float = 0.5,
         filter_conditions: Optional[List] = None) -> List[ScoredPoint]:
+    if local_index is not None:
+        return (await search_vectors_batch([query_vector], limit, score_threshold, filter_conditions))[0]
     if qdrant_client is None:
         return []
 
@@ -42,8 +139,9 @@ async def search_vectors(query_vector: List[float], limit: int = 20, score_thres
         if filter_conditions:
             query_filter = Filter(should=filter_conditions)
 
-        search_results = await asyncio.to_thread(qdrant_client.search, collection_name=QDRANT_COLLECTION_NAME,
-            query_vector=query_vector, query_filter=query_filter, limit=limit, score_threshold=score_threshold)
+        search_results = await qdrant_client.search(collection_name=QDRANT_COLLECTION_NAME,
+            query_vector=query_vector, query_filter=query_filter, search_params=search_params(), limit=limit,
+            score_threshold=score_threshold)
 
         return search_results
     except Exception as e:
@@ -51,14 +149,67 @@ async def search_vectors(query_vector: List[float], limit: int = 20, score_thres
         return []
 
 
-async def delete_document_vectors(doc_id: str) -> bool:
+async def search_sparse_vectors(indices: List[int], values: List[float], limit: int = 20) -> List[ScoredPoint]:
+    if not sparse_enabled or not indices:
+        return []
+    if local_index is not None:
+        try:
+            return await io_executor.run(local_index.search_sparse, indices, values, limit)
+        except Exception as e:
+            print(f"Error searching sparse vectors: {e}")
+            return []
     if qdrant_client is None:
+        return []
+
+    try:
+        return await qdrant_client.search(collection_name=QDRANT_COLLECTION_NAME,
+            query_vector=NamedSparseVector(name=SPARSE_VECTOR_NAME,
+                vector=SparseVector(indices=indices, values=values)), limit=limit)
+    except Exception as e:
+        print(f"Error searching sparse vectors: {e}")
+        return []
+
+
+async def search_vectors_batch(query_vectors: List[List[float]], limit: int = 20, score_threshold: float = 0.5,
+        filter_conditions: Optional[List] = None) -> List[List[ScoredPoint]]:
+    if local_index is not None and query_vectors:
+        try:
+            return await io_executor.run(local_index.search, query_vectors, limit, score_threshold,
+                filter_conditions)
+        except Exception as e:
+            print(f"Error batch searching vectors: {e}")
+            return [[] for _ in query_vectors]
+    if qdrant_client is None or not query_vectors:
+        return [[] for _ in query_vectors]
+
+    try:
+        query_filter = Filter(should=filter_conditions) if filter_conditions else None
+        requests = [SearchRequest(vector=query_vector, filter=query_filter, params=search_params(), limit=limit,
+                                  score_threshold=score_threshold, with_payload=True)
+                    for query_vector in query_vectors]
+        return await qdrant_client.search_batch(collection_name=QDRANT_COLLECTION_NAME, requests=requests)
+    except Exception as e:
+        print(f"Error batch searching vectors: {e}")
+        return [[] for _ in query_vectors]
+
+
+async def delete_document_vectors(doc_id: str, content_hashes: Optional[List[str]] = None) -> bool:
+    if qdrant_client is None and local_index is None:
         return False
+    if content_hashes is not None and not content_hashes:
+        return True
 
     try:
-        delete_result = await asyncio.to_thread(qdrant_client.delete, collection_name=QDRANT_COLLECTION_NAME,
-            points_selector=FilterSelector(
-                filter=Filter(must=[{"key": "document_mongo_id", "match": {"value": str(doc_id)}}])), wait=True)
+        must = [FieldCondition(key="document_mongo_id", match=MatchValue(value=str(doc_id)))]
+        if content_hashes is not None:
+            must.append(FieldCondition(key="content_hash", match=MatchAny(any=list(content_hashes))))
+
+        if local_index is not None:
+            await io_executor.run(local_index.delete, must)
+            return True
+
+        delete_result = await qdrant_client.delete(collection_name=QDRANT_COLLECTION_NAME,
+            points_selector=FilterSelector(filter=Filter(must=must)), wait=True)
 
         return delete_result.status == "completed"
     except Exception as e:
@@ -66,13 +217,44 @@ async def delete_document_vectors(doc_id: str) -> bool:
         return False
 
 
-async def upsert_vectors(points: List[dict]) -> bool:
+def to_point_struct(point: dict) -> PointStruct:
+    sparse_vector = point.get("sparse_vector")
+    vector = point["vector"]
+    if sparse_enabled and sparse_vector:
+        indices, values = sparse_vector
+        vector = {"": vector, SPARSE_VECTOR_NAME: SparseVector(indices=indices, values=values)}
+    return PointStruct(id=point["id"], vector=vector, payload=point.get("payload"))
+
+
+async def upsert_vectors(points: List[dict], wait: bool = True) -> bool:
+    if local_index is not None:
+        try:
+            await io_executor.run(local_index.upsert, points if sparse_enabled else
+                [{**point, "sparse_vector": None} for point in points])
+            return True
+        except Exception as e:
+            print(f"Error upserting vectors: {e}")
+            return False
     if qdrant_client is None:
         return False
 
+    semaphore = asyncio.Semaphore(QDRANT_UPSERT_PARALLEL)
+
+    async def upsert_batch(batch: List[PointStruct]):
+        async with semaphore:
+            await qdrant_client.upsert(collection_name=QDRANT_COLLECTION_NAME, points=batch, wait=wait)
+
     try:
-        await asyncio.to_thread(qdrant_client.upsert, collection_name=QDRANT_COLLECTION_NAME, points=points, wait=True)
+        point_structs = [to_point_struct(point) for point in points]
+        await asyncio.gather(*(upsert_batch(point_structs[start:start + QDRANT_UPSERT_BATCH_SIZE])
+                               for start in range(0, len(point_structs), QDRANT_UPSERT_BATCH_SIZE)))
         return True
     except Exception as e:
         print(f"Error upserting vectors: {e}")
         return False
+
+
+def get_vector_store_stats() -> Dict[str, Any]:
+    if local_index is not None:
+        return {"backend": "local", **local_index.get_stats()}
+    return {"backend": "qdrant", "connected": qdrant_client is not None, "sparse_enabled": sparse_enabled}
@@ -7,13 +7,24 @@ from aiogram.enums import ParseMode
 
 from config import TELEGRAM_BOT_TOKEN, logger
 from handlers import router, set_commands
+from utils import start_fastapi_client, close_fastapi_client
 
 bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 
 
+async def on_startup():
+    await start_fastapi_client()
+
+
+async def on_shutdown():
+    await close_fastapi_client()
+
+
 async def main():
     dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     await set_commands(bot)
     logger.info("Команды бота установлены.")
     logger.info("Запуск бота...")
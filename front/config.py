@@ -28,6 +28,15 @@ if ADMIN_IDS_STR:
         raise ValueError("Некорректный формат TELEGRAM_ADMIN_IDS")
 
 FASTAPI_BASE_URL = os.getenv('FASTAPI_BASE_URL', 'http://localhost:8000')
+FASTAPI_MAX_CONNECTIONS = int(os.getenv('FASTAPI_MAX_CONNECTIONS', 100))
+FASTAPI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('FASTAPI_MAX_KEEPALIVE_CONNECTIONS', 20))
+FASTAPI_KEEPALIVE_EXPIRY = float(os.getenv('FASTAPI_KEEPALIVE_EXPIRY', 30))
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.5))
+TELEGRAM_MESSAGE_LIMIT = 4096
+UPLOAD_JOB_POLL_INTERVAL = float(os.getenv('UPLOAD_JOB_POLL_INTERVAL', 5))
+UPLOAD_JOB_MAX_WAIT = float(os.getenv('UPLOAD_JOB_MAX_WAIT', 3 * 3600))
+BUSY_MAX_RETRIES = int(os.getenv('BUSY_MAX_RETRIES', 3))
+BUSY_MAX_RETRY_DELAY = float(os.getenv('BUSY_MAX_RETRY_DELAY', 30))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__) 
\ No newline at end of file
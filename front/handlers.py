@@ -1,4 +1,5 @@
 import asyncio
+import json
 import os
 import uuid
 
@@ -9,13 +10,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, BotCommand, BotCommandScopeDefault, FSInputFile, ReplyKeyboardRemove
 from aiogram.utils.markdown import hbold, hcode
 
-from config import ADMIN_IDS, logger
+from config import ADMIN_IDS, UPLOAD_JOB_POLL_INTERVAL, UPLOAD_JOB_MAX_WAIT, BUSY_MAX_RETRIES, BUSY_MAX_RETRY_DELAY, \
+    logger
 from filters import IsAdmin
 from keyboards import confirm_delete_keyboard
 from states import UploadStates
+from streaming import StreamingAnswer
 from utils import get_fastapi_client
 
 router = Router()
+upload_tracking_tasks = set()
 
 
 async def set_commands(bot):
@@ -70,15 +74,15 @@ async def handle_clear_history(message: Message):
     logger.info(f"Пользователь {user_id} запросил очистку истории.")
     await message.bot.send_chat_action(message.chat.id, ChatAction.TYPING)
 
-    async with get_fastapi_client() as client:
-        try:
-            response = await client.delete(f"/history/{user_id}")
-            response.raise_for_status()
-            result = response.json()
-            await message.answer(result["message"])
-        except Exception as e:
-            logger.error(f"Ошибка очистки истории: {e}")
-            await message.answer("Произошла ошибка при очистке истории. Пожалуйста, попробуйте позже.")
+    client = get_fastapi_client()
+    try:
+        response = await client.delete(f"/history/{user_id}")
+        response.raise_for_status()
+        result = response.json()
+        await message.answer(result["message"])
+    except Exception as e:
+        logger.error(f"Ошибка очистки истории: {e}")
+        await message.answer("Произошла ошибка при очистке истории. Пожалуйста, попробуйте позже.")
 
 
 @router.message(Command("upload"), IsAdmin())
@@ -119,13 +123,20 @@ async def handle_document_upload(message: Message, state: FSMContext):
         os.makedirs("uploads_telegram", exist_ok=True)
         await message.bot.download_file(file_info.file_path, file_path)
 
+        client = get_fastapi_client()
+        with open(file_path, "rb") as f:
+            files = {"file": (original_filename, f, "application/octet-stream")}
+            response = await client.post("/upload", files=files, timeout=300)
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+
         await processing_msg.edit_text(
-            f"✅ Файл '{hbold(original_filename)}' принят и поставлен в очередь на обработку.\nОбработка может занять до 20 минут.")
+            f"✅ Файл '{hbold(original_filename)}' принят и поставлен в очередь на обработку.\n"
+            "Я сообщу, когда обработка завершится.")
 
-        async with get_fastapi_client() as client:
-            with open(file_path, "rb") as f:
-                files = {"file": (original_filename, f, "application/octet-stream")}
-                await client.post("/upload", files=files, timeout=2400)
+        task = asyncio.create_task(track_upload_job(processing_msg, original_filename, job_id))
+        upload_tracking_tasks.add(task)
+        task.add_done_callback(upload_tracking_tasks.discard)
     except Exception as e:
         logger.error(f"Ошибка загрузки файла: {e}")
         await processing_msg.edit_text("Произошла ошибка при загрузке файла. Пожалуйста, попробуйте позже.")
@@ -138,41 +149,86 @@ async def handle_document_upload(message: Message, state: FSMContext):
         await state.clear()
 
 
+def format_upload_progress(filename: str, job: dict) -> str:
+    progress = job["progress"]
+    status_text = {"queued": "в очереди", "running": "обрабатывается"}.get(job["status"], job["status"])
+    return (f"⏳ Файл '{hbold(filename)}' {status_text}.\n"
+            f"• Страниц обработано: {progress['pages_parsed']}\n"
+            f"• Эмбеддингов: {progress['chunks_embedded']}/{progress['chunks_total'] or '?'}\n"
+            f"• Записано в базу знаний: {progress['chunks_upserted']}/{progress['chunks_total'] or '?'}")
+
+
+async def track_upload_job(processing_msg: Message, filename: str, job_id: str):
+    last_text = None
+    deadline = asyncio.get_running_loop().time() + UPLOAD_JOB_MAX_WAIT
+
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(UPLOAD_JOB_POLL_INTERVAL)
+        try:
+            client = get_fastapi_client()
+            response = await client.get(f"/jobs/{job_id}")
+            response.raise_for_status()
+            job = response.json()
+        except Exception as e:
+            logger.error(f"Ошибка получения статуса задачи {job_id}: {e}")
+            continue
+
+        if job["status"] == "completed":
+            await processing_msg.edit_text(f"✅ Файл '{hbold(filename)}' добавлен в базу знаний.\n"
+                                           f"Фрагментов: {job['progress']['chunks_upserted']}")
+            return
+        if job["status"] == "failed":
+            await processing_msg.edit_text(
+                f"❌ Не удалось обработать файл '{hbold(filename)}': {job.get('error') or 'неизвестная ошибка'}")
+            return
+
+        text = format_upload_progress(filename, job)
+        if text != last_text:
+            try:
+                await processing_msg.edit_text(text)
+                last_text = text
+            except Exception as e:
+                logger.error(f"Ошибка обновления статуса загрузки {job_id}: {e}")
+
+    await processing_msg.edit_text(f"⚠️ Обработка файла '{hbold(filename)}' заняла слишком много времени. "
+                                   "Проверьте /list_docs позже.")
+
+
 @router.message(Command("list_docs"), IsAdmin())
 async def handle_list_docs(message: Message):
     user_id = message.from_user.id
     logger.info(f"Администратор {user_id} запросил список документов.")
     await message.bot.send_chat_action(message.chat.id, ChatAction.TYPING)
 
-    async with get_fastapi_client() as client:
-        try:
-            response = await client.get("/documents")
-            response.raise_for_status()
-            result = response.json()
-            documents = result["documents"]
-
-            if not documents:
-                await message.answer("База знаний пуста или не найдено активных документов.")
-                return
-
-            response_text = f"{hbold('Активные документы в базе знаний:')}\n\n"
-            for doc in documents:
-                response_text += (f"📄 {hbold(doc['filename'])}\n"
-                                  f"   - ID: {hcode(doc['_id'])}\n"
-                                  f"   - Загружен: {doc.get('upload_time_str', 'N/A')}\n"
-                                  f"   - Фрагментов: {doc.get('chunk_count', 'N/A')}\n\n")
-
-            if len(response_text) > 4000:
-                await message.answer("Найдено много документов. Отправляю список частями...")
-                for i in range(0, len(response_text), 4000):
-                    await message.answer(response_text[i:i + 4000])
-                    await asyncio.sleep(0.5)
-            else:
-                await message.answer(response_text)
+    client = get_fastapi_client()
+    try:
+        response = await client.get("/documents")
+        response.raise_for_status()
+        result = response.json()
+        documents = result["documents"]
+
+        if not documents:
+            await message.answer("База знаний пуста или не найдено активных документов.")
+            return
+
+        response_text = f"{hbold('Активные документы в базе знаний:')}\n\n"
+        for doc in documents:
+            response_text += (f"📄 {hbold(doc['filename'])}\n"
+                              f"   - ID: {hcode(doc['_id'])}\n"
+                              f"   - Загружен: {doc.get('upload_time_str', 'N/A')}\n"
+                              f"   - Фрагментов: {doc.get('chunk_count', 'N/A')}\n\n")
+
+        if len(response_text) > 4000:
+            await message.answer("Найдено много документов. Отправляю список частями...")
+            for i in range(0, len(response_text), 4000):
+                await message.answer(response_text[i:i + 4000])
+                await asyncio.sleep(0.5)
+        else:
+            await message.answer(response_text)
 
-        except Exception as e:
-            logger.error(f"Ошибка получения списка документов: {e}")
-            await message.answer("Произошла ошибка при получении списка документов. Пожалуйста, попробуйте позже.")
+    except Exception as e:
+        logger.error(f"Ошибка получения списка документов: {e}")
+        await message.answer("Произошла ошибка при получении списка документов. Пожалуйста, попробуйте позже.")
 
 
 @router.message(Command("delete_doc"), IsAdmin())
@@ -207,21 +263,21 @@ async def handle_confirm_delete(callback_query: types.CallbackQuery, state: FSMC
     await callback_query.message.edit_text(f"Удаление '{doc_id_or_filename}'...")
     await callback_query.bot.send_chat_action(callback_query.message.chat.id, ChatAction.TYPING)
 
-    async with get_fastapi_client() as client:
-        try:
-            response = await client.delete(f"/documents/{doc_id_or_filename}")
-            response.raise_for_status()
-            result = response.json()
+    client = get_fastapi_client()
+    try:
+        response = await client.delete(f"/documents/{doc_id_or_filename}")
+        response.raise_for_status()
+        result = response.json()
 
-            if result["success"]:
-                await callback_query.message.edit_text(f"✅ {result['message']}")
-            else:
-                await callback_query.message.edit_text(f"❌ {result['message']}")
+        if result["success"]:
+            await callback_query.message.edit_text(f"✅ {result['message']}")
+        else:
+            await callback_query.message.edit_text(f"❌ {result['message']}")
 
-        except Exception as e:
-            logger.error(f"Ошибка удаления документа: {e}")
-            await callback_query.message.edit_text(
-                f"❌ Произошла ошибка при удалении документа. Пожалуйста, попробуйте позже.")
+    except Exception as e:
+        logger.error(f"Ошибка удаления документа: {e}")
+        await callback_query.message.edit_text(
+            f"❌ Произошла ошибка при удалении документа. Пожалуйста, попробуйте позже.")
 
     await callback_query.answer()
 
@@ -241,6 +297,33 @@ async def handle_admin_command_unauthorized(message: Message):
     await message.answer("Извините, вы не авторизованы для использования этой команды.")
 
 
+class ServiceBusy(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Service busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+async def stream_answer(client, user_id: int, question: str, streaming_answer: StreamingAnswer):
+    answer, metrics = "", {}
+    async with client.stream("POST", "/ask/stream", json={"user_id": user_id, "question": question},
+            timeout=250.0) as response:
+        if response.status_code in (429, 503):
+            raise ServiceBusy(float(response.headers.get("Retry-After", 5)))
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["type"] == "delta":
+                await streaming_answer.append(event["text"])
+            elif event["type"] == "done":
+                answer = event["answer"]
+                metrics = event["metrics"]
+            elif event["type"] == "busy" and not streaming_answer.text:
+                raise ServiceBusy(float(event.get("retry_after", 5)))
+    return answer, metrics
+
+
 @router.message(F.text & ~F.text.startswith('/'))
 async def handle_text_message(message: Message):
     user_id = message.from_user.id
@@ -251,69 +334,73 @@ async def handle_text_message(message: Message):
     processing_msg = await message.reply("Обработка вашего вопроса, пожалуйста подождите...")
 
     try:
-        async with get_fastapi_client() as client:
-            response = await client.post("/ask", json={"user_id": user_id, "question": question}, timeout=250.0)
-            response.raise_for_status()
-            result = response.json()
-
-            answer = result["answer"]
-            metrics = result["metrics"]
-
-            logger.info(f"Получены метрики: {metrics}")
-
-            if len(answer) > 4000:
-                await processing_msg.edit_text("Ответ довольно длинный, отправляю его частями...")
-                for i in range(0, len(answer), 4000):
-                    await message.answer(answer[i:i + 4000])
-                    await asyncio.sleep(0.5)
-            else:
-                await processing_msg.edit_text(answer)
-
-            metrics_text = (f"📊 Метрики ответа:\n"
-                            f"• Источник: {metrics.get('prompt_source', 'N/A')}\n"
-                            f"• Категория: {metrics.get('classified_category', 'N/A')}\n"
-                            f"• Использовано фрагментов: {metrics.get('rag_metrics', {}).get('used_chunks', 'N/A')}\n"
-                            f"• Средний скор релевантности: {float(metrics.get('rag_metrics', {}).get('average_relevance_score', 0)):.3f}\n"
-                            f"• Время генерации: {float(metrics.get('rag_metrics', {}).get('generation_time', 0)):.1f}с\n"
-                            f"• Токены контекста: {metrics.get('rag_metrics', {}).get('context_tokens', 'N/A')}\n"
-                            f"• Токены ответа: {metrics.get('rag_metrics', {}).get('answer_tokens', 'N/A')}\n"
-                            f"• Фильтры Qdrant: {', '.join(metrics.get('rag_metrics', {}).get('qdrant_filters', ['Нет']))}")
-            await message.answer(metrics_text)
-
-            os.makedirs("temp_metrics", exist_ok=True)
-            metrics_file = f"temp_metrics/rag_metrics_{user_id}_{uuid.uuid4()}.txt"
+        client = get_fastapi_client()
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            streaming_answer = StreamingAnswer(message, processing_msg)
+            try:
+                answer, metrics = await stream_answer(client, user_id, question, streaming_answer)
+                break
+            except ServiceBusy as busy:
+                if attempt == BUSY_MAX_RETRIES:
+                    await processing_msg.edit_text("Сервис сейчас перегружен. Пожалуйста, повторите вопрос позже.")
+                    return
+                delay = min(busy.retry_after, BUSY_MAX_RETRY_DELAY)
+                logger.warning(f"Сервис перегружен, повтор запроса пользователя {user_id} через {delay:.0f}с")
+                await processing_msg.edit_text(
+                    f"Сервис сейчас загружен, повторяю запрос через {delay:.0f} с... "
+                    f"(попытка {attempt + 1} из {BUSY_MAX_RETRIES})")
+                await asyncio.sleep(delay)
+
+        await streaming_answer.finish(answer)
+        answer = answer or streaming_answer.text
+
+        logger.info(f"Получены метрики: {metrics}")
+
+        metrics_text = (f"📊 Метрики ответа:\n"
+                        f"• Источник: {metrics.get('prompt_source', 'N/A')}\n"
+                        f"• Категория: {metrics.get('classified_category', 'N/A')}\n"
+                        f"• Использовано фрагментов: {metrics.get('rag_metrics', {}).get('used_chunks', 'N/A')}\n"
+                        f"• Средний скор релевантности: {float(metrics.get('rag_metrics', {}).get('average_relevance_score', 0)):.3f}\n"
+                        f"• Время генерации: {float(metrics.get('rag_metrics', {}).get('generation_time', 0)):.1f}с\n"
+                        f"• Токены контекста: {metrics.get('rag_metrics', {}).get('context_tokens', 'N/A')}\n"
+                        f"• Токены ответа: {metrics.get('rag_metrics', {}).get('answer_tokens', 'N/A')}\n"
+                        f"• Фильтры Qdrant: {', '.join(metrics.get('rag_metrics', {}).get('qdrant_filters', ['Нет']))}")
+        await message.answer(metrics_text)
+
+        os.makedirs("temp_metrics", exist_ok=True)
+        metrics_file = f"temp_metrics/rag_metrics_{user_id}_{uuid.uuid4()}.txt"
+        try:
+            with open(metrics_file, "w", encoding="utf-8") as f:
+                f.write(f"=== RAG Metrics for User ID: {user_id} ===\n")
+                f.write(f"Question: {question}\n")
+                f.write(f"Answer: {answer}\n\n")
+                f.write("=== Metrics ===\n")
+                f.write(f"Prompt Source: {metrics.get('prompt_source', 'N/A')}\n")
+                f.write(f"Category: {metrics.get('classified_category', 'N/A')}\n")
+                f.write(f"Used Chunks: {metrics.get('rag_metrics', {}).get('used_chunks', 'N/A')}\n")
+                f.write(
+                    f"Average Relevance Score: {metrics.get('rag_metrics', {}).get('average_relevance_score', 0):.3f}\n")
+                f.write(f"Generation Time: {metrics.get('rag_metrics', {}).get('generation_time', 0):.1f}s\n")
+                f.write(f"Context Tokens: {metrics.get('rag_metrics', {}).get('context_tokens', 'N/A')}\n")
+                f.write(f"Answer Tokens: {metrics.get('rag_metrics', {}).get('answer_tokens', 'N/A')}\n")
+                f.write(
+                    f"Qdrant Filters: {', '.join(metrics.get('rag_metrics', {}).get('qdrant_filters', ['None']))}\n\n")
+                f.write("=== Context Chunks ===\n")
+                for i, chunk in enumerate(metrics.get('rag_metrics', {}).get('context_chunks', [])):
+                    f.write(f"\n--- Chunk {i + 1} ---\n")
+                    f.write(f"{chunk}\n")
+
+            await message.answer_document(document=FSInputFile(metrics_file),
+                caption="Подробные метрики и использованные фрагменты")
+        except Exception as e:
+            logger.error(f"Ошибка создания или отправки файла метрик: {e}")
+            await message.answer("Произошла ошибка при создании файла с метриками.")
+        finally:
             try:
-                with open(metrics_file, "w", encoding="utf-8") as f:
-                    f.write(f"=== RAG Metrics for User ID: {user_id} ===\n")
-                    f.write(f"Question: {question}\n")
-                    f.write(f"Answer: {answer}\n\n")
-                    f.write("=== Metrics ===\n")
-                    f.write(f"Prompt Source: {metrics.get('prompt_source', 'N/A')}\n")
-                    f.write(f"Category: {metrics.get('classified_category', 'N/A')}\n")
-                    f.write(f"Used Chunks: {metrics.get('rag_metrics', {}).get('used_chunks', 'N/A')}\n")
-                    f.write(
-                        f"Average Relevance Score: {metrics.get('rag_metrics', {}).get('average_relevance_score', 0):.3f}\n")
-                    f.write(f"Generation Time: {metrics.get('rag_metrics', {}).get('generation_time', 0):.1f}s\n")
-                    f.write(f"Context Tokens: {metrics.get('rag_metrics', {}).get('context_tokens', 'N/A')}\n")
-                    f.write(f"Answer Tokens: {metrics.get('rag_metrics', {}).get('answer_tokens', 'N/A')}\n")
-                    f.write(
-                        f"Qdrant Filters: {', '.join(metrics.get('rag_metrics', {}).get('qdrant_filters', ['None']))}\n\n")
-                    f.write("=== Context Chunks ===\n")
-                    for i, chunk in enumerate(metrics.get('rag_metrics', {}).get('context_chunks', [])):
-                        f.write(f"\n--- Chunk {i + 1} ---\n")
-                        f.write(f"{chunk}\n")
-
-                await message.answer_document(document=FSInputFile(metrics_file),
-                    caption="Подробные метрики и использованные фрагменты")
+                if os.path.exists(metrics_file):
+                    os.remove(metrics_file)
             except Exception as e:
-                logger.error(f"Ошибка создания или отправки файла метрик: {e}")
-                await message.answer("Произошла ошибка при создании файла с метриками.")
-            finally:
-                try:
-                    if os.path.exists(metrics_file):
-                        os.remove(metrics_file)
-                except Exception as e:
-                    logger.error(f"Ошибка удаления файла метрик: {e}")
+                logger.error(f"Ошибка удаления файла метрик: {e}")
 
     except Exception as e:
         logger.exception(f"Ошибка обработки сообщения для пользователя {user_id}: {e}")
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Optional
+
+from aiogram.types import Message
+
+from config import STREAM_EDIT_INTERVAL, TELEGRAM_MESSAGE_LIMIT, logger
+
+
+class StreamingAnswer:
+    def __init__(self, message: Message, placeholder: Message, interval: float = STREAM_EDIT_INTERVAL,
+            limit: int = TELEGRAM_MESSAGE_LIMIT):
+        self.message = message
+        self.current = placeholder
+        self.interval = interval
+        self.limit = limit
+        self.text = ""
+        self.offset = 0
+        self.shown: Optional[str] = None
+        self.last_edit = 0.0
+
+    async def edit(self, text: str):
+        try:
+            await self.current.edit_text(text, parse_mode=None)
+            self.shown = text
+        except Exception as e:
+            logger.warning(f"Ошибка обновления сообщения с ответом: {e}")
+        self.last_edit = asyncio.get_running_loop().time()
+
+    async def append(self, delta: str):
+        self.text += delta
+        await self.flush()
+
+    async def flush(self, force: bool = False):
+        while len(self.text) - self.offset > self.limit:
+            await self.edit(self.text[self.offset:self.offset + self.limit])
+            self.offset += self.limit
+            self.current = await self.message.answer(self.text[self.offset:self.offset + self.limit],
+                parse_mode=None)
+            self.shown = self.text[self.offset:self.offset + self.limit]
+            self.last_edit = asyncio.get_running_loop().time()
+
+        if not force and asyncio.get_running_loop().time() - self.last_edit < self.interval:
+            return
+        segment = self.text[self.offset:]
+        if segment.strip() and segment != self.shown:
+            await self.edit(segment)
+
+    async def finish(self, final_text: Optional[str] = None):
+        if final_text is not None and final_text != self.text and final_text.startswith(self.text[:self.offset]):
+            self.text = final_text
+        await self.flush(force=True)
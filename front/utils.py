@@ -1,5 +1,57 @@
+from typing import Optional, Dict, Any
+
 import httpx
-from config import FASTAPI_BASE_URL
+
+from config import FASTAPI_BASE_URL, FASTAPI_MAX_CONNECTIONS, FASTAPI_MAX_KEEPALIVE_CONNECTIONS, \
+    FASTAPI_KEEPALIVE_EXPIRY, logger
+
+fastapi_client: Optional[httpx.AsyncClient] = None
+connection_stats = {"requests": 0, "new_connections": 0}
+
+
+async def count_request(request: httpx.Request):
+    connection_stats["requests"] += 1
+    request.extensions["trace"] = trace_connections
+
+
+async def trace_connections(event_name: str, info: Dict[str, Any]):
+    if event_name == "connection.connect_tcp.complete":
+        connection_stats["new_connections"] += 1
+
+
+def create_fastapi_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=FASTAPI_MAX_CONNECTIONS,
+        max_keepalive_connections=FASTAPI_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=FASTAPI_KEEPALIVE_EXPIRY)
+    return httpx.AsyncClient(base_url=FASTAPI_BASE_URL, timeout=30.0, limits=limits,
+        event_hooks={"request": [count_request]})
+
+
+async def start_fastapi_client():
+    global fastapi_client
+
+    if fastapi_client is None:
+        fastapi_client = create_fastapi_client()
+
+
+async def close_fastapi_client():
+    global fastapi_client
+
+    if fastapi_client is not None:
+        logger.info(f"Статистика соединений с API: {get_connection_stats()}")
+        await fastapi_client.aclose()
+        fastapi_client = None
+
 
 def get_fastapi_client() -> httpx.AsyncClient:
-    return httpx.AsyncClient(base_url=FASTAPI_BASE_URL, timeout=30.0) 
\ No newline at end of file
+    global fastapi_client
+
+    if fastapi_client is None:
+        fastapi_client = create_fastapi_client()
+    return fastapi_client
+
+
+def get_connection_stats() -> Dict[str, Any]:
+    requests = connection_stats["requests"]
+    reused = max(requests - connection_stats["new_connections"], 0)
+    return {**connection_stats, "reused_connections": reused,
+            "reuse_ratio": round(reused / requests, 4) if requests else 0.0}